@@ -796,6 +796,19 @@ class InvoiceLog(models.Model):
     date = models.DateTimeField(auto_now_add=True)
 
 
+class InvoiceSequence(models.Model):
+    """
+    The last number of the invoice codes given for a prefix and a year (see
+    `conference.invoicing.next_invoice_code_for_year`).
+    """
+    prefix = models.CharField(max_length=10)
+    year = models.IntegerField()
+    last = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (('prefix', 'year'),)
+
+
 class InvoiceManager(models.Manager):
     pass
 
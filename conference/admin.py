@@ -187,9 +187,8 @@ class ConferenceAdmin(admin.ModelAdmin):
                 else:
                     if form.cleaned_data['send_email']:
                         from django.contrib import messages
-                        c = form.send_emails(uids, request.user.email)
-                        messages.add_message(request, messages.INFO, '{0} emails sent'.format(c))
-                        form.save_email()
+                        c = form.send_emails(uids, request.user.email, author=request.user)
+                        messages.add_message(request, messages.INFO, '{0} emails queued'.format(c))
                         form = AdminSendMailForm()
         else:
             form = AdminSendMailForm()
@@ -201,7 +200,6 @@ class ConferenceAdmin(admin.ModelAdmin):
                 'stat_code': '%s.%s' % (sid, rowid),
                 'form': form,
                 'preview': preview,
-                'email_log': settings.ADMIN_TICKETS_STATS_EMAIL_LOG,
             },
             context_instance=template.RequestContext(request))
 
@@ -1128,8 +1126,6 @@ class TicketAdmin(admin.ModelAdmin):
         return my_urls + urls
 
     def stats_data(self):
-        from django.db.models import Q
-        from collections import defaultdict
         import datetime
 
         conferences = models.Conference.objects\
@@ -1137,24 +1133,7 @@ class TicketAdmin(admin.ModelAdmin):
 
         output = {}
         for c in conferences:
-            tickets = models.Ticket.objects\
-                .filter(fare__conference=c, frozen=False)\
-                .filter(Q(orderitem__order___complete=True) | Q(orderitem__order__method__in=('bank', 'admin')))\
-                .select_related('fare', 'orderitem__order')
-            data = {
-                'conference': defaultdict(lambda: 0),
-                'partner': defaultdict(lambda: 0),
-                'event': defaultdict(lambda: 0),
-                'other': defaultdict(lambda: 0),
-            }
-            for t in tickets:
-                tt = t.fare.ticket_type
-                date = t.orderitem.order.created.date()
-                offset = date - c.conference_start
-                data[tt][offset.days] += 1
-
-            for k, v in data.items():
-                data[k] = sorted(v.items())
+            data = models.TicketSales.objects.curve(c, sales=dataaccess.ticket_sales(c.code))
 
             dlimit = datetime.date(c.conference_start.year, 1, 1)
             deadlines = models.DeadlineContent.objects\
@@ -1270,3 +1249,28 @@ class CaptchaQuestionAdmin(admin.ModelAdmin):
 
 
 admin.site.register(models.CaptchaQuestion)
+
+
+class AdminMailingAdmin(admin.ModelAdmin):
+    actions = ('do_requeue',)
+    list_display = ('created', 'subject', 'sender', 'author', 'status', '_progress')
+    list_filter = ('status', 'conference')
+    readonly_fields = ('author', 'status', 'claimed', 'total', 'sent', 'error')
+    ordering = ('-created',)
+
+    def _progress(self, o):
+        return '%d / %d' % (o.sent, o.total)
+    _progress.short_description = 'Sent'
+
+    def do_requeue(self, request, queryset):
+        # only the recipients not yet reached are sent again; the mailings
+        # being sent are left to their worker (or reclaimed if it is dead)
+        count = queryset\
+            .filter(status__in=(models.ADMIN_MAILING_STATUS.sent, models.ADMIN_MAILING_STATUS.failed))\
+            .filter(recipients__sent=False)\
+            .update(status=models.ADMIN_MAILING_STATUS.queued)
+        self.message_user(request, "%d mailings queued" % count)
+    do_requeue.short_description = "Send again to the users not yet reached"
+
+
+admin.site.register(models.AdminMailing, AdminMailingAdmin)
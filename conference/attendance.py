@@ -0,0 +1,121 @@
+# -*- coding: UTF-8 -*-
+"""
+Sparse user x event matrix of the interests expressed by the attendees, used
+to compute the "presence score" of the events.
+"""
+from collections import defaultdict
+
+from conference.intervals import EventIndex
+
+
+class AttendanceMatrix(object):
+    """
+    Every row of the matrix is the set of events a user is interested in; the
+    score of a user is independent from the other users, so the users with
+    the same row are scored only once and a change to a single row updates
+    the scores without a full recomputation.
+
+    The events passed to the constructor are the columns of the matrix, their
+    order is the order in which the events are processed (as the iteration
+    order of the dict passed to `ScheduleManager.score_events`).
+    """
+    def __init__(self, events):
+        events = list(events)
+        index = EventIndex(events)
+        self.rank = dict((e.id, ix) for ix, e in enumerate(events))
+        self.groups = dict(
+            (e.id, frozenset(x.id for x in index.overlapping(e)))
+            for e in events)
+        # user id -> row (tuple of event ids sorted by rank)
+        self.rows = {}
+        # row -> number of users
+        self.patterns = defaultdict(int)
+        # event id -> {fraction denominator -> count}
+        self.weights = defaultdict(lambda: defaultdict(int))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['patterns'] = dict(self.patterns)
+        state['weights'] = dict((k, dict(v)) for k, v in self.weights.items())
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.patterns = defaultdict(int, self.patterns)
+        weights = defaultdict(lambda: defaultdict(int))
+        for k, v in self.weights.items():
+            weights[k].update(v)
+        self.weights = weights
+
+    def presence(self, row):
+        """
+        Returns the presence of a user interested in the events of `row` as a
+        list of (event id, n) pairs, the user presence for the event is 1/n.
+        """
+        # If a user has marked more events in the same time band, obviously
+        # they can not participate in all of them; each event is processed in
+        # order together with the events of its group not yet processed and
+        # the presence is split among them.
+        output = []
+        remaining = list(row)
+        while remaining:
+            eid = remaining.pop(0)
+            group = self.groups[eid]
+            found = [ eid ]
+            others = []
+            for x in remaining:
+                if x in group:
+                    found.append(x)
+                else:
+                    others.append(x)
+            remaining = others
+            n = len(found)
+            output.extend((x, n) for x in found)
+        return output
+
+    def _apply(self, row, count):
+        for eid, n in self.presence(row):
+            w = self.weights[eid]
+            w[n] += count
+            if not w[n]:
+                del w[n]
+                if not w:
+                    del self.weights[eid]
+
+    def set_row(self, uid, events):
+        """
+        Replaces the events (ids) the user `uid` is interested in; the events
+        not known by the matrix are ignored.
+        """
+        self.set_rows({uid: events})
+
+    def set_rows(self, rows):
+        """
+        Bulk version of `set_row`; `rows` is a dict user id -> event ids.
+        """
+        changed = defaultdict(int)
+        for uid, events in rows.items():
+            old = self.rows.pop(uid, None)
+            if old:
+                changed[old] -= 1
+            row = tuple(sorted(
+                (x for x in set(events) if x in self.rank),
+                key=self.rank.get))
+            if row:
+                self.rows[uid] = row
+                changed[row] += 1
+        for row, count in changed.items():
+            if count:
+                self.patterns[row] += count
+                if not self.patterns[row]:
+                    del self.patterns[row]
+                self._apply(row, count)
+
+    def scores(self):
+        """
+        Returns the presence score of the events, a dict event id -> score.
+        """
+        scores = defaultdict(lambda: 0.0)
+        for eid, w in self.weights.items():
+            scores[eid] = sum(float(c) / n for n, c in sorted(w.items()))
+        return scores
@@ -1,9 +1,18 @@
 # -*- coding: UTF-8 -*-
 from django.core.cache import cache
+from django.db import connection
 from django.db.models.signals import pre_delete, post_save
 from django.dispatch import Signal
+from collections import OrderedDict, deque
+from inspect import getargspec
+import bisect
+import cPickle as pickle
 import functools
 import hashlib
+import re
+import threading
+import time
+import weakref
 
 try:
     from inspect import getcallargs
@@ -103,20 +112,212 @@ except ImportError:
 
 WEEK = 7 * 24 * 60 * 60
 
+_KEY_FIELD = re.compile(r'%\((\w+)\)s')
+
 cache_invalidated = Signal(providing_args=['keys'])
 
+# the CacheFunction instances, for the debug panel
+_instances = weakref.WeakSet()
+
+_stats_scope = threading.local()
+
+def open_stats_scope():
+    """
+    Starts to sum, for the current thread, the hits, the misses and the cost
+    of the misses of all the cached functions (see
+    `conference.middleware.CacheStats`).
+    """
+    _stats_scope.totals = {'hits': 0, 'misses': 0, 'queries': 0, 'time': 0.0}
+
+def close_stats_scope():
+    """
+    Closes the scope opened by `open_stats_scope` and returns the totals, or
+    None if there isn't an open scope.
+    """
+    totals = getattr(_stats_scope, 'totals', None)
+    _stats_scope.totals = None
+    return totals
+
+def count_queries(compute):
+    """
+    Calls `compute()` and returns its result plus the number of queries
+    executed on the default connection.
+
+    The queries are logged in a private log, nested calls are supported and
+    the queries are forwarded to the previous log if it was active (so
+    `assertNumQueries` keeps working).
+    """
+    logged = connection.queries_logged
+    saved = connection.queries_log, connection.force_debug_cursor
+    log = connection.queries_log = deque(maxlen=connection.queries_limit)
+    connection.force_debug_cursor = True
+    try:
+        data = compute()
+    finally:
+        connection.queries_log, connection.force_debug_cursor = saved
+        if logged:
+            connection.queries_log.extend(log)
+    return data, len(log)
+
+class FunctionStats(object):
+    """
+    Per-process statistics of a cached function: hits, misses, the
+    histogram of the time spent to compute the missing values and the number
+    of queries executed by them.
+    """
+    # upper bounds (in seconds) of the buckets of the latency histogram, the
+    # last bucket counts the slower misses
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+            self.time = 0.0
+            self.queries = 0
+            self.max_queries = 0
+            self.histogram = [ 0 ] * (len(self.BUCKETS) + 1)
+
+    def hit(self, count=1):
+        with self.lock:
+            self.hits += count
+        totals = getattr(_stats_scope, 'totals', None)
+        if totals:
+            totals['hits'] += count
+
+    def miss(self, elapsed, queries, nested=False):
+        with self.lock:
+            self.misses += 1
+            self.time += elapsed
+            self.queries += queries
+            self.max_queries = max(self.max_queries, queries)
+            self.histogram[bisect.bisect_left(self.BUCKETS, elapsed)] += 1
+        totals = getattr(_stats_scope, 'totals', None)
+        if totals:
+            totals['misses'] += 1
+            # the cost of a nested miss is already in the outer one
+            if not nested:
+                totals['time'] += elapsed
+                totals['queries'] += queries
+
+    def as_dict(self):
+        with self.lock:
+            calls = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': float(self.hits) / calls if calls else None,
+                'time': self.time,
+                'avg_time': self.time / self.misses if self.misses else None,
+                'queries': self.queries,
+                'avg_queries': float(self.queries) / self.misses if self.misses else None,
+                'max_queries': self.max_queries,
+                'histogram': zip(self.BUCKETS + (None,), self.histogram),
+            }
+
+class LocalCache(object):
+    """
+    Bounded per-process LRU cache, every entry expires after `timeout`
+    seconds.
+
+    The values are stored pickled, in this way the callers can modify the
+    returned objects as they do with the data that comes from the django
+    cache.
+    """
+    def __init__(self, size=1000, timeout=60):
+        self.size = size
+        self.timeout = timeout
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                expire, value = self.data.pop(key)
+            except KeyError:
+                return default
+            if expire < time.time():
+                return default
+            # re-insert the key to mark it as the most recently used
+            self.data[key] = (expire, value)
+        return pickle.loads(value)
+
+    def set(self, key, value):
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = (time.time() + self.timeout, value)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for k in keys:
+                self.data.pop(k, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
 class CacheFunction(object):
+    """
+    Decorator factory to cache the result of a function in the django cache.
+
+    If `local` is passed (a dict with the keyword arguments for `LocalCache`
+    plus an optional `sync`) the results are also stored in a per-process
+    `LocalCache` consulted before the django cache. Every invalidation (or
+    `set_in_cache`) of a function bumps the generation counter of the
+    function (of its namespace if it has one) in the django cache; every
+    process checks the counters at most once each `sync` seconds and
+    ignores the local copies stored with an older generation.
+
+    A decorated function with a `namespace` is not invalidated key by key;
+    its keys embed a per-namespace generation and any invalidation signal
+    simply increments it.
+
+    A decorated function with `single_flight` is recomputed by only one
+    process at time after a miss; in the meantime the other processes serve
+    the previous (stale) value or, if there isn't one, wait up to `LOCK_WAIT`
+    seconds for the new value.
+
+    If `stats` is True every decorated function records its hits and the
+    latency and the queries of its misses in a `FunctionStats` (see
+    `function_stats`); the counters are per process.
+    """
     CACHE_MISS = object()
 
-    def __init__(self, prefix='', timeout=WEEK, fhash=None, fkey=None):
+    # max number of seconds a process can hold the lock to recompute a value
+    LOCK_TIMEOUT = 30
+    # max number of seconds a process waits for a value recomputed by another
+    # one
+    LOCK_WAIT = 2
+
+    def __init__(self, prefix='', timeout=WEEK, fhash=None, fkey=None, local=None, stats=False):
         self.prefix = prefix
         self.timeout = timeout
+        if local:
+            local = dict(local)
+            self.local_sync = local.pop('sync', 1)
+            self.local = LocalCache(**local)
+        else:
+            self.local = None
+        # generation of the local copies of every group of keys (a function
+        # or a namespace)
+        self.generations = {}
+        self.generation_checked = 0
         if fhash is None:
             fhash = self.hash_key
         self.fhash = fhash
         if fkey is None:
             fkey = self.generate_key
         self.fkey = fkey
+        self.stats = stats
+        self.functions = OrderedDict()
+        _instances.add(self)
 
     def __call__(self, *args, **kwargs):
         if args:
@@ -126,24 +327,73 @@ class CacheFunction(object):
         else:
             return functools.partial(self._decorator, **kwargs)
 
-    def _decorator(self, func, invalidate=None, key=None, signals=(), models=(), timeout=None):
+    def _decorator(self, func, invalidate=None, key=None, signals=(), models=(), timeout=None, namespace=None, single_flight=False):
         if key is None:
             key = func.__name__
             if invalidate is None:
                 invalidate = (func.__name__,)
         if timeout is None:
             timeout = self.timeout
+        # the keys invalidated together in the local caches
+        group = namespace or func.__name__
+        self.generations.setdefault(group, None)
+
+        build_key = None
+        if self.fkey == self.generate_key:
+            build_key = self.compile_key(key, func)
+        if build_key is None:
+            build_key = lambda args, kwargs: self.fkey(key, func, args, kwargs)
+
+        def make_key(args, kwargs, generation=None, stale=False):
+            k = build_key(args, kwargs)
+            if stale:
+                # the stale copy survives the invalidations
+                k += ':stale'
+            elif namespace:
+                if generation is None:
+                    generation = self.namespace_generation(namespace)
+                k = '%s@%s' % (k, generation)
+            return self.fhash(k)
+
+        if self.stats:
+            stats = FunctionStats()
+            def compute(*args, **kwargs):
+                nested = getattr(_stats_scope, 'computing', False)
+                _stats_scope.computing = True
+                start = time.time()
+                try:
+                    data, queries = count_queries(lambda: func(*args, **kwargs))
+                finally:
+                    _stats_scope.computing = nested
+                stats.miss(time.time() - start, queries, nested)
+                return data
+        else:
+            stats = None
+            compute = func
 
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            k = self.fhash(self.fkey(key, func, args, kwargs))
-            data = cache.get(k, self.CACHE_MISS)
+            k = make_key(args, kwargs)
+            data = self.get(k, group)
             if data is self.CACHE_MISS:
-                data = func(*args, **kwargs)
-                cache.set(k, data, timeout)
+                if single_flight:
+                    data = self.recompute(
+                        func.__name__, k, make_key(args, kwargs, stale=True),
+                        lambda: compute(*args, **kwargs), timeout, group)
+                else:
+                    data = compute(*args, **kwargs)
+                    self.set(k, data, timeout, group)
+            elif stats:
+                stats.hit()
             return data
 
-        if invalidate:
+        if namespace:
+            # every key of the function embeds the namespace generation, to
+            # invalidate all of them is enough to bump the generation.
+            def iwrapper(sender, **kwargs):
+                self.invalidate_namespace(namespace)
+                wrapper.invalidated.send(wrapper, cache_keys=())
+        elif invalidate:
             def iwrapper(sender, **kwargs):
                 try:
                     keys = kwargs['cache_keys']
@@ -156,9 +406,12 @@ class CacheFunction(object):
                     if isinstance(keys, basestring):
                         keys = (keys,)
                     prefixed = [ self.prefix + k for k in keys ]
-                    cache.delete_many(map(self.fhash, prefixed))
+                    self.delete_many(map(self.fhash, prefixed), group)
                     wrapper.invalidated.send(wrapper, cache_keys=keys)
+        else:
+            iwrapper = None
 
+        if iwrapper:
             for s in signals:
                 s.connect(iwrapper, weak=False)
 
@@ -168,6 +421,7 @@ class CacheFunction(object):
 
         def get_from_cache(fargs):
             cache_keys = {}
+            generation = self.namespace_generation(namespace) if namespace else None
             for ix, farg in enumerate(fargs):
                 if isinstance(farg, (list, tuple))\
                     and len(farg) == 2\
@@ -180,10 +434,13 @@ class CacheFunction(object):
                 else:
                     args = farg
                     kwargs = {}
-                k = self.fhash(self.fkey(key, func, args, kwargs))
+                k = make_key(args, kwargs, generation)
                 cache_keys[k] = (ix, farg)
 
-            results = cache.get_many(cache_keys.keys())
+            results = self.get_many(cache_keys.keys(), group)
+            if stats and results:
+                # the misses are counted when the caller computes them
+                stats.hit(len(results))
             output = [ self.CACHE_MISS ] * len(fargs)
             for k, v in cache_keys.items():
                 ix = v[0]
@@ -192,15 +449,264 @@ class CacheFunction(object):
                 except KeyError:
                     pass
             return output
+        def set_in_cache(args, data, kwargs=None):
+            # replaces the cached value of the call `func(*args, **kwargs)`;
+            # the other processes drop their local copies of the function
+            k = make_key(args, kwargs or {})
+            if self.local is not None:
+                self.bump_generation(group)
+            self.set(k, data, timeout, group)
         wrapper.get_from_cache = get_from_cache
+        wrapper.set_in_cache = set_in_cache
+        wrapper.single_flight_stats = lambda: self.single_flight_stats(func.__name__)
         wrapper.invalidated = Signal(providing_args=['cache_keys'])
+        wrapper.stats = stats
+        self.functions[func.__name__] = wrapper
         return wrapper
 
+    def function_stats(self):
+        """
+        Returns a list of (function name, stats dict) for the decorated
+        functions, sorted by the time spent in the misses.
+        """
+        output = [
+            (name, f.stats.as_dict())
+            for name, f in self.functions.items()
+            if f.stats is not None
+        ]
+        output.sort(key=lambda x: x[1]['time'], reverse=True)
+        return output
+
+    def reset_stats(self):
+        for f in self.functions.values():
+            if f.stats is not None:
+                f.stats.reset()
+
+    def generation_key(self, group):
+        return self.fhash(self.prefix + 'generation:' + group)
+
+    def sync_local(self):
+        """
+        Reads, at most once each `sync` seconds, the generations of the
+        groups bumped by the other processes.
+        """
+        now = time.time()
+        if now - self.generation_checked < self.local_sync:
+            return
+        self.generation_checked = now
+        keys = dict((self.generation_key(g), g) for g in self.generations)
+        values = cache.get_many(keys.keys())
+        for k, group in keys.items():
+            self.generations[group] = values.get(k)
+
+    def local_get(self, key, group):
+        data = self.local.get(key, self.CACHE_MISS)
+        if data is not self.CACHE_MISS:
+            generation, data = data
+            if generation != self.generations.get(group):
+                # stored before an invalidation of the group
+                return self.CACHE_MISS
+        return data
+
+    def local_set(self, key, value, group):
+        self.local.set(key, (self.generations.get(group), value))
+
+    def get(self, key, group):
+        if self.local is None:
+            return cache.get(key, self.CACHE_MISS)
+        self.sync_local()
+        data = self.local_get(key, group)
+        if data is self.CACHE_MISS:
+            data = cache.get(key, self.CACHE_MISS)
+            if data is not self.CACHE_MISS:
+                self.local_set(key, data, group)
+        return data
+
+    def get_many(self, keys, group):
+        if self.local is None:
+            return cache.get_many(keys)
+        self.sync_local()
+        results = {}
+        missing = []
+        for k in keys:
+            data = self.local_get(k, group)
+            if data is self.CACHE_MISS:
+                missing.append(k)
+            else:
+                results[k] = data
+        if missing:
+            found = cache.get_many(missing)
+            for k, data in found.items():
+                self.local_set(k, data, group)
+            results.update(found)
+        return results
+
+    def set(self, key, value, timeout, group):
+        cache.set(key, value, timeout)
+        if self.local is not None:
+            self.local_set(key, value, group)
+
+    def delete_many(self, keys, group):
+        cache.delete_many(keys)
+        if self.local is not None:
+            self.local.delete_many(keys)
+            self.bump_generation(group)
+
+    def recompute(self, name, key, stale_key, compute, timeout, group):
+        """
+        Computes the missing value of `key` under a short lock; the processes
+        that do not get the lock serve the value in `stale_key` or wait for
+        the one computed by the lock owner.
+        """
+        lock = key + ':lock'
+        if cache.add(lock, 1, self.LOCK_TIMEOUT):
+            try:
+                data = compute()
+                self.set(key, data, timeout, group)
+                cache.set(stale_key, data, timeout * 2 if timeout else timeout)
+            finally:
+                cache.delete(lock)
+            return data
+
+        data = cache.get(stale_key, self.CACHE_MISS)
+        if data is not self.CACHE_MISS:
+            self.incr_stat(name, 'stale')
+            return data
+
+        deadline = time.time() + self.LOCK_WAIT
+        while time.time() < deadline:
+            time.sleep(0.05)
+            data = cache.get(key, self.CACHE_MISS)
+            if data is not self.CACHE_MISS:
+                self.incr_stat(name, 'waited')
+                return data
+
+        # the lock owner is too slow (or dead), better to do the work twice
+        # than to fail the request
+        self.incr_stat(name, 'timeout')
+        data = compute()
+        self.set(key, data, timeout, group)
+        return data
+
+    def stat_key(self, name, stat):
+        return self.fhash(self.prefix + 'single_flight:%s:%s' % (name, stat))
+
+    def incr_stat(self, name, stat):
+        k = self.stat_key(name, stat)
+        try:
+            cache.incr(k)
+        except ValueError:
+            if not cache.add(k, 1, None):
+                cache.incr(k)
+
+    def single_flight_stats(self, name):
+        """
+        Returns how many times, since the counters are in the cache, the
+        processes have served a stale value (`stale`), have waited for the
+        value of another process (`waited`) or have given up waiting
+        (`timeout`).
+        """
+        stats = ('stale', 'waited', 'timeout')
+        keys = dict((self.stat_key(name, x), x) for x in stats)
+        values = cache.get_many(keys.keys())
+        output = dict.fromkeys(stats, 0)
+        for k, v in values.items():
+            output[keys[k]] = v
+        return output
+
+    def bump_generation(self, group):
+        """
+        Invalidates the local copies of the keys of the group in all the
+        processes.
+        """
+        k = self.generation_key(group)
+        try:
+            generation = cache.incr(k)
+        except ValueError:
+            # time based, like the namespace generations, to not reuse the
+            # value of an evicted counter
+            generation = int(time.time() * 1000)
+            if not cache.add(k, generation, None):
+                generation = cache.incr(k)
+        self.generations[group] = generation
+
+    def namespace_key(self, namespace):
+        return self.fhash(self.prefix + 'namespace:' + namespace)
+
+    def namespace_generation(self, namespace):
+        """
+        Returns the current generation of the namespace; the generation is
+        part of the keys of the functions decorated with `namespace`.
+        """
+        k = self.namespace_key(namespace)
+        generation = self.get(k, namespace)
+        if generation is self.CACHE_MISS:
+            # the first generation is time based, in this way if the counter
+            # is evicted from the cache the new one will not reuse old keys.
+            generation = int(time.time() * 1000)
+            if not cache.add(k, generation, None):
+                generation = cache.get(k, generation)
+            if self.local is not None:
+                self.local_set(k, generation, namespace)
+        return generation
+
+    def invalidate_namespace(self, namespace):
+        """
+        Invalidates in O(1) all the keys of the namespace.
+        """
+        k = self.namespace_key(namespace)
+        try:
+            cache.incr(k)
+        except ValueError:
+            # the next call of namespace_generation creates a new generation
+            pass
+        if self.local is not None:
+            self.local.delete_many([k])
+            self.bump_generation(namespace)
+
     def hash_key(self, key):
         if isinstance(key, unicode):
             key = key.encode('utf-8')
         return hashlib.md5(key).hexdigest()
 
+    def compile_key(self, key, func):
+        """
+        Analyses `key` and the signature of `func` once and returns a function
+        equivalent to `generate_key` that avoids `getcallargs` for positional
+        calls; calls with keyword arguments fallback to `generate_key`.
+
+        Returns None if the key cannot be compiled (callable keys, positional
+        placeholders, functions with *args or **kwargs...).
+        """
+        if callable(key):
+            return None
+        try:
+            args, varargs, varkw, defaults = getargspec(func)
+        except TypeError:
+            return None
+        if varargs or varkw or not all(isinstance(a, str) for a in args):
+            return None
+        if '%' in _KEY_FIELD.sub('', key).replace('%%', ''):
+            return None
+        names = _KEY_FIELD.findall(key)
+        if not set(names).issubset(args):
+            return None
+
+        template = self.prefix.replace('%', '%%') + _KEY_FIELD.sub('%s', key)
+        indexes = [ args.index(n) for n in names ]
+        defaults = defaults or ()
+        nargs = len(args)
+        required = nargs - len(defaults)
+
+        def build_key(fargs, kwargs):
+            n = len(fargs)
+            if kwargs or n < required or n > nargs:
+                return self.generate_key(key, func, fargs, kwargs)
+            if n < nargs:
+                fargs = tuple(fargs) + defaults[n - required:]
+            return template % tuple([ fargs[ix] for ix in indexes ])
+        return build_key
+
     def generate_key(self, key, func, args, kwargs):
         if callable(key):
             return key(func, *args, **kwargs)
@@ -1,20 +1,29 @@
 # -*- coding: UTF-8 -*-
 
 from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+import cPickle as pickle
+import threading
+import time
 
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.db.models import Count
+from django.db.models.signals import pre_save
 
 import django_comments as comments
 
+from assopy import models as amodels
 from conference import cachef
 from conference import models
+from conference import settings as csettings
+from conference import signals
 
 
-cache_me = cachef.CacheFunction(prefix='conf:')
+cache_me = cachef.CacheFunction(
+    prefix='conf:', local=csettings.CACHE_LOCAL, stats=csettings.CACHE_STATS)
 
 def _dump_fields(o):
     from django.db.models.fields.files import FieldFile
@@ -34,11 +43,132 @@ def _dump_fields(o):
     return output
 
 
-def _i_deadlines(sender, **kw):
-    years = set(x.year for x in models.Deadline.objects.all().values_list('date', flat=True))
-    years.add(None)
-    languages = set([ l[0] for l in settings.LANGUAGES ])
-    return [ 'deadlines:%s:%s' % (l, y) for l in languages for y in years ]
+_scope = threading.local()
+
+def open_batch_scope():
+    """
+    Starts a new batch scope in the current thread; every `DataLoader`
+    remembers the loaded items and fetches the primed ids together with the
+    first requested one until `close_batch_scope` is called.
+    """
+    previous = getattr(_scope, 'loaders', None)
+    _scope.loaders = {}
+    return previous
+
+def close_batch_scope(previous=None):
+    _scope.loaders = previous
+
+@contextmanager
+def batch_scope():
+    previous = open_batch_scope()
+    try:
+        yield
+    finally:
+        close_batch_scope(previous)
+
+class DataLoader(object):
+    """
+    Batch loader for a cached `*_data(id, preload=None)` function.
+
+    `load_many` reads all the ids with a single `get_many`; the missing
+    ones are computed passing to the function the data returned by
+    `fetch(missing_ids)`, a dict id -> preload, which should use a fixed
+    number of queries.
+
+    Inside a `batch_scope` (every request, see
+    `conference.middleware.BatchScope`) the loaded items are remembered
+    and the ids passed to `prime` are fetched with the next load, in this
+    way a template calling `talk_data` for every talk costs a single
+    `get_many` and a single set of queries. Every load returns a new copy of
+    the items and the remembered ones are forgotten when the function is
+    invalidated (e.g. a talk saved by the same request).
+    """
+    def __init__(self, func, fetch):
+        self.func = func
+        self.fetch = fetch
+        self.linked = []
+        func.invalidated.connect(self.forget, weak=False)
+
+    def link(self, loader):
+        """
+        Links another loader that uses the same ids (e.g. a loader for a
+        function that extends `self.func`); the primed ids are forwarded to it.
+        """
+        self.linked.append(loader)
+
+    def state(self):
+        loaders = getattr(_scope, 'loaders', None)
+        if loaders is None:
+            return None
+        try:
+            return loaders[self]
+        except KeyError:
+            state = loaders[self] = {'loaded': {}, 'pending': set()}
+            return state
+
+    def forget(self, sender, **kwargs):
+        """
+        Forgets the items loaded in the current scope.
+        """
+        state = self.state()
+        if state is not None:
+            state['loaded'].clear()
+
+    def prime(self, ids):
+        """
+        Schedules the fetch of `ids` with the next load in the current scope.
+        """
+        state = self.state()
+        if state is not None:
+            ids = list(ids)
+            state['pending'].update(x for x in ids if x not in state['loaded'])
+            for loader in self.linked:
+                loader.prime(ids)
+
+    def load(self, oid):
+        state = self.state()
+        if state is None:
+            return self.func(oid)
+        return self.load_many([oid])[0]
+
+    def load_many(self, ids):
+        ids = list(ids)
+        state = self.state()
+        if state is None:
+            loaded = self._load(ids)
+        else:
+            loaded = state['loaded']
+            missing = set(x for x in ids if x not in loaded)
+            if missing:
+                primed = state['pending'] - missing
+                state['pending'] = set()
+                for oid, val in self._load(list(missing), list(primed)).items():
+                    loaded[oid] = pickle.dumps(val, pickle.HIGHEST_PROTOCOL)
+            # the items are shared by the whole scope, every caller gets its
+            # own copy
+            return [ pickle.loads(loaded[x]) for x in ids ]
+        return [ loaded[x] for x in ids ]
+
+    def _load(self, ids, optional=()):
+        """
+        Returns a dict id -> item; the `optional` ids that do not exist are
+        skipped.
+        """
+        fargs = list(ids) + list(optional)
+        cached = zip(fargs, self.func.get_from_cache([ (x,) for x in fargs ]))
+        missing = [ x[0] for x in cached if x[1] is cache_me.CACHE_MISS ]
+        preload = self.fetch(missing) if missing else {}
+
+        output = {}
+        for ix, e in enumerate(cached):
+            oid, val = e
+            if val is cache_me.CACHE_MISS:
+                if ix >= len(ids) and oid not in preload:
+                    continue
+                val = self.func(oid, preload=preload[oid])
+            output[oid] = val
+        return output
+
 
 def deadlines(lang, year=None):
     qs = models.Deadline.objects\
@@ -67,7 +197,8 @@ def deadlines(lang, year=None):
 deadlines = cache_me(
     models=(models.Deadline, models.DeadlineContent),
     key='deadlines:%(lang)s:%(year)s',
-    timeout=5*60)(deadlines, _i_deadlines)
+    namespace='deadlines',
+    timeout=5*60)(deadlines)
 
 def sponsor(conf):
     qs = models.SponsorIncome.objects\
@@ -138,13 +269,10 @@ schedule_data = cache_me(
     models=(models.Schedule, models.Track),
     key='schedule:%(sid)s')(schedule_data, _i_schedule_data)
 
-def schedules_data(sids):
-    cached = zip(sids, schedule_data.get_from_cache([ (x,) for x in sids ]))
-    missing = [ x[0] for x in cached if x[1] is cache_me.CACHE_MISS ]
-
+def _fetch_schedules(sids):
     preload = {}
     schedules = models.Schedule.objects\
-        .filter(id__in=missing)
+        .filter(id__in=sids)
     tracks = models.Track.objects\
         .filter(schedule__in=schedules)\
         .order_by('order')
@@ -156,15 +284,12 @@ def schedules_data(sids):
         }
     for t in tracks:
         preload[t.schedule_id]['tracks'].append(t)
+    return preload
 
-    output = []
-    for ix, e in enumerate(cached):
-        sid, val = e
-        if val is cache_me.CACHE_MISS:
-            val = schedule_data(sid, preload=preload[sid])
-        output.append(val)
+schedule_loader = DataLoader(schedule_data, _fetch_schedules)
 
-    return output
+def schedules_data(sids):
+    return schedule_loader.load_many(sids)
 
 def talk_data(tid, preload=None):
     if preload is None:
@@ -234,22 +359,26 @@ def _i_talk_data(sender, **kw):
             tids = [ o.object_pk ]
         else:
             tids = []
+    elif sender is models.MultilingualContent:
+        # the abstract
+        o = kw['instance']
+        if o.content_type.app_label == 'conference' and o.content_type.model == 'talk':
+            tids = [ o.object_id ]
+        else:
+            tids = []
     else:
         tids = [ kw['instance'].talk_id ]
 
     return [ 'talk_data:%s' % x for x in tids ]
 
 talk_data = cache_me(
-    models=(models.Talk, models.Speaker, models.TalkSpeaker, comments.get_model()),
+    models=(models.Talk, models.Speaker, models.TalkSpeaker, comments.get_model(), models.MultilingualContent),
     key='talk_data:%(tid)s')(talk_data, _i_talk_data)
 
-def talks_data(tids):
-    cached = zip(tids, talk_data.get_from_cache([ (x,) for x in tids ]))
-    missing = [ x[0] for x in cached if x[1] is cache_me.CACHE_MISS ]
-
+def _fetch_talks(tids):
     preload = {}
     talks = models.Talk.objects\
-        .filter(id__in=missing)
+        .filter(id__in=tids)
     speakers_data = models.TalkSpeaker.objects\
         .filter(talk__in=talks.values('id'))\
         .values('talk', 'speaker', 'helper',)
@@ -268,7 +397,7 @@ def talks_data(tids):
         .filter(content_type__app_label='conference', content_type__model='talk')\
         .filter(object_pk__in=talks.values('id'), is_public=True)
     events = models.Event.objects\
-        .filter(talk__in=missing)\
+        .filter(talk__in=tids)\
         .values('talk', 'id')
 
     for t in talks:
@@ -303,15 +432,15 @@ def talks_data(tids):
     # talk_data uses profile_data, we try to fetch all the data of the speaker
     # because we need to optimize the number of needed queries.
     profiles_data(pids)
+    return preload
 
-    output = []
-    for ix, e in enumerate(cached):
-        tid, val = e
-        if val is cache_me.CACHE_MISS:
-            val = talk_data(tid, preload=preload[tid])
-        output.append(val)
+talk_loader = DataLoader(talk_data, _fetch_talks)
 
-    return output
+def talks_data(tids):
+    talks = talk_loader.load_many(tids)
+    # the templates usually show the speakers of the talks
+    profile_loader.prime(s['id'] for t in talks for s in t['speakers'])
+    return talks
 
 def speaker_data(sid, preload=None):
     if preload is None:
@@ -363,13 +492,10 @@ speaker_data = cache_me(
     models=(models.Speaker, models.Talk, models.TalkSpeaker, models.AttendeeProfile, User),
     key='speaker_data:%(sid)s')(speaker_data, _i_speaker_data)
 
-def speakers_data(sids):
-    cached = zip(sids, speaker_data.get_from_cache([ (x,) for x in sids ]))
-    missing = [ x[0] for x in cached if x[1] is cache_me.CACHE_MISS ]
-
+def _fetch_speakers(sids):
     preload = {}
     speakers = models.Speaker.objects\
-        .filter(user__in=missing)
+        .filter(user__in=sids)
     talks = models.TalkSpeaker.objects\
         .filter(speaker__in=speakers.values('user'))\
         .values('speaker', 'talk__id', 'talk__title', 'talk__slug', 'talk__conference', 'talk__type')
@@ -387,15 +513,12 @@ def speakers_data(sids):
             'talk__conference': t['talk__conference'],
             'talk__type': t['talk__type'],
         })
+    return preload
 
-    output = []
-    for ix, e in enumerate(cached):
-        sid, val = e
-        if val is cache_me.CACHE_MISS:
-            val = speaker_data(sid, preload=preload[sid])
-        output.append(val)
+speaker_loader = DataLoader(speaker_data, _fetch_speakers)
 
-    return output
+def speakers_data(sids):
+    return speaker_loader.load_many(sids)
 
 def event_data(eid, preload=None):
     if preload is None:
@@ -479,7 +602,8 @@ def tags():
     return dict(tags)
 
 tags = cache_me(
-    models=(models.ConferenceTaggedItem,))(tags)
+    models=(models.ConferenceTaggedItem,),
+    single_flight=True)(tags)
 
 def tags_for_talks(conference=None, status=None):
     """
@@ -501,31 +625,15 @@ def tags_for_talks(conference=None, status=None):
         .extra(select={'lname': 'lower(name)'}, order_by=['lname'])
     return list(qs)
 
-def _i_tags_for_talks(sender, **kw):
-    statuses = [ x[0] for x in models.TALK_STATUS ]
-    if sender is models.Talk:
-        conf = [ kw['instance'].conference ]
-    else:
-        conf = models.Conference.objects.all().values_list('code', flat=True)
-    return [ 'talks_data:%s:%s' % (c, s) for s in statuses for c in conf ]
-
 tags_for_talks = cache_me(
     models=(models.Talk, models.ConferenceTaggedItem, models.ConferenceTag,),
-    key='talks_data:%(conference)s:%(status)s')(tags_for_talks, _i_tags_for_talks)
-
-def events(eids=None, conf=None):
-    if eids is None:
-        eids = models.Event.objects\
-            .filter(schedule__conference=conf)\
-            .values_list('id', flat=True)\
-            .order_by('start_time')
-
-    cached = zip(eids, event_data.get_from_cache([ (x,) for x in eids ]))
-    missing = [ x[0] for x in cached if x[1] is cache_me.CACHE_MISS ]
+    key='talks_data:%(conference)s:%(status)s',
+    namespace='tags_for_talks')(tags_for_talks)
 
+def _fetch_events(eids):
     preload = {}
     events = models.Event.objects\
-        .filter(id__in=missing)\
+        .filter(id__in=eids)\
         .select_related('sponsor')
     tracks = models.EventTrack.objects\
         .filter(event__in=events)\
@@ -550,15 +658,138 @@ def events(eids=None, conf=None):
             .filter(id__in=events.values('schedule_id').distinct())\
             .values_list('id', flat=True)
     )
+    return preload
 
-    output = []
-    for ix, e in enumerate(cached):
-        eid, val = e
-        if val is cache_me.CACHE_MISS:
-            val = event_data(eid, preload=preload[eid])
-        output.append(val)
+event_loader = DataLoader(event_data, _fetch_events)
 
-    return output
+def events(eids=None, conf=None):
+    if eids is None:
+        eids = models.Event.objects\
+            .filter(schedule__conference=conf)\
+            .values_list('id', flat=True)\
+            .order_by('start_time')
+    return event_loader.load_many(eids)
+
+def timetable_snapshot(sid):
+    """
+    The analyzed events of the schedule in the form used by
+    `TimeTable2.fromSnapshot`.
+    """
+    from conference.utils import TimeTable2
+    qs = models.EventTrack.objects\
+        .filter(event__schedule=sid)\
+        .values('event')\
+        .distinct()
+    return TimeTable2.fromEvents(sid, qs).snapshot()
+
+def _i_timetable_snapshot(sender, **kw):
+    o = kw['instance']
+    if sender is models.Schedule:
+        sids = [ o.id ]
+    elif sender is models.Event:
+        # an event moved to another schedule leaves the previous one too
+        sids = set([ o.schedule_id, getattr(o, '_previous_schedule_id', None) ]) - set([ None ])
+    elif sender is models.Track:
+        sids = [ o.schedule_id ]
+    elif sender is models.EventTrack:
+        sids = [ o.track.schedule_id ]
+    elif sender is models.Talk:
+        sids = models.Event.objects\
+            .filter(talk=o)\
+            .values_list('schedule', flat=True)\
+            .distinct()
+    return [ 'timetable_snapshot:%s' % x for x in sids ]
+
+timetable_snapshot = cache_me(
+    models=(models.Schedule, models.Event, models.EventTrack, models.Track, models.Talk),
+    key='timetable_snapshot:%(sid)s')(timetable_snapshot, _i_timetable_snapshot)
+
+def _on_event_pre_save(sender, **kw):
+    # remembers the schedule of the event before the save
+    o = kw['instance']
+    o._previous_schedule_id = None
+    if o.pk:
+        o._previous_schedule_id = sender.objects\
+            .filter(pk=o.pk)\
+            .values_list('schedule', flat=True)\
+            .first()
+
+pre_save.connect(_on_event_pre_save, sender=models.Event)
+
+def live_index(conference, date):
+    """
+    The `TrackIndex` of the schedule of the conference in `date`, None if
+    there isn't one.
+    """
+    from conference.intervals import TrackIndex
+    from conference.utils import TimeTable2
+    try:
+        sid = models.Schedule.objects\
+            .values_list('id', flat=True)\
+            .get(conference=conference, date=date)
+    except models.Schedule.DoesNotExist:
+        return None
+    return TrackIndex(TimeTable2.fromSchedule(sid))
+
+# polled all day long by the live pages; every change of the schedules
+# invalidates all the indexes, anyway they are rebuilt at least every minute.
+live_index = cache_me(
+    models=(models.Schedule, models.Event, models.EventTrack, models.Track, models.Talk),
+    key='live_index:%(conference)s:%(date)s',
+    namespace='live_index',
+    timeout=60)(live_index)
+
+def schedule_version(conference):
+    """
+    Returns the time (seconds since the epoch, as a float) of the last change
+    to the schedules of the conference; more precisely the time of the first
+    call after the change.
+    """
+    return time.time()
+
+def _i_schedule_version(sender, **kw):
+    # every change of the data rendered in the iCal feeds: the events, the
+    # talks with their abstracts and speakers, the conference venue
+    o = kw['instance']
+    if sender is models.Schedule or sender is models.Talk:
+        conferences = [ o.conference ]
+    elif sender is models.Event or sender is models.Track:
+        conferences = [ o.schedule.conference ]
+    elif sender is models.EventTrack:
+        conferences = [ o.track.schedule.conference ]
+    elif sender is models.TalkSpeaker:
+        conferences = [ o.talk.conference ]
+    elif sender is models.MultilingualContent:
+        target = o.content_object
+        if isinstance(target, models.Talk):
+            conferences = [ target.conference ]
+        elif isinstance(target, models.Event):
+            conferences = [ target.schedule.conference ]
+        else:
+            conferences = []
+    elif sender in (models.Speaker, models.AttendeeProfile, User):
+        if sender is User:
+            # saved at every login
+            if set(kw.get('update_fields') or ()) == set(['last_login']):
+                return []
+            uid = o.id
+        else:
+            uid = o.user_id
+        conferences = models.TalkSpeaker.objects\
+            .filter(speaker=uid)\
+            .values_list('talk__conference', flat=True)\
+            .distinct()
+    else:
+        # SpecialPlace
+        conferences = models.Conference.objects.values_list('code', flat=True)
+    return [ 'schedule_version:%s' % c for c in conferences ]
+
+schedule_version = cache_me(
+    models=(
+        models.Schedule, models.Event, models.EventTrack, models.Track, models.Talk,
+        models.TalkSpeaker, models.Speaker, models.AttendeeProfile, User,
+        models.MultilingualContent, models.SpecialPlace,),
+    key='schedule_version:%(conference)s')(schedule_version, _i_schedule_version)
 
 def _i_profile_data(sender, **kw):
     if sender is models.AttendeeProfile:
@@ -642,21 +873,18 @@ profile_data = cache_me(
     models=(models.AttendeeProfile, models.Speaker, models.TalkSpeaker, User),
     key='profile:%(uid)s')(profile_data, _i_profile_data)
 
-def profiles_data(pids):
-    cached = zip(pids, profile_data.get_from_cache([ (x,) for x in pids ]))
-    missing = [ x[0] for x in cached if x[1] is cache_me.CACHE_MISS ]
-
+def _fetch_profiles(pids):
     preload = {}
     profiles = models.AttendeeProfile.objects\
-        .filter(user__in=missing)\
+        .filter(user__in=pids)\
         .select_related('user')
     talks = models.TalkSpeaker.objects\
-        .filter(speaker__in=missing)\
+        .filter(speaker__in=pids)\
         .values('speaker', 'talk', 'talk__status', 'talk__conference')
     bios = models.MultilingualContent.objects\
         .filter(
             content_type=ContentType.objects.get_for_model(models.AttendeeProfile),
-            object_id__in=missing,
+            object_id__in=pids,
         )
     for p in profiles:
         preload[p.user_id] = {'profile': p, 'talks': [], 'bio': None}
@@ -666,15 +894,12 @@ def profiles_data(pids):
 
     for b in bios:
         preload[b.object_id]['bio'] = b
+    return preload
 
-    output = []
-    for ix, e in enumerate(cached):
-        pid, val = e
-        if val is cache_me.CACHE_MISS:
-            val = profile_data(pid, preload=preload[pid])
-        output.append(val)
+profile_loader = DataLoader(profile_data, _fetch_profiles)
 
-    return output
+def profiles_data(pids):
+    return profile_loader.load_many(pids)
 
 
 def fares(conference):
@@ -702,11 +927,15 @@ def user_votes(uid, conference):
     return dict([(v.talk_id, v.vote) for v in votes])
 
 def _i_user_votes(sender, **kw):
-    o = kw['instance']
-    return 'user_votes:%s:%s' % (o.user_id, o.talk.conference)
+    if 'instance' in kw:
+        o = kw['instance']
+        return 'user_votes:%s:%s' % (o.user_id, o.talk.conference)
+    else:
+        return 'user_votes:%s:%s' % (kw['user_id'], kw['conference'])
 
 user_votes = cache_me(
     models=(models.VotoTalk,),
+    signals=(signals.votes_changed,),
     key='user_votes:%(uid)s:%(conference)s')(user_votes, _i_user_votes)
 
 def user_events_interest(uid, conference):
@@ -738,21 +967,93 @@ def conference_booking_status(conference):
         output[e] = models.EventBooking.objects.booking_status(e)
     return output
 
-def _i_conference_booking_status(sender, **kw):
-    if sender is models.EventBooking:
-        conference = kw['instance'].event.schedule.conference
-    elif sender is models.Track:
-        conference = kw['instance'].schedule.conference
-    elif sender is models.Event:
-        conference = kw['instance'].schedule.conference
-    return 'conference_booking_status:%s' % conference
-
 conference_booking_status = cache_me(
     models=(models.EventBooking, models.Track, models.Event,),
-    key='conference_booking_status:%(conference)s')(conference_booking_status, _i_conference_booking_status)
+    key='conference_booking_status:%(conference)s',
+    namespace='conference_booking_status',
+    single_flight=True)(conference_booking_status)
+
+def user_schedule(uid, conference):
+    """
+    The events of the personal schedule of the user (the ones they are
+    interested in or they have booked) as a dict:
+
+        eid -> {'schedule': sid, 'interest': bool, 'booked': bool}
+    """
+    output = {}
+    interests = models.EventInterest.objects\
+        .filter(user=uid, interest__gt=0, event__schedule__conference=conference)\
+        .values_list('event', 'event__schedule')
+    for eid, sid in interests:
+        output[eid] = {'schedule': sid, 'interest': True, 'booked': False}
+    bookings = models.EventBooking.objects\
+        .filter(user=uid, event__schedule__conference=conference)\
+        .values_list('event', 'event__schedule')
+    for eid, sid in bookings:
+        output.setdefault(eid, {'schedule': sid, 'interest': False})['booked'] = True
+    return output
+
+def _i_user_schedule(sender, **kw):
+    o = kw['instance']
+    if sender in (models.EventInterest, models.EventBooking):
+        try:
+            event = o.event
+        except models.Event.DoesNotExist:
+            return
+        users = [ o.user_id ]
+    else:
+        # the event may have been moved to another schedule
+        event = o
+        users = set(
+            list(models.EventInterest.objects.filter(event=event).values_list('user', flat=True)) +
+            list(models.EventBooking.objects.filter(event=event).values_list('user', flat=True)))
+    conf = event.schedule.conference
+    return [ 'user_schedule:%s:%s' % (uid, conf) for uid in users ]
+
+user_schedule = cache_me(
+    models=(models.Event, models.EventInterest, models.EventBooking,),
+    key='user_schedule:%(uid)s:%(conference)s')(user_schedule, _i_user_schedule)
+
+def user_schedule_events(uid, conference):
+    """
+    The events of the personal schedule of the user grouped by schedule:
+    sid -> list(eid).
+    """
+    output = defaultdict(list)
+    for eid, row in sorted(user_schedule(uid, conference).items()):
+        output[row['schedule']].append(eid)
+    return dict(output)
+
+def attendance_matrix(conference):
+    return models.Schedule.objects.attendance_matrix(conference)
+
+def _attendance_conference(sender, instance):
+    if sender is models.Schedule:
+        return instance.conference
+    elif sender is models.Event:
+        return instance.schedule.conference
+    elif sender is models.Track:
+        return instance.schedule.conference
+    elif sender is models.EventTrack:
+        return instance.track.schedule.conference
+    else:
+        # EventInterest, EventBooking
+        return instance.event.schedule.conference
+
+def _i_attendance_matrix(sender, **kw):
+    return 'attendance_matrix:%s' % _attendance_conference(sender, kw['instance'])
+
+# The matrix is discarded on every change and rebuilt by a single process;
+# patching the cached copy from the signals would race with the other
+# writers and could keep the rows of a rolled back transaction.
+attendance_matrix = cache_me(
+    models=(models.Schedule, models.Event, models.EventInterest, models.EventBooking,),
+    key='attendance_matrix:%(conference)s',
+    single_flight=True)(attendance_matrix, _i_attendance_matrix)
 
 def expected_attendance(conference):
-    data = models.Schedule.objects.expected_attendance(conference)
+    data = models.Schedule.objects.expected_attendance(
+        conference, matrix=attendance_matrix(conference))
     vals = data.values()
     max_score = max([ x['score'] for x in vals ])
     for x in vals:
@@ -760,15 +1061,43 @@ def expected_attendance(conference):
     return data
 
 def _i_expected_attendance(sender, **kw):
-    if sender is models.EventInterest:
-        conf = kw['instance'].event.schedule.conference
-    elif sender is models.Track:
-        conf = kw['instance'].schedule.conference
-    elif sender is models.EventTrack:
-        conf = kw['instance'].track.schedule.conference
-    return 'expected_attendance:%s' % conf
+    return 'expected_attendance:%s' % _attendance_conference(sender, kw['instance'])
 
 expected_attendance = cache_me(
-    models=(models.EventInterest, models.Track, models.EventTrack,),
-    key='expected_attendance:%(conference)s')(expected_attendance, _i_expected_attendance)
+    models=(
+        models.Schedule, models.Event, models.Track, models.EventTrack,
+        models.EventInterest, models.EventBooking,),
+    key='expected_attendance:%(conference)s',
+    single_flight=True)(expected_attendance, _i_expected_attendance)
+
+def ticket_sales(conference):
+    """
+    The tickets sold every day for the conference, see
+    `conference.models.TicketSalesManager.sales`.
+    """
+    return models.TicketSales.objects.sales(conference)
 
+def _i_ticket_sales(sender, **kw):
+    o = kw['instance']
+    if sender is amodels.Order:
+        conferences = models.Fare.objects\
+            .filter(ticket__orderitem__order=o)\
+            .values_list('conference', flat=True)\
+            .distinct()
+    elif sender is amodels.OrderItem:
+        try:
+            conferences = [ o.ticket.fare.conference ] if o.ticket_id else []
+        except models.Ticket.DoesNotExist:
+            # deleted with the ticket, that has already invalidated the sales
+            conferences = []
+    elif sender is models.Ticket:
+        conferences = [ o.fare.conference ]
+    else:
+        conferences = [ o.conference ]
+    return [ 'ticket_sales:%s' % c for c in conferences ]
+
+# only the sales of the conferences touched by a change are computed again,
+# those of the past ones are read from the rollup table
+ticket_sales = cache_me(
+    models=(models.Ticket, models.Fare, amodels.Order, amodels.OrderItem,),
+    key='ticket_sales:%(conference)s')(ticket_sales, _i_ticket_sales)
@@ -5,16 +5,19 @@ Things in this file are related to a special debug panel that helps us debug
 things in production.
 """
 import datetime
+import os
 import platform
 import subprocess
 
 import django
 from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import HttpResponse, JsonResponse
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.template.response import TemplateResponse
 
 from common.http import PdfResponse
+from conference import cachef
 from conference.invoicing import (
     Invoice,
     VAT_NOT_AVAILABLE_PLACEHOLDER,
@@ -91,6 +94,41 @@ def debug_panel_index(request):
     })
 
 
+@staff_member_required
+def debug_panel_cache_stats(request):
+    """
+    Hits, misses and cost of the misses of the cached functions (see
+    `conference.cachef.CacheFunction`), sorted by the time spent in the
+    misses. The counters are kept in memory, this page shows the ones of the
+    process that serves the request.
+    """
+    instances = sorted(cachef._instances, key=lambda x: x.prefix)
+    if request.method == 'POST':
+        for cache_function in instances:
+            cache_function.reset_stats()
+        return HttpResponseRedirect(reverse('debug_panel_cache_stats'))
+
+    buckets = [ '<= %gms' % (x * 1000) for x in cachef.FunctionStats.BUCKETS ]
+    buckets.append('> %gms' % (cachef.FunctionStats.BUCKETS[-1] * 1000))
+    functions = []
+    for cache_function in instances:
+        for name, stats in cache_function.function_stats():
+            stats['name'] = cache_function.prefix + name
+            stats['time'] *= 1000
+            if stats['avg_time'] is not None:
+                stats['avg_time'] *= 1000
+            stats['histogram'] = [ x[1] for x in stats['histogram'] ]
+            functions.append(stats)
+
+    return TemplateResponse(
+        request, 'conference/debugpanel/cache_stats.html', {
+            'buckets': buckets,
+            'functions': functions,
+            'pid': os.getpid(),
+        }
+    )
+
+
 def get_start_end_dates(request):
     DEFAULT_START_DATE = datetime.date(2018, 1, 1)
     DEFAULT_END_DATE   = datetime.date.today()
@@ -8,28 +8,51 @@ def encode(line):
         line = line.encode('utf-8')
     if not line.endswith('\r\n'):
         line += '\r\n'
-    if len(line) > 75:
-        fold = [ line ]
-        while len(fold[-1]) > 75:
-            l = fold[-1]
-            # 73, because it will be added CRLF
-            pos = 73
-            # It's a bad idea to truncate the string (maybe UTF-8) with a random number,
-            # because I will break a multi-bytes sequence and the file will be unreadable.
-            while True:
-                ready = fold[-1][:pos]
-                try:
-                    ready.decode('utf-8')
-                except UnicodeDecodeError:
-                    pos -= 1
-                    if pos == 0:
-                        raise ValueError('cannot encode: %s' % line)
-                else:
-                    break
-            fold[-1] = ready
-            fold.append(' ' + l[pos:])
-        line = '\r\n'.join(fold)
-    return line
+    if len(line) <= 75:
+        return line
+    try:
+        line.decode('utf-8')
+    except UnicodeDecodeError:
+        return _fold_invalid(line)
+    # Every folded line is at most 75 bytes (73 plus CRLF, the next ones 72
+    # plus the leading space and CRLF); to not break a multi-bytes sequence
+    # the cut is moved back to the first byte that is not a UTF-8
+    # continuation byte (0x80-0xBF).
+    parts = []
+    start = 0
+    size = 73
+    end = len(line)
+    while end - start > size + 2:
+        pos = start + size
+        while '\x80' <= line[pos] < '\xc0':
+            pos -= 1
+        parts.append(line[start:pos])
+        start = pos
+        size = 72
+    parts.append(line[start:])
+    return '\r\n '.join(parts)
+
+def _fold_invalid(line):
+    # the line is not valid UTF-8, the longest prefix that can be decoded is
+    # searched one byte at time.
+    fold = [ line ]
+    while len(fold[-1]) > 75:
+        l = fold[-1]
+        # 73, because it will be added CRLF
+        pos = 73
+        while True:
+            ready = fold[-1][:pos]
+            try:
+                ready.decode('utf-8')
+            except UnicodeDecodeError:
+                pos -= 1
+                if pos == 0:
+                    raise ValueError('cannot encode: %s' % line)
+            else:
+                break
+        fold[-1] = ready
+        fold.append(' ' + l[pos:])
+    return '\r\n'.join(fold)
 
 def content(name, value, params=None):
     if params:
@@ -97,6 +120,10 @@ class Component(dict):
         super(Component, self).__init__(*args, **kwargs)
 
     def encode(self):
+        """
+        Yields the folded lines of the component; the subcomponents can be
+        any iterable (a generator too), they are consumed while encoding.
+        """
         yield content('BEGIN', self.name)
         for name, prop in self.items():
             if prop is None:
@@ -153,3 +180,19 @@ class Calendar(Component):
         super(Calendar, self).__init__('VCALENDAR', d)
         self.subcomponents = events
 
+def iterencode(component, size=16 * 1024):
+    """
+    Yields the encoded `component` in chunks of about `size` bytes, to be
+    used as the content of a StreamingHttpResponse.
+    """
+    chunk = []
+    length = 0
+    for line in component.encode():
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield ''.join(chunk)
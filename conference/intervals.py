@@ -0,0 +1,207 @@
+# -*- coding: UTF-8 -*-
+"""
+Indexes to find the overlapping time ranges (of the events of a schedule)
+without comparing every pair, and the event in progress in a track.
+"""
+import bisect
+from collections import defaultdict
+from datetime import timedelta
+
+
+def overlap(range1, range2):
+    # http://stackoverflow.com/questions/9044084/efficient-data-range-overlap-calculation-in-python
+    latest_start = max(range1[0], range2[0])
+    earliest_end = min(range1[1], range2[1])
+    _overlap = (earliest_end - latest_start)
+    return _overlap.days == 0 and _overlap.seconds > 0
+
+
+def overlap_counts(intervals):
+    """
+    Returns, for every half open interval `(start, end)`, how many of the
+    other intervals overlap it; the empty intervals overlap nothing.
+
+    The intervals overlapping `[s, e)` are the ones starting before `e` less
+    the ones ending before (or at) `s`, both counted with a binary search on
+    the sorted starts and ends: O(n log n) instead of comparing every pair.
+    """
+    intervals = list(intervals)
+    starts = sorted(i[0] for i in intervals if i[0] < i[1])
+    ends = sorted(i[1] for i in intervals if i[0] < i[1])
+    output = []
+    for start, end in intervals:
+        if start < end:
+            # minus one for the interval itself
+            n = bisect.bisect_left(starts, end) - bisect.bisect_right(ends, start) - 1
+        else:
+            n = 0
+        output.append(n)
+    return output
+
+
+class _Node(object):
+    """
+    Node of a centered interval tree; the node stores the intervals that
+    contain `center`, the ones completely on the left/right of the center are
+    stored in the children.
+    """
+    def __init__(self, intervals):
+        points = sorted(p for i in intervals for p in i[:2])
+        self.center = points[(len(points) - 1) // 2]
+        left = []
+        right = []
+        here = []
+        for i in intervals:
+            if i[1] <= self.center:
+                left.append(i)
+            elif i[0] > self.center:
+                right.append(i)
+            else:
+                here.append(i)
+        self.by_start = sorted(here, key=lambda x: x[0])
+        self.by_end = sorted(here, key=lambda x: x[1], reverse=True)
+        self.left = _Node(left) if left else None
+        self.right = _Node(right) if right else None
+
+
+class IntervalIndex(object):
+    """
+    Static index of half open intervals `[start, end)`, each one with an
+    associated item.
+
+    `overlapping` returns the items overlapping a given interval in
+    O(log n + k); the empty intervals never overlap anything.
+    """
+    def __init__(self, intervals):
+        data = []
+        for ix, (start, end, item) in enumerate(intervals):
+            if start < end:
+                data.append((start, end, ix, item))
+        self.by_start = sorted(data, key=lambda x: (x[0], x[2]))
+        self.starts = [ x[0] for x in self.by_start ]
+        self.root = _Node(data) if data else None
+
+    def _stab(self, point, output):
+        # intervals with start < point < end
+        node = self.root
+        while node is not None:
+            if point <= node.center:
+                for i in node.by_start:
+                    if i[0] >= point:
+                        break
+                    output.append(i)
+                if point == node.center:
+                    break
+                node = node.left
+            else:
+                for i in node.by_end:
+                    if i[1] <= point:
+                        break
+                    output.append(i)
+                node = node.right
+
+    def overlapping(self, start, end):
+        """
+        Returns the items overlapping `[start, end)` in the same order they
+        were passed to the index.
+        """
+        if not start < end or self.root is None:
+            return []
+        output = []
+        self._stab(start, output)
+        # plus the intervals starting inside [start, end)
+        ix = bisect.bisect_left(self.starts, start)
+        while ix < len(self.by_start) and self.by_start[ix][0] < end:
+            output.append(self.by_start[ix])
+            ix += 1
+        output.sort(key=lambda x: x[2])
+        return [ x[3] for x in output ]
+
+
+class EventIndex(object):
+    """
+    Index of the events by day and time range; `Event.get_time_range` is
+    called only once per event.
+    """
+    def __init__(self, events):
+        self.ranges = {}
+        by_day = defaultdict(list)
+        for e in events:
+            r = e.get_time_range()
+            self.ranges[e] = r
+            by_day[r[0].date()].append((r[0], r[1], e))
+        self.days = dict((d, IntervalIndex(v)) for d, v in by_day.items())
+
+    def time_range(self, event):
+        try:
+            return self.ranges[event]
+        except KeyError:
+            return event.get_time_range()
+
+    def overlapping(self, event):
+        """
+        Returns the indexed events, `event` included, that overlap `event`
+        in the same day, in the same order they were passed to the index.
+        """
+        r0 = self.time_range(event)
+        try:
+            index = self.days[r0[0].date()]
+        except KeyError:
+            return []
+        return [
+            e for e in index.overlapping(r0[0], r0[1])
+            if overlap(r0, self.ranges[e])
+        ]
+
+
+class TrackIndex(object):
+    """
+    Index of the events of a `TimeTable2` by track and start time, to find
+    the current and the next event of a track with a binary search.
+
+    The events with one of the `exclude` tags are never the current or the
+    next event.
+    """
+    def __init__(self, timetable, exclude=('special',)):
+        exclude = set(exclude)
+        self.events = {}
+        self.live = {}
+        self.starts = {}
+        for track, events in timetable.iterOnTracks():
+            self.events[track] = list(events)
+            live = [ e for e in events if not e['tags'] & exclude ]
+            self.live[track] = live
+            self.starts[track] = [ e['time'].time() for e in live ]
+
+    def track_events(self, track):
+        """
+        Returns all the events of the track sorted by time.
+        """
+        return self.events.get(track, [])
+
+    def current(self, track, t0):
+        """
+        Returns the events (current, next) of the track at the time `t0`.
+
+        The current event is the one started at or before `t0` (or the first
+        one of the day if `t0` is earlier), None if it is already finished;
+        the next one is the event after it, if any.
+        """
+        events = self.live.get(track)
+        if not events:
+            return None, None
+        starts = self.starts[track]
+        ix = bisect.bisect_left(starts, t0)
+        if ix == len(starts):
+            ix -= 1
+        elif starts[ix] != t0 and ix > 0:
+            ix -= 1
+        curr = events[ix]
+        try:
+            next = events[ix + 1]
+        except IndexError:
+            next = None
+        end = curr['time'] + timedelta(seconds=curr['duration'] * 60)
+        if end.time() < t0:
+            curr = None
+        return curr, next
@@ -20,10 +20,10 @@ import datetime
 import unicodecsv as csv
 
 from django.template.loader import render_to_string
-from django.db.models import Max
+from django.db.models import F, Max
 from django.db import transaction
 
-from assopy.models import Invoice, Order
+from assopy.models import Invoice, InvoiceSequence, Order
 
 from conference.currencies import (
     convert_from_EUR_using_latest_exrates,
@@ -86,6 +86,8 @@ ADDITIONAL_TEXT_FOR_YEAR = {
     2018: "assopy/invoices/_additional_text_for_2018.html",
 }
 
+NUMBER_OF_DIGITS_WITH_PADDING = 4
+
 REAL_INVOICE_PREFIX = "I/"
 FAKE_INVOICE_PREFIX = "F/"   # pro forma(?)
 
@@ -109,14 +111,6 @@ def is_real_invoice_code(invoice_code):
     return invoice_code.startswith(REAL_INVOICE_PREFIX)
 
 
-def increment_invoice_code(code):
-    NUMBER_OF_DIGITS_WITH_PADDING = 4
-
-    prefix_with_year, number = code.split('.')
-    number = str(int(number) + 1).zfill(NUMBER_OF_DIGITS_WITH_PADDING)
-    return "{}.{}".format(prefix_with_year, number)
-
-
 def latest_invoice_code_for_year(prefix, year):
     """
     returns latest used invoice.code in a given year.
@@ -134,17 +128,37 @@ def latest_invoice_code_for_year(prefix, year):
 
 
 def next_invoice_code_for_year(prefix, year):
+    """
+    Allocates the next invoice code of the year from its InvoiceSequence.
+
+    Must be called in the transaction that creates the invoice: the
+    sequence row stays locked until the commit, so concurrent orders get
+    unique codes, and a rollback gives the number back (no gaps).
+    """
     assert 2016 <= year <= 2020, year
     assert prefix in [REAL_INVOICE_PREFIX, FAKE_INVOICE_PREFIX]
+    assert transaction.get_connection().in_atomic_block
+
+    sequence = InvoiceSequence.objects.filter(prefix=prefix, year=year)
+    if not sequence.update(last=F('last') + 1):
+        # first code of the year (or of the sequences), the numbering
+        # continues from the existing invoices
+        current_code = latest_invoice_code_for_year(prefix, year)
+        InvoiceSequence.objects.get_or_create(
+            prefix=prefix,
+            year=year,
+            defaults={
+                'last': int(current_code.split('.')[1]) if current_code else 0,
+            }
+        )
+        sequence.update(last=F('last') + 1)
+    number = sequence.values_list('last', flat=True).get()
 
-    current_code = latest_invoice_code_for_year(prefix, year)
-    if current_code:
-        next_code = increment_invoice_code(current_code)
-        return next_code
-
-    # if there are no current codes, return the first one
     template = invoice_code_templates[prefix]
-    return template % {'year_two_digits': year % 1000, 'sequential_id': '0001'}
+    return template % {
+        'year_two_digits': year % 1000,
+        'sequential_id': str(number).zfill(NUMBER_OF_DIGITS_WITH_PADDING),
+    }
 
 
 def create_invoices_for_order(order, force_placeholder=False):
@@ -154,67 +168,67 @@ def create_invoices_for_order(order, force_placeholder=False):
     emit_date = payment_date if payment_date else order.created
     prefix = REAL_INVOICE_PREFIX if payment_date else FAKE_INVOICE_PREFIX
 
-    # First transaction takes care of "create all invoices or nothing"
-    # Making it more reliable and threadsafe
+    # Read before the transaction: the first statement of the transaction is
+    # the allocation of the invoice code, this way on sqlite it waits for the
+    # lock of the database instead of failing with "database is locked".
+    vat_list = order.vat_list()
+
+    # The transaction takes care of "create all invoices or nothing", and
+    # keeps the invoice sequence locked until the invoices are saved.
     with transaction.atomic():
 
         invoices = []
-        for vat_item in order.vat_list():
-            # Second, nested, transaction is here because otherwise getting new
-            # invoice_code wouldn't work with database fetch, we would need to
-            # increment it manually. (hence another transaction per item)
-            with transaction.atomic():
-
-                code = next_invoice_code_for_year(
-                    prefix=prefix,
-                    year=emit_date.year
-                )
-
-                gross_price = vat_item['price']
-                vat_rate    = normalize_price(1 + vat_item['vat'].value / 100)
-                net_price   = normalize_price(vat_item['price'] / vat_rate)
-                vat_price   = vat_item['price'] - net_price
-
-                currency = LOCAL_CURRENCY_BY_YEAR[emit_date.year]
-                if currency != 'EUR':
-                    conversion = convert_from_EUR_using_latest_exrates(
-                        vat_price, currency
-                    )
-                else:
-                    conversion = {
-                        'currency': 'EUR',
-                        'converted': vat_price,
-                        'exrate': Decimal('1.0'),
-                        'using_exrate_date': emit_date,
-                    }
-
-                invoice, _ = Invoice.objects.update_or_create(
-                    order=order,
-                    code=code,
-                    defaults={
-                        'issuer':         ISSUER_BY_YEAR[emit_date.year],
-                        'vat':            vat_item['vat'],
-                        'price':          gross_price,
-                        'payment_date':   payment_date,
-                        'emit_date':      emit_date,
-                        'local_currency': currency,
-                        'vat_in_local_currency': conversion['converted'],
-                        'exchange_rate':  conversion['exrate'],
-                        'exchange_rate_date': conversion['using_exrate_date'],
-                    }
+        for vat_item in vat_list:
+            code = next_invoice_code_for_year(
+                prefix=prefix,
+                year=emit_date.year
+            )
+
+            gross_price = vat_item['price']
+            vat_rate    = normalize_price(1 + vat_item['vat'].value / 100)
+            net_price   = normalize_price(vat_item['price'] / vat_rate)
+            vat_price   = vat_item['price'] - net_price
+
+            currency = LOCAL_CURRENCY_BY_YEAR[emit_date.year]
+            if currency != 'EUR':
+                conversion = convert_from_EUR_using_latest_exrates(
+                    vat_price, currency
                 )
-
-                if force_placeholder:
-                    invoice.html = VAT_NOT_AVAILABLE_PLACEHOLDER
-                else:
-                    invoice.html = render_invoice_as_html(invoice)
-
-                invoice.save()
-
-                assert invoice.net_price() == net_price
-                assert invoice.vat_value() == vat_price
-
-                invoices.append(invoice)
+            else:
+                conversion = {
+                    'currency': 'EUR',
+                    'converted': vat_price,
+                    'exrate': Decimal('1.0'),
+                    'using_exrate_date': emit_date,
+                }
+
+            invoice, _ = Invoice.objects.update_or_create(
+                order=order,
+                code=code,
+                defaults={
+                    'issuer':         ISSUER_BY_YEAR[emit_date.year],
+                    'vat':            vat_item['vat'],
+                    'price':          gross_price,
+                    'payment_date':   payment_date,
+                    'emit_date':      emit_date,
+                    'local_currency': currency,
+                    'vat_in_local_currency': conversion['converted'],
+                    'exchange_rate':  conversion['exrate'],
+                    'exchange_rate_date': conversion['using_exrate_date'],
+                }
+            )
+
+            if force_placeholder:
+                invoice.html = VAT_NOT_AVAILABLE_PLACEHOLDER
+            else:
+                invoice.html = render_invoice_as_html(invoice)
+
+            invoice.save()
+
+            assert invoice.net_price() == net_price
+            assert invoice.vat_value() == vat_price
+
+            invoices.append(invoice)
 
     return invoices
 
@@ -1,8 +1,8 @@
 # -*- coding: UTF-8 -*-
-from conference.models import Talk, Event, TalkSpeaker
+from conference.models import Talk, Event, TalkSpeaker, TalkPreference, VotoTalk
 
 from django.dispatch import Signal
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from conference import settings
 
 import logging
@@ -88,3 +88,29 @@ post_save.connect(on_talk_saved, sender=TalkSpeaker)
 # Also I draw the event because there is a custom acion in the admin that
 # sets all the talks present in the schedule as accepted.
 post_save.connect(on_talk_saved, sender=Event)
+
+def on_vote_changing(sender, **kw):
+    """
+    Remember the previous vote, needed to update the TalkPreference.
+    """
+    o = kw['instance']
+    o._previous_vote = None
+    if o.id:
+        o._previous_vote = VotoTalk.objects\
+            .filter(id=o.id)\
+            .values_list('vote', flat=True)\
+            .first()
+
+def on_vote_saved(sender, **kw):
+    o = kw['instance']
+    old = None if kw['created'] else getattr(o, '_previous_vote', None)
+    if old != o.vote:
+        TalkPreference.objects.vote_changed(o.user_id, o.talk, old, o.vote)
+
+def on_vote_deleted(sender, **kw):
+    o = kw['instance']
+    TalkPreference.objects.vote_changed(o.user_id, o.talk, o.vote, None)
+
+pre_save.connect(on_vote_changing, sender=VotoTalk)
+post_save.connect(on_vote_saved, sender=VotoTalk)
+post_delete.connect(on_vote_deleted, sender=VotoTalk)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+The mass mailing of the admin (attendee stats): the templates are compiled
+once, the contexts of the users are loaded in bulk and the messages are
+rendered and sent in chunks over a single SMTP connection by the
+`send_admin_mailings` command.
+"""
+from django.conf import settings as dsettings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.db.models import F
+from django.template import Context, Template
+from django.utils import timezone
+
+from conference import models
+from conference import settings
+from p3 import utils as p3utils
+
+
+def compile_templates(subject, body):
+    """
+    Returns the (subject, body) templates, with the libraries of
+    ADMIN_TICKETS_STATS_EMAIL_LOAD_LIBRARY already loaded.
+    """
+    if settings.ADMIN_TICKETS_STATS_EMAIL_LOAD_LIBRARY:
+        libs = '{%% load %s %%}' % ' '.join(settings.ADMIN_TICKETS_STATS_EMAIL_LOAD_LIBRARY)
+    else:
+        libs = ''
+    return Template(libs + subject), Template(libs + body)
+
+def render(templates, uids, conf):
+    """
+    Renders the templates for the users `uids`; returns a list of (subject,
+    body, user). The users and their tickets are loaded with two queries.
+    """
+    tSubject, tBody = templates
+    users = list(User.objects.filter(id__in=uids))
+    tickets = p3utils.get_tickets_assigned_to_users(users)
+    output = []
+    for u in users:
+        ctx = Context({
+            'user': u,
+            'conf': conf,
+            'tickets': tickets[u.id],
+        })
+        output.append((tSubject.render(ctx), tBody.render(ctx), u))
+    return output
+
+def send_mailing(mailing, chunk_size=None, connection=None):
+    """
+    Sends the messages of the mailing to the recipients not yet reached,
+    saving the progress after every chunk; at the end a feedback message is
+    sent to the `feedback_address`.
+
+    The progress also renews the claim of the mailing; if the mailing has
+    been reclaimed by another worker (this one has stalled for more than
+    ADMIN_TICKETS_STATS_EMAIL_CLAIM_TIMEOUT) the sending stops and False is
+    returned.
+    """
+    chunk_size = chunk_size or settings.ADMIN_TICKETS_STATS_EMAIL_CHUNK
+    conf = models.Conference.objects.get(code=mailing.conference)
+    templates = compile_templates(mailing.subject, mailing.body)
+    pending = list(mailing.recipients\
+        .filter(sent=False)\
+        .order_by('id')\
+        .values_list('id', 'user'))
+    # the updates of a worker that has lost the claim are discarded
+    claimed = mailing.claimed
+    owned = lambda: models.AdminMailing.objects.filter(id=mailing.id, claimed=claimed)
+
+    connection = connection or mail.get_connection()
+    connection.open()
+    try:
+        for ix in range(0, len(pending), chunk_size):
+            chunk = dict((uid, rid) for rid, uid in pending[ix:ix + chunk_size])
+            messages = []
+            for subject, body, user in render(templates, chunk.keys(), conf):
+                messages.append(mail.EmailMessage(
+                    subject, body, mailing.sender, [user.email], connection=connection))
+            connection.send_messages(messages)
+            models.AdminMailingRecipient.objects\
+                .filter(id__in=chunk.values())\
+                .update(sent=True)
+            models.AdminMailing.objects\
+                .filter(id=mailing.id)\
+                .update(sent=F('sent') + len(chunk))
+            now = timezone.now()
+            if not owned().update(claimed=now):
+                return False
+            claimed = now
+    except Exception as e:
+        owned().update(status=models.ADMIN_MAILING_STATUS.failed, error=unicode(e))
+        raise
+    finally:
+        connection.close()
+
+    if not owned().update(status=models.ADMIN_MAILING_STATUS.sent, error=''):
+        return False
+    if mailing.feedback_address:
+        send_feedback(mailing)
+    return True
+
+def send_feedback(mailing):
+    users = User.objects\
+        .filter(id__in=mailing.recipients.filter(sent=True).values('user'))\
+        .order_by('email')
+    ctx = {
+        'from_': mailing.sender,
+        'subject': mailing.subject,
+        'body': mailing.body,
+        'addresses': '\n'.join(
+            '"%s %s" - %s' % (u.first_name, u.last_name, u.email) for u in users),
+    }
+    feedback_email = ("""
+message sent
+-------------------------------
+FROM: %(from_)s
+SUBJECT: %(subject)s
+BODY:
+%(body)s
+-------------------------------
+sent to:
+%(addresses)s
+""" % ctx)
+    mail.send_mail(
+        '[%s] feedback mass mailing (admin stats)' % settings.CONFERENCE,
+        feedback_email,
+        dsettings.DEFAULT_FROM_EMAIL,
+        recipient_list=[mailing.feedback_address],
+     )
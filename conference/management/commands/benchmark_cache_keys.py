@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+import timeit
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from conference.cachef import CacheFunction
+
+
+# stand-ins with the signatures and the keys of the cached functions of
+# conference.dataaccess
+def talk_data(tid, preload=None):
+    return {'id': tid, 'title': 'talk %s' % tid}
+
+def event_data(eid, preload=None):
+    return {'id': eid, 'name': 'event %s' % eid}
+
+FUNCTIONS = (
+    (talk_data, 'talk_data:%(tid)s'),
+    (event_data, 'event:%(eid)s'),
+)
+
+
+class Command(BaseCommand):
+    """
+    Compares the per-call overhead of the cache hits of `talk_data` and
+    `event_data` with the compiled key builders against the keys built by
+    `generate_key` (getcallargs); the hits are served by the local cache.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--calls',
+            action='store',
+            dest='calls',
+            default=10000,
+            type='int',
+            help='Number of calls timed',
+        ),
+        make_option('--repeat',
+            action='store',
+            dest='repeat',
+            default=3,
+            type='int',
+        ),
+    )
+    def handle(self, *args, **options):
+        local = {'size': 1000, 'sync': 3600}
+        compiled = CacheFunction(prefix='benchmark:', local=local)
+        base = CacheFunction(prefix='benchmark:')
+        # a custom fkey disables the compilation of the keys
+        generated = CacheFunction(
+            prefix='benchmark:', local=local,
+            fkey=lambda key, func, args, kwargs: base.generate_key(key, func, args, kwargs))
+
+        calls = options['calls']
+        repeat = options['repeat']
+        for func, key in FUNCTIONS:
+            build_key = compiled.compile_key(key, func)
+            fc = compiled(key=key)(func)
+            fg = generated(key=key)(func)
+            # the hits of an id among 100 already cached
+            for ix in range(100):
+                fc(ix)
+                fg(ix)
+            cases = (
+                ('key',
+                    lambda: base.fhash(base.generate_key(key, func, (1,), {})),
+                    lambda: base.fhash(build_key((1,), {}))),
+                ('hit',
+                    lambda: fg(1),
+                    lambda: fc(1)),
+            )
+            print(func.__name__)
+            for name, slow, fast in cases:
+                t0 = min(timeit.repeat(slow, number=calls, repeat=repeat)) / calls
+                t1 = min(timeit.repeat(fast, number=calls, repeat=repeat)) / calls
+                print('  %-5s generate_key %7.2fus / compiled %7.2fus / x%.1f' % (
+                    name, t0 * 1e6, t1 * 1e6, t0 / t1))
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+import random
+import timeit
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from conference import dataaccess
+from conference import ical
+
+
+def naive_encode(line):
+    """
+    The previous implementation of `ical.encode`, used as reference.
+    """
+    if isinstance(line, unicode):
+        line = line.encode('utf-8')
+    if not line.endswith('\r\n'):
+        line += '\r\n'
+    if len(line) > 75:
+        fold = [ line ]
+        while len(fold[-1]) > 75:
+            l = fold[-1]
+            pos = 73
+            while True:
+                ready = fold[-1][:pos]
+                try:
+                    ready.decode('utf-8')
+                except UnicodeDecodeError:
+                    pos -= 1
+                    if pos == 0:
+                        raise ValueError('cannot encode: %s' % line)
+                else:
+                    break
+            fold[-1] = ready
+            fold.append(' ' + l[pos:])
+        line = '\r\n'.join(fold)
+    return line
+
+
+def synthetic_texts(count, seed=0):
+    """
+    Returns `count` (title, abstract) pairs with some non ASCII characters
+    and the characters escaped by `ical.TEXT`.
+    """
+    rnd = random.Random(seed)
+    words = [
+        u'python', u'data', u'async', u'caf\xe9', u'na\xefve', u'日本語',
+        u'\U0001f40d', u'test,', u'a;b', u'line\n', u'\r\n', u'back\\slash',
+    ]
+    def text(n):
+        return u' '.join(rnd.choice(words) for _ in range(n))
+    return [ (text(rnd.randrange(3, 15)), text(rnd.randrange(50, 400))) for _ in range(count) ]
+
+
+def conference_texts(conference):
+    output = []
+    for e in dataaccess.events(conf=conference):
+        abstract = e['talk']['abstract'] if e['talk'] else e['abstract']
+        output.append((e['name'], abstract))
+    return output
+
+
+class Command(BaseCommand):
+    """
+    Compares the iCal line folding with the previous implementation on the
+    SUMMARY and DESCRIPTION lines of the schedule of a conference (the feed
+    with the abstracts) or on synthetic ones.
+    """
+    args = '[conference]'
+    option_list = BaseCommand.option_list + (
+        make_option('--synthetic',
+            action='store',
+            dest='synthetic',
+            default=300,
+            type='int',
+            help='Number of synthetic events used when the conference is not specified',
+        ),
+        make_option('--repeat',
+            action='store',
+            dest='repeat',
+            default=3,
+            type='int',
+        ),
+    )
+    def handle(self, *args, **options):
+        if args:
+            texts = conference_texts(args[0])
+        else:
+            texts = synthetic_texts(options['synthetic'])
+        lines = []
+        for title, abstract in texts:
+            lines.append('SUMMARY:' + ical.TEXT(title))
+            lines.append('DESCRIPTION:' + ical.TEXT(abstract))
+
+        output = [ ical.encode(l) for l in lines ]
+        if output != [ naive_encode(l) for l in lines ]:
+            raise ValueError('the folded lines are different')
+
+        print('%d events, %d lines, %d bytes' % (len(texts), len(lines), sum(map(len, output))))
+        t0 = min(timeit.repeat(lambda: [ naive_encode(l) for l in lines ], number=1, repeat=options['repeat']))
+        t1 = min(timeit.repeat(lambda: [ ical.encode(l) for l in lines ], number=1, repeat=options['repeat']))
+        print('%-10s naive %8.3fs / new %8.3fs / x%.1f' % ('encode', t0, t1, t0 / t1))
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+import datetime
+import random
+import timeit
+from collections import defaultdict
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from conference import models
+from conference.intervals import EventIndex, overlap
+from conference.utils import TimeTable2
+
+
+def synthetic_events(count, days=5, seed=0):
+    """
+    Builds (without saving them) the events of a synthetic conference.
+    """
+    rnd = random.Random(seed)
+    schedules = [
+        models.Schedule(id=ix + 1, date=datetime.date(2018, 7, 23) + datetime.timedelta(days=ix))
+        for ix in range(days)
+    ]
+    events = []
+    for ix in range(count):
+        start = rnd.randrange(9 * 60, 19 * 60, 15)
+        events.append(models.Event(
+            id=ix + 1,
+            schedule=schedules[ix % days],
+            start_time=datetime.time(start // 60, start % 60),
+            duration=rnd.choice((15, 30, 45, 60, 90, 180)),
+        ))
+    return events
+
+
+def synthetic_timetable(count, tracks=4, seed=0):
+    """
+    Builds the TimeTable2 events (dict track -> list(events)) of a single
+    synthetic day with `count` events.
+    """
+    events = defaultdict(list)
+    for ix, e in enumerate(synthetic_events(count, days=1, seed=seed)):
+        track = 'track%d' % (ix % tracks)
+        events[track].append({
+            'id': e.id,
+            'time': datetime.datetime.combine(e.schedule.date, e.start_time),
+            'duration': e.duration,
+            'tracks': [ track ],
+            'tags': set(['special']) if ix % 10 == 0 else set(),
+        })
+    for evs in events.values():
+        evs.sort(key=lambda x: x['time'])
+    return dict(events)
+
+
+def naive_intersections(events, tracks):
+    """
+    The pairwise implementation of the intersection counts of
+    `TimeTable2._analyze`, used as reference; returns a dict id(event) ->
+    count.
+    """
+    intersections = defaultdict(int)
+    for t in tracks:
+        timeline = []
+        for e in events.get(t, []):
+            row = (e['time'], e['time'] + datetime.timedelta(seconds=e['duration'] * 60), id(e))
+            timeline.append(row)
+        for ix, e1 in enumerate(timeline):
+            for e2 in timeline[ix+1:]:
+                latest_start = max(e1[0], e2[0])
+                earliest_end = min(e1[1], e2[1])
+                overlap = (earliest_end - latest_start)
+                if overlap.seconds > 0 and overlap.days >= 0:
+                    intersections[e1[2]] += 1
+                    intersections[e2[2]] += 1
+    return intersections
+
+
+def analyze_timetable(events, tracks):
+    tt = TimeTable2(None, dict((t, list(v)) for t, v in events.items()), tracks=tracks)
+    tt._analyze()
+
+
+def naive_group_events_by_times(events, event=None):
+    """
+    The pairwise implementation of `EventManager.group_events_by_times`, used
+    as reference.
+    """
+    def extract_group(event, events):
+        group = []
+        r0 = event.get_time_range()
+        for ix in reversed(range(len(events))):
+            r1 = events[ix].get_time_range()
+            if r0[0].date() == r1[0].date() and overlap(r0, r1):
+                group.append(events.pop(ix))
+        return group
+
+    if event:
+        group = extract_group(event, list(events))
+        yield group
+    else:
+        sorted_events = sorted(
+            filter(lambda x: x.get_duration() > 0, events),
+            key=lambda x: x.get_duration())
+        while sorted_events:
+            evt0 = sorted_events.pop()
+            group = [evt0] + extract_group(evt0, sorted_events)
+            yield group
+
+
+def naive_attendance_groups(events):
+    by_day = defaultdict(set)
+    for e in events:
+        by_day[e.schedule_id].add(e)
+    for e in events:
+        list(naive_group_events_by_times(by_day[e.schedule_id], event=e))
+
+
+def attendance_groups(events):
+    by_day = defaultdict(set)
+    for e in events:
+        by_day[e.schedule_id].add(e)
+    index = dict((sid, EventIndex(v)) for sid, v in by_day.items())
+    for e in events:
+        index[e.schedule_id].overlapping(e)
+
+
+class Command(BaseCommand):
+    """
+    Compares the pairwise overlap computations of the events with the
+    indexed ones on synthetic conferences of growing size.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--events',
+            action='store',
+            dest='events',
+            default='50,500,5000',
+            help='Comma separated sizes (number of events) of the synthetic conferences',
+        ),
+        make_option('--repeat',
+            action='store',
+            dest='repeat',
+            default=3,
+            type='int',
+        ),
+    )
+    def handle(self, *args, **options):
+        for size in options['events'].split(','):
+            self.benchmark(int(size), options['repeat'])
+
+    def benchmark(self, size, repeat):
+        events = synthetic_events(size)
+        day = synthetic_timetable(size)
+        tracks = sorted(day)
+        cases = (
+            ('TimeTable2._analyze',
+                lambda: naive_intersections(day, tracks),
+                lambda: analyze_timetable(day, tracks)),
+            ('group_events_by_times',
+                lambda: list(naive_group_events_by_times(events)),
+                lambda: list(models.Event.objects.group_events_by_times(events))),
+            ('expected_attendance groups',
+                lambda: naive_attendance_groups(events),
+                lambda: attendance_groups(events)),
+        )
+        print('%d events' % size)
+        for name, naive, indexed in cases:
+            t0 = min(timeit.repeat(naive, number=1, repeat=repeat))
+            t1 = min(timeit.repeat(indexed, number=1, repeat=repeat))
+            print('  %-30s naive %8.3fs / indexed %8.3fs / x%.1f' % (name, t0, t1, t0 / t1))
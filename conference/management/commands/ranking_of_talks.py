@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from django.core.management.base import BaseCommand, CommandError
 from conference import models
+from conference import settings
 from conference import utils
 
 from collections import defaultdict
@@ -11,7 +12,7 @@ class Command(BaseCommand):
         make_option('--missing-vote',
             action='store',
             dest='missing_vote',
-            default=0,
+            default=None,
             type='float',
             help='Used whed a user didn\'t vote a talk',
         ),
@@ -19,7 +20,7 @@ class Command(BaseCommand):
             action='store_true',
             dest='show_input',
             default=False,
-            help='Show the input data piped to votengine',
+            help='Show the input data in the voteengine format',
         ),
     )
     def handle(self, *args, **options):
@@ -30,6 +31,8 @@ class Command(BaseCommand):
 
         talks = models.Talk.objects\
             .filter(conference=conference, status='proposed')
+        if options['missing_vote'] is None:
+            options['missing_vote'] = settings.VOTING_MISSING_VOTE
         if options['show_input']:
             print utils._input_for_ranking_of_talks(talks, missing_vote=options['missing_vote'])
         else:
@@ -0,0 +1,18 @@
+# -*- coding: UTF-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+from conference import models
+
+class Command(BaseCommand):
+    """
+    Recomputes from the votes the pairwise preferences of the talks; needed
+    only if CONFERENCE_VOTING_MISSING_VOTE is changed, the preferences are
+    otherwise updated at every vote.
+    """
+    args = '<conference>'
+
+    def handle(self, *args, **options):
+        try:
+            conference = args[0]
+        except IndexError:
+            raise CommandError('conference not specified')
+        models.TalkPreference.objects.rebuild(conference)
@@ -0,0 +1,25 @@
+# -*- coding: UTF-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+from conference import dataaccess
+from conference import models
+
+class Command(BaseCommand):
+    """
+    Recomputes the stored daily sales of the past conferences (all of them if
+    none is specified); needed after a change of the orders of a conference
+    already ended, the sales are otherwise stored at their first use.
+    """
+    args = '<conference> ...'
+
+    def handle(self, *args, **options):
+        conferences = models.Conference.objects.all()
+        if args:
+            conferences = conferences.filter(code__in=args)
+            missing = set(args) - set(c.code for c in conferences)
+            if missing:
+                raise CommandError('unknown conference: %s' % ', '.join(sorted(missing)))
+        for c in conferences:
+            models.TicketSales.objects.rebuild(c.code)
+            sales = models.TicketSales.objects.sales(c.code)
+            dataaccess.ticket_sales.set_in_cache((c.code,), sales)
+            self.stdout.write('%s: %d tickets sold' % (c.code, sum(x[2] for x in sales)))
@@ -0,0 +1,36 @@
+# -*- coding: UTF-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from conference import mailing
+from conference import models
+from conference import settings
+
+class Command(BaseCommand):
+    """
+    Sends the mailings queued from the admin (attendee stats), one after the
+    other; run periodically by cron.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk',
+            action='store',
+            dest='chunk',
+            default=settings.ADMIN_TICKETS_STATS_EMAIL_CHUNK,
+            type='int',
+            help='Number of messages rendered and sent together',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if options['chunk'] < 1:
+            raise CommandError('chunk must be positive')
+        while True:
+            m = models.AdminMailing.objects.claim()
+            if m is None:
+                break
+            if not mailing.send_mailing(m, chunk_size=options['chunk']):
+                self.stdout.write('%s: reclaimed by another worker' % m.subject)
+                continue
+            m = models.AdminMailing.objects.get(id=m.id)
+            self.stdout.write('%s: %d/%d messages sent' % (m.subject, m.sent, m.total))
@@ -0,0 +1,43 @@
+# -*- coding: UTF-8 -*-
+from django.core.exceptions import MiddlewareNotUsed
+
+from conference import cachef
+from conference import dataaccess
+from conference import settings as csettings
+
+
+class BatchScope(object):
+    """
+    Opens a batch scope (see `conference.dataaccess.DataLoader`) for every
+    request, in this way the data loaded while rendering a page is fetched in
+    bulk and only once.
+    """
+    def process_request(self, request):
+        dataaccess.open_batch_scope()
+
+    def process_response(self, request, response):
+        dataaccess.close_batch_scope()
+        return response
+
+
+class CacheStats(object):
+    """
+    Adds to every response an `X-Cache-Stats` header with the hits and the
+    misses of the cached functions, and the time and the queries spent by the
+    misses, while serving the request.
+
+    Enabled by `CONFERENCE_CACHE_STATS_HEADER`.
+    """
+    def __init__(self):
+        if not (csettings.CACHE_STATS and csettings.CACHE_STATS_HEADER):
+            raise MiddlewareNotUsed()
+
+    def process_request(self, request):
+        cachef.open_stats_scope()
+
+    def process_response(self, request, response):
+        totals = cachef.close_stats_scope()
+        if totals is not None:
+            response['X-Cache-Stats'] = 'hits=%d misses=%d queries=%d time=%.1fms' % (
+                totals['hits'], totals['misses'], totals['queries'], totals['time'] * 1000)
+        return response
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def populate_talk_preferences(apps, schema_editor):
+    from conference import schulze
+    from conference import settings
+
+    VotoTalk = apps.get_model('conference', 'VotoTalk')
+    TalkPreference = apps.get_model('conference', 'TalkPreference')
+    ballots = defaultdict(dict)
+    votes = VotoTalk.objects.values_list('talk__conference', 'user', 'talk', 'vote')
+    for conference, uid, tid, vote in votes:
+        ballots[(conference, uid)][tid] = vote
+    terms = defaultdict(dict)
+    for (conference, uid), ballot in ballots.items():
+        schulze.add_terms(terms[conference], schulze.ballot_terms(ballot, settings.VOTING_MISSING_VOTE))
+    TalkPreference.objects.bulk_create([
+        TalkPreference(conference=conference, talk=talk, other=other, count=count)
+        for conference, t in terms.items()
+        for (talk, other), count in t.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conference', '0005_add_captcha_question'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TalkPreference',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('conference', models.CharField(max_length=20)),
+                ('talk', models.IntegerField(null=True)),
+                ('other', models.IntegerField(null=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='talkpreference',
+            index_together=set([('conference', 'talk', 'other')]),
+        ),
+        migrations.RunPython(populate_talk_preferences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conference', '0006_talk_preference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketSales',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('conference', models.CharField(max_length=20)),
+                ('ticket_type', models.CharField(max_length=10)),
+                ('date', models.DateField()),
+                ('tickets', models.IntegerField(default=0)),
+                ('frozen', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='ticketsales',
+            unique_together=set([('conference', 'ticket_type', 'date')]),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import ast
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+def import_email_log(apps, schema_editor):
+    """
+    Imports the mailings of the old flat file log (four lines for every
+    mailing: from, subject and body repr()s and a separator).
+    """
+    path = getattr(settings, 'CONFERENCE_ADMIN_TICKETS_STATS_EMAIL_LOG', None)
+    try:
+        lines = open(path).read().splitlines() if path else []
+    except IOError:
+        lines = []
+    AdminMailing = apps.get_model('conference', 'AdminMailing')
+    mailings = []
+    for ix in range(0, len(lines) - 2, 4):
+        try:
+            sender, subject, body = [ ast.literal_eval(x).strip() for x in lines[ix:ix + 3] ]
+        except (ValueError, SyntaxError, AttributeError):
+            break
+        mailings.append(AdminMailing(sender=sender, subject=subject, body=body, status='sent'))
+    AdminMailing.objects.bulk_create(mailings)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('conference', '0007_ticket_sales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdminMailing',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, verbose_name='created', editable=False)),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, verbose_name='modified', editable=False)),
+                ('sender', models.EmailField(max_length=50)),
+                ('subject', models.CharField(max_length=200)),
+                ('body', models.TextField()),
+                ('conference', models.CharField(max_length=20)),
+                ('feedback_address', models.EmailField(max_length=254, blank=True)),
+                ('status', models.CharField(default=b'queued', max_length=10, choices=[(b'queued', 'Queued'), (b'sending', 'Sending'), (b'sent', 'Sent'), (b'failed', 'Failed')])),
+                ('total', models.IntegerField(default=0)),
+                ('sent', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('author', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, blank=True, to=settings.AUTH_USER_MODEL, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AdminMailingRecipient',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('sent', models.BooleanField(default=False)),
+                ('mailing', models.ForeignKey(related_name='recipients', to='conference.AdminMailing')),
+                ('user', models.ForeignKey(related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='adminmailingrecipient',
+            unique_together=set([('mailing', 'user')]),
+        ),
+        migrations.RunPython(import_email_log, migrations.RunPython.noop),
+    ]
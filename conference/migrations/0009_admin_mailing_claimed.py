@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conference', '0008_admin_mailing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adminmailing',
+            name='claimed',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+    ]
@@ -1,5 +1,6 @@
 # -*- coding: UTF-8 -*-
 import datetime
+import operator
 import os
 import os.path
 import subprocess
@@ -14,6 +15,7 @@ from django.db import transaction
 from django.db.models.query import QuerySet
 from django.db.models.signals import post_save
 from django.template.defaultfilters import slugify
+from django.utils import timezone
 from django.utils.deconstruct import deconstructible
 from django.utils.translation import ugettext as _
 
@@ -26,7 +28,9 @@ from tagging.fields import TagField
 
 import conference
 import conference.gmap
-from . import settings, signals
+from . import schulze, settings, signals
+from .attendance import AttendanceMatrix
+from .intervals import EventIndex
 
 from taggit.models import TagBase, GenericTaggedItemBase, ItemBase
 from taggit.managers import TaggableManager
@@ -919,6 +923,115 @@ class Ticket(models.Model):
     def __unicode__(self):
         return 'Ticket "%s" (%s)' % (self.fare.name, self.fare.code)
 
+class TicketSalesManager(models.Manager):
+    def daily_sales(self, conference):
+        """
+        The tickets sold every day for the conference, grouped by the database
+        on the fare type and the (UTC) date of the order: a list of
+        (ticket_type, date, tickets, frozen), `frozen` is how many of the
+        `tickets` are frozen.
+        """
+        from django.db import connection
+        from assopy.models import Order
+
+        column = '%s.%s' % (
+            connection.ops.quote_name(Order._meta.db_table),
+            connection.ops.quote_name('created'))
+        day, params = connection.ops.datetime_trunc_sql('day', column, 'UTC')
+        rows = Ticket.objects\
+            .filter(fare__conference=conference)\
+            .filter(models.Q(orderitem__order___complete=True) | models.Q(orderitem__order__method__in=('bank', 'admin')))\
+            .extra(select={'day': day}, select_params=params)\
+            .values('fare__ticket_type', 'day')\
+            .annotate(
+                tickets=models.Count('id'),
+                frozen=models.Sum(models.Case(
+                    models.When(frozen=True, then=1),
+                    default=0,
+                    output_field=models.IntegerField())))\
+            .order_by()
+        output = []
+        for r in rows:
+            date = r['day']
+            # sqlite returns a string, postgres a naive datetime
+            if isinstance(date, basestring):
+                date = datetime.datetime.strptime(date[:10], '%Y-%m-%d')
+            output.append((r['fare__ticket_type'], date.date(), r['tickets'], r['frozen'] or 0))
+        return output
+
+    def sales(self, conference):
+        """
+        As `daily_sales`; the sales of a past conference never change, they
+        are computed once and stored.
+        """
+        rows = list(self\
+            .filter(conference=conference)\
+            .values_list('ticket_type', 'date', 'tickets', 'frozen'))
+        if rows:
+            return rows
+        rows = self.daily_sales(conference)
+        end = Conference.objects\
+            .filter(code=conference)\
+            .values_list('conference_end', flat=True)\
+            .first()
+        if end and end < datetime.date.today():
+            from django.db import IntegrityError
+            try:
+                with transaction.atomic():
+                    self.bulk_create([
+                        TicketSales(conference=conference, ticket_type=tt, date=date, tickets=tickets, frozen=frozen)
+                        for tt, date, tickets, frozen in rows
+                    ])
+            except IntegrityError:
+                # stored by a concurrent request, the rows are the same
+                pass
+        return rows
+
+    def rebuild(self, conference):
+        """
+        Throws away the stored sales of the conference; they are computed
+        again at the next call of `sales`.
+        """
+        self.filter(conference=conference).delete()
+
+    def curve(self, conference, sales=None, frozen=False):
+        """
+        The sales of the conference (the result of `sales` if not passed)
+        as {ticket_type: [(days since the start of the conference, tickets)]};
+        the frozen tickets are counted only if `frozen` is True.
+        """
+        if sales is None:
+            sales = self.sales(conference.code)
+        data = {
+            'conference': defaultdict(lambda: 0),
+            'partner': defaultdict(lambda: 0),
+            'event': defaultdict(lambda: 0),
+            'other': defaultdict(lambda: 0),
+        }
+        for tt, date, tickets, nfrozen in sales:
+            if not frozen:
+                tickets -= nfrozen
+            if tickets:
+                data.setdefault(tt, defaultdict(lambda: 0))
+                data[tt][(date - conference.conference_start).days] += tickets
+        return dict((k, sorted(v.items())) for k, v in data.items())
+
+class TicketSales(models.Model):
+    """
+    Daily rollup of the tickets sold for a past conference, see
+    `TicketSalesManager.sales`.
+    """
+    conference = models.CharField(max_length=20)
+    ticket_type = models.CharField(max_length=10)
+    date = models.DateField()
+    tickets = models.IntegerField(default=0)
+    frozen = models.IntegerField(default=0)
+
+    objects = TicketSalesManager()
+
+    class Meta:
+        unique_together = (('conference', 'ticket_type', 'date'),)
+
 class Sponsor(models.Model):
     """
     Through the list of SponsorIncome instance of Sponsor it is connected
@@ -989,58 +1102,71 @@ class ScheduleManager(models.Manager):
         """
         return settings.SCHEDULE_ATTENDEES(conference, forecast)
 
-    def events_score_by_attendance(self, conference):
+    def attendance_rows(self, conference, users=None):
         """
-        Using events Interest returns a "Presence score" for each event;
-        The score is proportional to the number of people who have expressed
-        interest in that event.
+        Returns the events of `conference` each user is interested in, a dict
+        user id -> set of event ids; `users` restricts the result to those
+        users.
         """
         # I consider it an expression of interest, interest > 0, as the will to
-        # participate in an event and add the user among the participants. If the user
-        # has voted the most contemporary events. I consider his presence in proportion
-        # (so events can have fractional score)
-        events = defaultdict(set)
-        for x in EventInterest.objects\
-                    .filter(event__schedule__conference=conference, interest__gt=0)\
-                    .select_related('event__schedule'):
-            events[x.event].add(x.user_id)
+        # participate in an event and add the user among the participants.
         # In addition to EventInterest keep account of EventBooking,
         # the confidence in these cases in even greater.
-        for x in EventBooking.objects\
-                    .filter(event__schedule__conference=conference)\
-                    .select_related('event__schedule'):
-            events[x.event].add(x.user_id)
-
-        # Associate to each event the number of votes it has obtained;
-        # the operation is complicated by the fact that not all votes have the
-        # same weight; if a user has marked as +1 two events to occur
-        # Parallel obviously can not participate in both, so the
-        # his vote should be scaled
-        scores = defaultdict(lambda: 0.0)
+        interests = EventInterest.objects\
+            .filter(event__schedule__conference=conference, interest__gt=0)
+        bookings = EventBooking.objects\
+            .filter(event__schedule__conference=conference)
+        if users is not None:
+            interests = interests.filter(user__in=users)
+            bookings = bookings.filter(user__in=users)
+        rows = defaultdict(set)
+        for qs in (interests, bookings):
+            for uid, eid in qs.values_list('user', 'event'):
+                rows[uid].add(eid)
+        return rows
+
+    def attendance_matrix(self, conference):
+        """
+        Returns the AttendanceMatrix of the conference.
+        """
+        events = Event.objects\
+            .filter(schedule__conference=conference)\
+            .select_related('schedule', 'talk')\
+            .order_by('id')
+        matrix = AttendanceMatrix(events)
+        matrix.set_rows(self.attendance_rows(conference))
+        return matrix
+
+    def events_score_by_attendance(self, conference, matrix=None):
+        """
+        Using events Interest returns a "Presence score" for each event;
+        The score is proportional to the number of people who have expressed
+        interest in that event.
+        """
+        # If the user has voted the most contemporary events. I consider his
+        # presence in proportion (so events can have fractional score)
+        if matrix is None:
+            matrix = self.attendance_matrix(conference)
+        return matrix.scores()
+
+    def score_events(self, events):
+        """
+        Computes the "presence score" of the events; `events` is a dict
+        event -> set of user ids interested in the event, the events are
+        processed in the iteration order of the dict.
+        """
+        matrix = AttendanceMatrix(events)
+        rows = defaultdict(set)
         for evt, users in events.items():
-            group = list(Event.objects.group_events_by_times(events, event=evt))[0]
-            while users:
-                u = users.pop()
-                # what is the presence of `` evt` u` for the event? If `u` does not take
-                # part in no other event of the same group, then 1, otherwise a value proportional
-                # to the number of events of interest.
-                found = [ evt ]
-                for other in group:
-                    if other != evt:
-                        try:
-                            events[other].remove(u)
-                        except KeyError:
-                            pass
-                        else:
-                            found.append(other)
-                score = 1.0 / len(found)
-                for f in found:
-                    scores[f.id] += score
-        return scores
-
-    def expected_attendance(self, conference, factor=0.85):
+            for u in users:
+                rows[u].add(evt.id)
+        matrix.set_rows(rows)
+        return matrix.scores()
+
+    def expected_attendance(self, conference, factor=0.85, matrix=None):
         """
-        Return for each event prediction of participation based on EventInterest
+        Return for each event prediction of participation based on EventInterest;
+        `matrix` is the (possibly cached) AttendanceMatrix of the conference.
         """
         seats_available = defaultdict(lambda: 0)
         for row in EventTrack.objects\
@@ -1048,10 +1174,10 @@ class ScheduleManager(models.Manager):
                     .values('event', 'track__seats'):
             seats_available[row['event']] += row['track__seats']
 
-        scores = self.events_score_by_attendance(conference)
+        scores = self.events_score_by_attendance(conference, matrix=matrix)
         events = Event.objects\
             .filter(schedule__conference=conference)\
-            .select_related('schedule')
+            .select_related('schedule', 'talk')
 
         output = {}
         # Now I have to make the forecast of the participants for each event,
@@ -1066,13 +1192,15 @@ class ScheduleManager(models.Manager):
         event_by_day = defaultdict(set)
         for e in events:
             event_by_day[e.schedule_id].add(e)
+        index_by_day = {}
+        for sid, day_events in event_by_day.items():
+            index_by_day[sid] = EventIndex(day_events)
 
         for event in events:
             score = scores[event.id]
-            group = list(Event.objects\
-                .group_events_by_times(event_by_day[event.schedule_id], event=event))[0]
+            group = index_by_day[event.schedule_id].overlapping(event)
 
-            group_score = sum([ scores[e.id] for e in group ])
+            group_score = sum([ scores[e.id] for e in reversed(group) ])
             if group_score:
                 k = score / group_score
             else:
@@ -1134,32 +1262,25 @@ class EventManager(models.Manager):
         Groups the events, obviously belonging to different track, which they overlap in time.
         Return a generator that at each iteration returns a group (list) of events.
         """
-        def overlap(range1, range2):
-            # http://stackoverflow.com/questions/9044084/efficient-data-range-overlap-calculation-in-python
-            latest_start = max(range1[0], range2[0])
-            earliest_end = min(range1[1], range2[1])
-            _overlap = (earliest_end - latest_start)
-            return _overlap.days == 0 and _overlap.seconds > 0
-
-        def extract_group(event, events):
-            group = []
-            r0 = event.get_time_range()
-            for ix in reversed(range(len(events))):
-                r1 = events[ix].get_time_range()
-                if r0[0].date() == r1[0].date() and overlap(r0, r1):
-                    group.append(events.pop(ix))
-            return group
-
         if event:
-            group = extract_group(event, list(events))
+            group = EventIndex(events).overlapping(event)
+            group.reverse()
             yield group
         else:
             sorted_events = sorted(
                 filter(lambda x: x.get_duration() > 0, events),
                 key=lambda x: x.get_duration())
-            while sorted_events:
-                evt0 = sorted_events.pop()
-                group = [evt0] + extract_group(evt0, sorted_events)
+            index = EventIndex(sorted_events)
+            grouped = set()
+            for evt0 in reversed(sorted_events):
+                if evt0 in grouped:
+                    continue
+                grouped.add(evt0)
+                group = [evt0]
+                for e in reversed(index.overlapping(evt0)):
+                    if e not in grouped:
+                        grouped.add(e)
+                        group.append(e)
                 yield group
 
 class Event(models.Model):
@@ -1417,15 +1538,181 @@ class Quote(models.Model):
     class Meta:
         ordering = ['conference', 'who']
 
+class VotoTalkManager(models.Manager):
+    def set_votes(self, uid, conference, votes):
+        """
+        Saves in a single transaction the votes of the user `uid`; `votes` is
+        a dict talk id -> vote, a false vote removes the vote for the talk.
+
+        The votes are written in bulk so no signal is sent for the single
+        votes; at the end `signals.votes_changed` is sent once.
+        """
+        with transaction.atomic():
+            existing = dict(
+                (talk, (pk, vote)) for pk, talk, vote in self\
+                    .select_for_update()\
+                    .filter(user=uid, talk__conference=conference)\
+                    .values_list('id', 'talk', 'vote'))
+            old_ballot = dict((talk, x[1]) for talk, x in existing.items())
+            new_ballot = dict(old_ballot)
+            create = []
+            update = defaultdict(list)
+            delete = []
+            for tid, vote in votes.items():
+                if tid in existing:
+                    pk, old = existing[tid]
+                    if not vote:
+                        delete.append(pk)
+                        del new_ballot[tid]
+                    elif vote != old:
+                        update[vote].append(pk)
+                        new_ballot[tid] = vote
+                elif vote:
+                    create.append(VotoTalk(user_id=uid, talk_id=tid, vote=vote))
+                    new_ballot[tid] = vote
+            if delete:
+                # VotoTalk has no dependent objects, so there is no cascade
+                self.filter(id__in=delete)._raw_delete(self.db)
+            for vote, pks in update.items():
+                self.filter(id__in=pks).update(vote=vote)
+            self.bulk_create(create)
+            TalkPreference.objects.ballot_changed(conference, old_ballot, new_ballot)
+        signals.votes_changed.send(sender=VotoTalk, user_id=uid, conference=conference)
+        return new_ballot
+
 class VotoTalk(models.Model):
     user = models.ForeignKey('auth.User')
     talk = models.ForeignKey(Talk)
     vote = models.DecimalField(max_digits=5, decimal_places=2)
 
+    objects = VotoTalkManager()
+
     class Meta:
         unique_together = (('user', 'talk'),)
         verbose_name = 'Talk voting'
         verbose_name_plural = 'Talk votings'
+
+class TalkPreferenceManager(models.Manager):
+    def user_ballot(self, uid, conference):
+        return dict(VotoTalk.objects\
+            .filter(user=uid, talk__conference=conference)\
+            .values_list('talk', 'vote'))
+
+    def add_terms(self, conference, terms):
+        """
+        Adds the terms (see `conference.schulze.ballot_terms`) to the stored
+        ones.
+        """
+        keys = terms.keys()
+        existing = {}
+        for ix in range(0, len(keys), 100):
+            q = reduce(operator.or_, [
+                models.Q(talk=talk, other=other) for talk, other in keys[ix:ix + 100]
+            ])
+            for pk, talk, other in self.filter(q, conference=conference).values_list('id', 'talk', 'other'):
+                existing[(talk, other)] = pk
+        update = defaultdict(list)
+        create = []
+        for (talk, other), count in terms.items():
+            try:
+                update[count].append(existing[(talk, other)])
+            except KeyError:
+                create.append(TalkPreference(conference=conference, talk=talk, other=other, count=count))
+        for count, pks in update.items():
+            for ix in range(0, len(pks), 500):
+                self.filter(id__in=pks[ix:ix + 500]).update(count=models.F('count') + count)
+        self.bulk_create(create)
+
+    def ballot_changed(self, conference, old, new):
+        """
+        Updates the preferences after a ballot (dict talk id -> vote) of a user
+        is changed from `old` to `new`.
+
+        Only the terms of the changed talks are computed, as in
+        `vote_changed`; every changed talk is removed from the ballots once
+        processed, so the pairs of two changed talks are counted once.
+        """
+        missing = settings.VOTING_MISSING_VOTE
+        old = dict(old)
+        new = dict(new)
+        changed = [ tid for tid in set(old) | set(new) if old.get(tid) != new.get(tid) ]
+        terms = {}
+        for tid in changed:
+            schulze.add_terms(terms, schulze.ballot_terms(old, missing, candidate=tid), -1)
+            schulze.add_terms(terms, schulze.ballot_terms(new, missing, candidate=tid))
+            old.pop(tid, None)
+            new.pop(tid, None)
+        self.add_terms(conference, terms)
+
+    def vote_changed(self, uid, talk, old, new):
+        """
+        Updates the preferences after the vote of the user `uid` for `talk` is
+        changed from `old` to `new` (None if there is no vote).
+        """
+        ballot = self.user_ballot(uid, talk.conference)
+        ballot.pop(talk.id, None)
+        missing = settings.VOTING_MISSING_VOTE
+        terms = {}
+        if old is not None:
+            ballot[talk.id] = old
+            schulze.add_terms(terms, schulze.ballot_terms(ballot, missing, candidate=talk.id), -1)
+        if new is not None:
+            ballot[talk.id] = new
+            schulze.add_terms(terms, schulze.ballot_terms(ballot, missing, candidate=talk.id))
+        self.add_terms(talk.conference, terms)
+
+    def rebuild(self, conference):
+        """
+        Recomputes the preferences of the conference from all the votes.
+        """
+        ballots = defaultdict(dict)
+        votes = VotoTalk.objects\
+            .filter(talk__conference=conference)\
+            .values_list('user', 'talk', 'vote')
+        for uid, tid, vote in votes:
+            ballots[uid][tid] = vote
+        terms = {}
+        for ballot in ballots.values():
+            schulze.add_terms(terms, schulze.ballot_terms(ballot, settings.VOTING_MISSING_VOTE))
+        with transaction.atomic():
+            self.filter(conference=conference).delete()
+            self.bulk_create([
+                TalkPreference(conference=conference, talk=talk, other=other, count=count)
+                for (talk, other), count in terms.items()
+            ])
+
+    def pairwise_preferences(self, talks):
+        """
+        Returns the pairwise preferences matrix (see
+        `conference.schulze.pairwise_preferences`) of the talks.
+        """
+        terms = {}
+        conferences = set(t.conference for t in talks)
+        rows = self\
+            .filter(conference__in=conferences)\
+            .values_list('talk', 'other')\
+            .annotate(models.Sum('count'))
+        for talk, other, count in rows:
+            terms[(talk, other)] = count
+        return schulze.preferences([ t.id for t in talks ], terms)
+
+class TalkPreference(models.Model):
+    """
+    Pairwise preferences of the talk voting, decomposed in the terms of
+    `conference.schulze.ballot_terms`: (talk, None), (None, other) and
+    (talk, other); the terms are updated at every change of a VotoTalk.
+    """
+    conference = models.CharField(max_length=20)
+    # talk ids, not foreign keys: the terms of a deleted talk are never used
+    # again and must not be touched by the cascade
+    talk = models.IntegerField(null=True)
+    other = models.IntegerField(null=True)
+    count = models.IntegerField(default=0)
+
+    objects = TalkPreferenceManager()
+
+    class Meta:
+        index_together = (('conference', 'talk', 'other'),)
 #
 #def _clear_track_cache(sender, **kwargs):
 #    if hasattr(sender, 'schedule_id'):
@@ -1502,3 +1789,90 @@ class CaptchaQuestion(TimeStampedModel):
 
     def __str__(self):
         return self.question
+
+
+ADMIN_MAILING_STATUS = Choices(
+    ('queued', _('Queued')),
+    ('sending', _('Sending')),
+    ('sent', _('Sent')),
+    ('failed', _('Failed')),
+)
+
+class AdminMailingManager(models.Manager):
+    def queue(self, sender, subject, body, uids, conference, author=None, feedback_address=''):
+        """
+        Queues a mailing to the users `uids`, the messages are sent by the
+        `send_admin_mailings` command.
+        """
+        uids = set(uids)
+        with transaction.atomic():
+            mailing = self.create(
+                sender=sender, subject=subject, body=body, conference=conference,
+                author=author, feedback_address=feedback_address, total=len(uids))
+            AdminMailingRecipient.objects.bulk_create([
+                AdminMailingRecipient(mailing=mailing, user_id=uid) for uid in uids
+            ])
+        return mailing
+
+    def claimable(self):
+        """
+        The mailings that can be claimed: the queued ones and those left
+        in `sending` by a worker that has not reported any progress for
+        ADMIN_TICKETS_STATS_EMAIL_CLAIM_TIMEOUT seconds (killed).
+        """
+        stale = timezone.now() - datetime.timedelta(seconds=settings.ADMIN_TICKETS_STATS_EMAIL_CLAIM_TIMEOUT)
+        return self.filter(
+            models.Q(status=ADMIN_MAILING_STATUS.queued) |
+            models.Q(status=ADMIN_MAILING_STATUS.sending, claimed__lt=stale))
+
+    def claim(self):
+        """
+        Returns the oldest claimable mailing, marked as being sent; None if
+        there is nothing to send. Two workers never claim the same mailing.
+        """
+        pending = self.claimable()\
+            .order_by('created')\
+            .values_list('id', flat=True)
+        for pk in pending:
+            claimed = self.claimable()\
+                .filter(id=pk)\
+                .update(status=ADMIN_MAILING_STATUS.sending, claimed=timezone.now())
+            if claimed:
+                return self.get(id=pk)
+        return None
+
+class AdminMailing(TimeStampedModel):
+    """
+    A mailing sent from the admin (attendee stats) to a list of users; it is
+    also the log of the mailings shown in the admin.
+    """
+    sender = models.EmailField(max_length=50)
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    # the conference passed to the templates
+    conference = models.CharField(max_length=20)
+    author = models.ForeignKey(
+        'auth.User', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    feedback_address = models.EmailField(blank=True)
+    status = models.CharField(
+        max_length=10, choices=ADMIN_MAILING_STATUS, default=ADMIN_MAILING_STATUS.queued)
+    # when the worker sending the mailing has claimed it or last reported
+    # its progress
+    claimed = models.DateTimeField(null=True, blank=True)
+    total = models.IntegerField(default=0)
+    sent = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    objects = AdminMailingManager()
+
+    def __unicode__(self):
+        return self.subject
+
+class AdminMailingRecipient(models.Model):
+    mailing = models.ForeignKey(AdminMailing, related_name='recipients')
+    user = models.ForeignKey('auth.User', related_name='+')
+    # the recipients already sent are skipped if the mailing is sent again
+    sent = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = (('mailing', 'user'),)
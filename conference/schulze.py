@@ -0,0 +1,211 @@
+# -*- coding: UTF-8 -*-
+"""
+Schulze method, the same computation of `voteengine.py -m schulze` (margins
+and ties broken with a tiebreaker list of the candidates) without going
+through its text format.
+
+The candidates are identified by their index, a ballot is a dict
+index -> score (the higher the better); the candidates missing from a ballot
+get the `missing` score.
+
+NumPy is used when available; the pure Python implementation gives the same
+results.
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def ballot_terms(ballot, missing=0, candidate=None):
+    """
+    Returns the contribution of `ballot` to the pairwise preferences as a
+    dict of terms:
+
+        (i, None) -> `i` is preferred to every candidate missing from the ballot
+        (None, j) -> every candidate missing from the ballot is preferred to `j`
+        (i, j)    -> the correction for `i` and `j`, both in the ballot
+
+    The terms do not depend on the set of the candidates (see `preferences`);
+    if `candidate` is given only the terms involving it are returned.
+    """
+    terms = {}
+    if candidate is None:
+        items = ballot.items()
+    elif candidate in ballot:
+        items = [ (candidate, ballot[candidate]) ]
+    else:
+        return terms
+    for i, si in items:
+        above = si > missing
+        if above:
+            terms[(i, None)] = 1
+        elif si < missing:
+            terms[(None, i)] = 1
+        for j, sj in ballot.items():
+            if i == j:
+                continue
+            # the pairs of candidates present in the ballot must not be
+            # counted by the (i, None)/(None, j) terms
+            n = (si > sj) - above - (sj < missing)
+            if n:
+                terms[(i, j)] = n
+            if candidate is not None:
+                n = (sj > si) - (sj > missing) - (si < missing)
+                if n:
+                    terms[(j, i)] = n
+    return terms
+
+
+def add_terms(total, terms, sign=1):
+    """
+    Adds (or subtracts if `sign` is -1) `terms` to `total`.
+    """
+    for k, n in terms.items():
+        total[k] = total.get(k, 0) + sign * n
+        if not total[k]:
+            del total[k]
+    return total
+
+
+def preferences(candidates, terms):
+    """
+    Returns the pairwise preferences matrix of `candidates` (see
+    `pairwise_preferences`) from the sum of the terms of the ballots.
+    """
+    n = len(candidates)
+    index = dict((c, ix) for ix, c in enumerate(candidates))
+    d = [ [0] * n for _ in range(n) ]
+    beats_missing = [0] * n
+    beaten_by_missing = [0] * n
+    for (i, j), count in terms.items():
+        if j is None:
+            if i in index:
+                beats_missing[index[i]] += count
+        elif i is None:
+            if j in index:
+                beaten_by_missing[index[j]] += count
+        elif i in index and j in index:
+            d[index[i]][index[j]] += count
+    for i in range(n):
+        row = d[i]
+        bonus = beats_missing[i]
+        for j in range(n):
+            if i != j:
+                row[j] += bonus + beaten_by_missing[j]
+    return d
+
+
+def pairwise_preferences(n, ballots, missing=0):
+    """
+    Returns the n x n matrix (list of lists) `d` where `d[i][j]` is the number
+    of ballots preferring the candidate `i` to `j`.
+    """
+    if numpy is not None:
+        return _np_pairwise_preferences(n, ballots, missing)
+    # the pairs with a missing candidate are not enumerated; for every ballot
+    # a candidate scored above `missing` beats all the missing candidates and
+    # one scored below is beaten by all of them.
+    terms = {}
+    for ballot in ballots:
+        add_terms(terms, ballot_terms(ballot, missing))
+    return preferences(range(n), terms)
+
+
+def _np_pairwise_preferences(n, ballots, missing):
+    ballots = list(ballots)
+    scores = numpy.empty((len(ballots), n), numpy.float64)
+    scores.fill(missing)
+    for ix, ballot in enumerate(ballots):
+        for i, s in ballot.items():
+            scores[ix, i] = s
+    d = numpy.zeros((n, n), numpy.int64)
+    for i in range(n):
+        d[i] = (scores[:, i:i + 1] > scores).sum(axis=0)
+    return d.tolist()
+
+
+def strongest_paths(d):
+    """
+    Returns the strength of the strongest (widest) paths between every pair of
+    candidates, computed on the margins of the pairwise preferences `d`.
+    """
+    n = len(d)
+    margins = [
+        [ d[i][j] - d[j][i] for j in range(n) ]
+        for i in range(n)
+    ]
+    if numpy is not None:
+        p = numpy.array(margins, numpy.int64).reshape((n, n))
+        for k in range(n):
+            numpy.maximum(p, numpy.minimum.outer(p[:, k], p[k, :]), out=p)
+        return p.tolist()
+    return _widest_paths(margins)
+
+
+def _widest_paths(m):
+    # The strength of the strongest path from i to j is the greatest w such
+    # that j is reachable from i using only the links stronger than w; the
+    # links are added from the strongest one keeping track of the
+    # reachability (as bitsets), when a pair becomes reachable its strength
+    # is the weight of the last added link.
+    n = len(m)
+    p = [ [None] * n for _ in range(n) ]
+    links = sorted(
+        ((m[i][j], i, j) for i in range(n) for j in range(n) if i != j),
+        reverse=True)
+    reach = [0] * n
+    reached_by = [0] * n
+    for w, a, b in links:
+        if reach[a] >> b & 1:
+            continue
+        targets = reach[b] | (1 << b)
+        sources = reached_by[a] | (1 << a)
+        while sources:
+            bit = sources & -sources
+            sources ^= bit
+            x = bit.bit_length() - 1
+            new = targets & ~reach[x]
+            if not new:
+                continue
+            reach[x] |= new
+            row = p[x]
+            while new:
+                bit_y = new & -new
+                new ^= bit_y
+                y = bit_y.bit_length() - 1
+                row[y] = w
+                reached_by[y] |= 1 << x
+    for i in range(n):
+        # as in the Floyd-Warshall algorithm the diagonal starts from 0
+        if p[i][i] is None or p[i][i] < 0:
+            p[i][i] = 0
+    return p
+
+
+def ranking(p, tiebreaker):
+    """
+    Returns the candidates ordered by the strongest paths `p`; the candidates
+    not beaten by any other are ordered by their position in `tiebreaker`.
+    """
+    n = len(p)
+    beaten = [0] * n
+    for i in range(n):
+        for j in range(n):
+            if p[i][j] > p[j][i]:
+                beaten[j] += 1
+    remaining = list(tiebreaker)
+    output = []
+    while remaining:
+        for ix, i in enumerate(remaining):
+            if not beaten[i]:
+                break
+        else:
+            raise ValueError('cyclic preferences')
+        del remaining[ix]
+        output.append(i)
+        pi = p[i]
+        for j in remaining:
+            if pi[j] > p[j][i]:
+                beaten[j] -= 1
+    return output
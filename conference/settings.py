@@ -8,6 +8,21 @@ except AttributeError:
     raise ImproperlyConfigured('Current conference not set (CONFERENCE_CONFERENCE)')
 
 
+# Per-process cache used in front of the django cache by the functions in
+# `conference.dataaccess`; a dict with the `size` (max number of entries),
+# `timeout` and `sync` (seconds between two checks of the shared generation
+# counter) of the cache. None disables it. See `conference.cachef.CacheFunction`.
+CACHE_LOCAL = getattr(settings, 'CONFERENCE_CACHE_LOCAL', None)
+
+# Per-process hit/miss counters, latency histograms and number of queries of
+# the misses of the cached functions, shown in the debug panel. Counting the
+# queries logs the SQL of every miss, so it is meant for development.
+CACHE_STATS = getattr(settings, 'CONFERENCE_CACHE_STATS', False)
+
+# If True `conference.middleware.CacheStats` adds to every response an
+# `X-Cache-Stats` header with the totals of the request.
+CACHE_STATS_HEADER = getattr(settings, 'CONFERENCE_CACHE_STATS_HEADER', False)
+
 TEMPLATE_FOR_AJAX_REQUEST = getattr(settings, 'CONFERENCE_TEMPLATE_FOR_AJAX_REQUEST', True)
 
 GOOGLE_MAPS = getattr(settings, 'CONFERENCE_GOOGLE_MAPS', None)
@@ -48,6 +63,12 @@ VOTING_ALLOWED = getattr(settings, 'CONFERENCE_VOTING_ALLOWED', lambda user: Tru
 
 VOTING_DISALLOWED = getattr(settings, 'CONFERENCE_VOTING_DISALLOWED', None)
 
+# Vote given to the talks not voted by a user when ranking the talks (the
+# same default of the voteengine based ranking); the TalkPreference table is
+# computed with this value, if it is changed the table must be rebuilt
+# (manage.py rebuild_talk_preferences).
+VOTING_MISSING_VOTE = getattr(settings, 'CONFERENCE_VOTING_MISSING_VOTE', 5)
+
 # List of emails to send notification to
 SEND_EMAIL_TO = getattr(settings, 'CONFERENCE_SEND_EMAIL_TO', None)
 
@@ -156,10 +177,15 @@ TALK_SUBMISSION_NOTIFICATION_EMAIL = getattr(
 
 TALK_TYPES_TO_BE_VOTED = getattr(settings, 'CONFERENCE_VOTING_TALK_TYPES', DEFAULT_VOTING_TALK_TYPES)
 
-# absolute path of a file used to log the email sent from the admin (tickets
-# stats section); the log file is also used to show a list of "last recently
-# sent email" in the admin page.
-ADMIN_TICKETS_STATS_EMAIL_LOG = getattr(settings, 'CONFERENCE_ADMIN_TICKETS_STATS_EMAIL_LOG', None)
+# number of messages rendered and sent together by the
+# `send_admin_mailings` command (the emails sent from the admin, tickets stats
+# section); the progress of a mailing is saved after every chunk.
+ADMIN_TICKETS_STATS_EMAIL_CHUNK = getattr(settings, 'CONFERENCE_ADMIN_TICKETS_STATS_EMAIL_CHUNK', 100)
+
+# seconds after which a mailing whose worker has not saved any progress is
+# considered abandoned (the worker has been killed) and is sent by another
+# one; it must be greater than the time needed to send a chunk.
+ADMIN_TICKETS_STATS_EMAIL_CLAIM_TIMEOUT = getattr(settings, 'CONFERENCE_ADMIN_TICKETS_STATS_EMAIL_CLAIM_TIMEOUT', 15 * 60)
 
 ADMIN_TICKETS_STATS_EMAIL_LOAD_LIBRARY = getattr(settings, 'CONFERENCE_ADMIN_TICKETS_STATS_EMAIL_LOAD_LIBRARY', ['conference'])
 
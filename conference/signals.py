@@ -7,3 +7,6 @@ attendees_connected = dispatch.Signal(providing_args=['attendee1', 'attendee2'])
 
 # Issued when an event is booked (booked = True) or if the booking is canceled (booked=False)
 event_booked = dispatch.Signal(providing_args=['booked', 'event_id', 'user_id'])
+
+# Issued when the votes of a user are changed in bulk (VotoTalk.objects.set_votes)
+votes_changed = dispatch.Signal(providing_args=['user_id', 'conference'])
@@ -1276,12 +1276,12 @@ def group_tags(tags):
 
 @register.assignment_tag()
 def talk_data(tid):
-    return dataaccess.talk_data(tid)
+    return dataaccess.talk_loader.load(tid)
 
 @register.simple_tag()
 def event_data(eid):
-    event = dataaccess.event_data(eid)
-    event.update({'schedule':dataaccess.schedule_data(event['schedule_id'])})
+    event = dict(dataaccess.event_loader.load(eid))
+    event['schedule'] = dataaccess.schedule_loader.load(event['schedule_id'])
     return event
 
 @register.assignment_tag()
@@ -1293,7 +1293,7 @@ def talks_data(tids, conference=None):
 
 @register.assignment_tag()
 def schedule_data(sid):
-    return dataaccess.schedule_data(sid)
+    return dataaccess.schedule_loader.load(sid)
 
 @register.assignment_tag()
 def schedules_data(sids):
@@ -1327,7 +1327,7 @@ def admin_urlname_fromct(ct, action, id=None):
 
 @register.simple_tag()
 def profile_data(uid):
-    return dataaccess.profile_data(uid)
+    return dataaccess.profile_loader.load(uid)
 
 @register.simple_tag()
 def profiles_data(uids):
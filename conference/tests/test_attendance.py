@@ -0,0 +1,136 @@
+import datetime
+import random
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import override_settings
+from django_factory_boy import auth as auth_factories
+
+from conference import dataaccess
+from conference.attendance import AttendanceMatrix
+from conference.cachef import CacheFunction
+from conference.management.commands.benchmark_schedule import synthetic_events
+from conference.models import Event, EventBooking, EventInterest, Schedule
+from conference.tests.factories.conference import ConferenceFactory
+from conference.tests.factories.event import EventFactory
+from p3.tests.factories.schedule import ScheduleFactory
+
+
+def reference_scores(events):
+    """
+    The set based implementation of `ScheduleManager.score_events`.
+    """
+    scores = defaultdict(lambda: 0.0)
+    for evt, users in events.items():
+        group = list(Event.objects.group_events_by_times(events, event=evt))[0]
+        while users:
+            u = users.pop()
+            found = [ evt ]
+            for other in group:
+                if other != evt:
+                    try:
+                        events[other].remove(u)
+                    except KeyError:
+                        pass
+                    else:
+                        found.append(other)
+            score = 1.0 / len(found)
+            for f in found:
+                scores[f.id] += score
+    return scores
+
+
+def random_interests(rnd, events, users):
+    interests = OrderedDict()
+    for e in rnd.sample(events, len(events) // 2):
+        interests[e] = set(rnd.sample(users, rnd.randrange(1, len(users))))
+    return interests
+
+
+class AttendanceMatrixTestCase(SimpleTestCase):
+    def assertSameScores(self, scores1, scores2):
+        self.assertEqual(
+            sorted(k for k, v in scores1.items() if v),
+            sorted(k for k, v in scores2.items() if v))
+        for k, v in scores1.items():
+            self.assertAlmostEqual(v, scores2[k], places=9)
+
+    def test_same_scores(self):
+        for seed in range(20):
+            rnd = random.Random(seed)
+            events = synthetic_events(60, days=2, seed=seed)
+            interests = random_interests(rnd, events, range(1, 40))
+            scores = Schedule.objects.score_events(
+                OrderedDict((k, set(v)) for k, v in interests.items()))
+            self.assertSameScores(scores, reference_scores(interests))
+
+    def test_incremental_update(self):
+        rnd = random.Random(1)
+        events = synthetic_events(60, days=2)
+        users = range(1, 40)
+        matrix = AttendanceMatrix(events)
+        rows = {}
+        for _ in range(200):
+            uid = rnd.choice(users)
+            rows[uid] = set(e.id for e in rnd.sample(events, rnd.randrange(0, 8)))
+            matrix.set_row(uid, rows[uid])
+
+        fresh = AttendanceMatrix(events)
+        fresh.set_rows(rows)
+        self.assertSameScores(matrix.scores(), fresh.scores())
+        self.assertEqual(dict(matrix.patterns), dict(fresh.patterns))
+
+    def test_pickle(self):
+        import cPickle as pickle
+        events = synthetic_events(10, days=1)
+        matrix = AttendanceMatrix(events)
+        matrix.set_rows({1: [1, 2, 3], 2: [1, 4]})
+        copy = pickle.loads(pickle.dumps(matrix, pickle.HIGHEST_PROTOCOL))
+        copy.set_row(3, [5])
+        matrix.set_row(3, [5])
+        self.assertEqual(copy.scores(), matrix.scores())
+
+
+@override_settings(CACHES=settings.ENABLE_LOCMEM_CACHE)
+class AttendanceMatrixCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.conference = ConferenceFactory()
+        schedule = ScheduleFactory(conference=self.conference.code, date=datetime.date(2018, 7, 23))
+        self.e1 = EventFactory(schedule=schedule, start_time=datetime.time(10), duration=60)
+        self.e2 = EventFactory(schedule=schedule, start_time=datetime.time(10, 30), duration=60)
+        self.user = auth_factories.UserFactory()
+
+    def assertNotCached(self, code):
+        self.assertIs(
+            dataaccess.attendance_matrix.get_from_cache([(code,)])[0],
+            CacheFunction.CACHE_MISS)
+
+    def test_invalidation(self):
+        code = self.conference.code
+        EventInterest.objects.create(event=self.e1, user=self.user, interest=1)
+        self.assertEqual(dataaccess.attendance_matrix(code).scores()[self.e1.id], 1.0)
+
+        EventBooking.objects.create(event=self.e2, user=self.user)
+        self.assertNotCached(code)
+        matrix = dataaccess.attendance_matrix(code)
+        self.assertEqual(matrix.scores()[self.e1.id], 0.5)
+        self.assertEqual(matrix.scores()[self.e2.id], 0.5)
+        self.assertEqual(dataaccess.expected_attendance(code)[self.e2.id]['score'], 0.5)
+
+        # the events no longer overlap
+        self.e2.start_time = datetime.time(12)
+        self.e2.save()
+        self.assertNotCached(code)
+        self.assertEqual(dataaccess.expected_attendance(code)[self.e2.id]['score'], 1.0)
+        self.e2.start_time = datetime.time(10, 30)
+        self.e2.save()
+
+        self.e1.schedule.date = datetime.date(2018, 7, 24)
+        self.e1.schedule.save()
+        self.assertNotCached(code)
+
+        EventInterest.objects.filter(event=self.e1).delete()
+        self.assertEqual(dataaccess.expected_attendance(code)[self.e2.id]['score'], 1.0)
@@ -0,0 +1,283 @@
+import mock
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.dispatch import Signal
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from conference import cachef
+from conference.cachef import CacheFunction, LocalCache
+
+
+class LocalCacheTestCase(TestCase):
+    def test_lru(self):
+        local = LocalCache(size=2, timeout=60)
+        local.set('a', 1)
+        local.set('b', 2)
+        local.get('a')
+        local.set('c', 3)
+        self.assertEqual(local.get('a'), 1)
+        self.assertEqual(local.get('b'), None)
+        self.assertEqual(local.get('c'), 3)
+
+    def test_timeout(self):
+        local = LocalCache(size=2, timeout=60)
+        with mock.patch('conference.cachef.time.time', return_value=0):
+            local.set('a', 1)
+        with mock.patch('conference.cachef.time.time', return_value=61):
+            self.assertEqual(local.get('a'), None)
+
+    def test_values_are_copied(self):
+        local = LocalCache()
+        local.set('a', {'x': 1})
+        local.get('a')['x'] = 2
+        self.assertEqual(local.get('a'), {'x': 1})
+
+
+@override_settings(CACHES=settings.ENABLE_LOCMEM_CACHE)
+class CacheFunctionLocalTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.invalidate = Signal()
+        self.cache_me = CacheFunction(prefix='test:', local={'size': 10, 'sync': 0})
+        self.calls = []
+
+        def data(x):
+            self.calls.append(x)
+            return {'x': x}
+
+        self.data = self.cache_me(
+            signals=(self.invalidate,),
+            key='data:%(x)s')(data, lambda sender, **kw: 'data:%s' % kw['x'])
+
+        def other(x):
+            self.calls.append(-x)
+            return -x
+
+        self.other = self.cache_me(key='other:%(x)s')(other)
+
+    def test_local_hit(self):
+        self.data(1)
+        key = self.cache_me.fhash('test:data:1')
+        with mock.patch('conference.cachef.cache.get', wraps=cache.get) as get:
+            self.assertEqual(self.data(1), {'x': 1})
+            self.assertEqual(self.data.get_from_cache([(1,)]), [{'x': 1}])
+            # only the generations are read
+            self.assertNotIn(key, [ c[0][0] for c in get.call_args_list ])
+        self.assertEqual(self.calls, [1])
+
+    def test_invalidation(self):
+        self.data(1)
+        self.invalidate.send(None, x=1)
+        self.data(1)
+        self.assertEqual(self.calls, [1, 1])
+
+    def test_invalidation_from_other_process(self):
+        self.data(1)
+        self.data(2)
+        # another process invalidates a key bumping the generation
+        cache.delete(self.cache_me.fhash('test:data:1'))
+        cache.add(self.cache_me.generation_key('data'), 1, None)
+        self.data(1)
+        self.data(2)
+        self.assertEqual(self.calls, [1, 2, 1])
+
+    def test_generation_per_function(self):
+        self.data(1)
+        self.other(1)
+        self.data.set_in_cache((1,), {'x': 2})
+        # the local copies of the other functions survive
+        key = self.cache_me.fhash('test:other:1')
+        with mock.patch('conference.cachef.cache.get', wraps=cache.get) as get:
+            self.assertEqual(self.other(1), -1)
+            self.assertNotIn(key, [ c[0][0] for c in get.call_args_list ])
+        # another process drops its copy of data(1)
+        self.cache_me.generations['data'] = None
+        self.cache_me.local_set(self.cache_me.fhash('test:data:1'), {'x': 1}, 'data')
+        self.assertEqual(self.data(1), {'x': 2})
+        self.assertEqual(self.calls, [1, -1])
+
+
+@override_settings(CACHES=settings.ENABLE_LOCMEM_CACHE)
+class CacheFunctionNamespaceTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.invalidate = Signal()
+        self.cache_me = CacheFunction(prefix='test:')
+        self.calls = []
+
+        def data(x):
+            self.calls.append(x)
+            return x
+
+        self.data = self.cache_me(
+            signals=(self.invalidate,),
+            key='data:%(x)s',
+            namespace='data')(data)
+
+    def test_invalidation(self):
+        self.data(1)
+        self.data(2)
+        self.assertEqual(self.data.get_from_cache([(1,), (2,)]), [1, 2])
+        with mock.patch('conference.cachef.cache.delete_many') as delete_many:
+            self.invalidate.send(None)
+            self.assertFalse(delete_many.called)
+        self.assertEqual(
+            self.data.get_from_cache([(1,), (2,)]),
+            [CacheFunction.CACHE_MISS] * 2)
+        self.data(1)
+        self.assertEqual(self.calls, [1, 2, 1])
+
+    def test_evicted_generation(self):
+        with mock.patch('conference.cachef.time.time', return_value=1):
+            self.data(1)
+        cache.delete(self.cache_me.namespace_key('data'))
+        self.invalidate.send(None)
+        self.data(1)
+        self.assertEqual(self.calls, [1, 1])
+
+
+def _talk_data(tid, preload=None):
+    pass
+
+
+def _user_votes(uid, conference):
+    pass
+
+
+def _deadlines(lang, year=None):
+    pass
+
+
+class CompileKeyTestCase(TestCase):
+    def setUp(self):
+        self.cache_me = CacheFunction(prefix='conf:')
+
+    def assertSameKey(self, key, func, args, kwargs=None):
+        kwargs = kwargs or {}
+        build_key = self.cache_me.compile_key(key, func)
+        self.assertEqual(
+            build_key(args, kwargs),
+            self.cache_me.generate_key(key, func, args, kwargs))
+
+    def test_same_keys(self):
+        self.assertSameKey('talk_data:%(tid)s', _talk_data, (1,))
+        self.assertSameKey('talk_data:%(tid)s', _talk_data, [1])
+        self.assertSameKey('talk_data:%(tid)s', _talk_data, (1,), {'preload': {}})
+        self.assertSameKey('user_votes:%(uid)s:%(conference)s', _user_votes, (1, 'ep'))
+        self.assertSameKey('deadlines:%(lang)s:%(year)s', _deadlines, ('en',))
+        self.assertSameKey('deadlines:%(lang)s:%(year)s', _deadlines, (u'\xe8', 2018))
+        self.assertSameKey('tags', lambda: None, ())
+
+    def test_not_compiled(self):
+        self.assertIsNone(self.cache_me.compile_key(lambda f, x: x, _talk_data))
+        self.assertIsNone(self.cache_me.compile_key('talk:%s', _talk_data))
+        self.assertIsNone(self.cache_me.compile_key('talk:%(other)s', _talk_data))
+        self.assertIsNone(self.cache_me.compile_key('talk:%(tid)s', lambda *a: None))
+
+    def test_invalid_calls(self):
+        build_key = self.cache_me.compile_key('talk_data:%(tid)s', _talk_data)
+        self.assertRaises(TypeError, build_key, (), {})
+        self.assertRaises(TypeError, build_key, (1, 2, 3), {})
+
+    def test_no_introspection(self):
+        """
+        The key of a cache hit of `talk_data`/`event_data` is built without
+        inspecting the function call.
+        """
+        build_key = self.cache_me.compile_key('talk_data:%(tid)s', _talk_data)
+        with mock.patch('conference.cachef.getcallargs') as getcallargs:
+            self.assertEqual(build_key((1,), {}), 'conf:talk_data:1')
+            self.assertEqual(build_key((1, {}), {}), 'conf:talk_data:1')
+            self.assertFalse(getcallargs.called)
+
+
+@override_settings(CACHES=settings.ENABLE_LOCMEM_CACHE)
+class CacheFunctionSingleFlightTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.invalidate = Signal()
+        self.cache_me = CacheFunction(prefix='test:')
+        self.calls = []
+
+        def data(x):
+            self.calls.append(x)
+            return len(self.calls)
+
+        self.data = self.cache_me(
+            signals=(self.invalidate,),
+            key='data:%(x)s',
+            single_flight=True)(data, lambda sender, **kw: 'data:1')
+        self.lock = self.cache_me.fhash('test:data:1') + ':lock'
+
+    def test_stale_value(self):
+        self.assertEqual(self.data(1), 1)
+        self.invalidate.send(None)
+        # another process is recomputing the value
+        cache.add(self.lock, 1)
+        self.assertEqual(self.data(1), 1)
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(self.data.single_flight_stats()['stale'], 1)
+
+        cache.delete(self.lock)
+        self.assertEqual(self.data(1), 2)
+        self.assertEqual(self.data(1), 2)
+
+    @mock.patch('conference.cachef.time.sleep')
+    def test_wait_timeout(self, mock_sleep):
+        cache.add(self.lock, 1)
+        with mock.patch.object(CacheFunction, 'LOCK_WAIT', 0):
+            self.assertEqual(self.data(1), 1)
+        self.assertEqual(self.data.single_flight_stats(), {
+            'stale': 0,
+            'waited': 0,
+            'timeout': 1,
+        })
+
+
+@override_settings(CACHES=settings.ENABLE_LOCMEM_CACHE)
+class CacheFunctionStatsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cache_me = CacheFunction(prefix='test:', stats=True)
+
+        def users(x):
+            return list(User.objects.values_list('id', flat=True))
+
+        def total(x):
+            return len(self.users(x)) + User.objects.count()
+
+        self.users = self.cache_me(key='users:%(x)s')(users)
+        self.total = self.cache_me(key='total:%(x)s')(total)
+
+    def test_counters(self):
+        self.users(1)
+        self.users(1)
+        self.users(2)
+        self.users.get_from_cache([(1,), (3,)])
+        stats = self.users.stats.as_dict()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 2))
+        self.assertEqual((stats['queries'], stats['max_queries']), (2, 1))
+        self.assertEqual(sum(x[1] for x in stats['histogram']), 2)
+        self.assertEqual([ x[0] for x in self.cache_me.function_stats() ], ['users', 'total'])
+
+        self.cache_me.reset_stats()
+        self.assertEqual(self.users.stats.as_dict()['misses'], 0)
+
+    def test_nested_misses(self):
+        cachef.open_stats_scope()
+        with self.assertNumQueries(2):
+            self.total(1)
+        self.total(1)
+        totals = cachef.close_stats_scope()
+        self.assertEqual(self.total.stats.as_dict()['queries'], 2)
+        self.assertEqual(self.users.stats.as_dict()['queries'], 1)
+        self.assertEqual(
+            (totals['hits'], totals['misses'], totals['queries']),
+            (1, 2, 2))
+        self.assertEqual(cachef.close_stats_scope(), None)
+
+    def test_disabled(self):
+        data = CacheFunction(prefix='test:')(lambda x: x)
+        self.assertEqual(data.stats, None)
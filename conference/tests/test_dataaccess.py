@@ -0,0 +1,56 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from conference import dataaccess
+from conference.tests.factories.conference import ConferenceFactory
+from conference.tests.factories.talk import TalkFactory
+
+
+class DataLoaderTestCase(TestCase):
+    def setUp(self):
+        conference = ConferenceFactory()
+        self.talks = [ TalkFactory(conference=conference.code) for _ in range(3) ]
+        self.tids = [ t.id for t in self.talks ]
+
+    def test_load_many(self):
+        data = dataaccess.talks_data(self.tids)
+        self.assertEqual([ x['id'] for x in data ], self.tids)
+        self.assertEqual(data[0]['title'], self.talks[0].title)
+
+    def test_scope_remembers_loaded_items(self):
+        with dataaccess.batch_scope():
+            dataaccess.talks_data(self.tids)
+            with self.assertNumQueries(0):
+                for tid in self.tids:
+                    dataaccess.talk_loader.load(tid)
+
+    def test_primed_ids_are_fetched_together(self):
+        with CaptureQueriesContext(connection) as single:
+            dataaccess.talks_data(self.tids[:1])
+
+        with dataaccess.batch_scope():
+            dataaccess.talk_loader.prime(self.tids + [-1])
+            with self.assertNumQueries(len(single)):
+                dataaccess.talk_loader.load(self.tids[0])
+            with self.assertNumQueries(0):
+                for tid in self.tids:
+                    self.assertEqual(dataaccess.talk_loader.load(tid)['id'], tid)
+
+    def test_no_scope(self):
+        dataaccess.talk_loader.load(self.tids[0])
+        self.assertIsNone(dataaccess.talk_loader.state())
+
+    def test_loaded_items_are_copied(self):
+        with dataaccess.batch_scope():
+            dataaccess.talk_loader.load(self.tids[0])['title'] = 'changed'
+            self.assertEqual(
+                dataaccess.talk_loader.load(self.tids[0])['title'],
+                self.talks[0].title)
+
+    def test_scope_forgets_saved_items(self):
+        with dataaccess.batch_scope():
+            dataaccess.talks_data(self.tids)
+            self.talks[0].title = 'changed'
+            self.talks[0].save()
+            self.assertEqual(dataaccess.talk_loader.load(self.tids[0])['title'], 'changed')
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import random
+
+from django.test import SimpleTestCase
+
+from conference import ical
+from conference.management.commands.benchmark_ical import naive_encode, synthetic_texts
+
+
+class EncodeTestCase(SimpleTestCase):
+    def test_same_output(self):
+        rnd = random.Random(0)
+        chars = [ 'a', '\r\n', u'\xe9'.encode('utf-8'), u'日'.encode('utf-8'), u'\U0001f40d'.encode('utf-8') ]
+        for _ in range(2000):
+            line = ''.join(rnd.choice(chars) for _ in range(rnd.randrange(0, 200)))
+            self.assertEqual(ical.encode(line), naive_encode(line))
+        for title, abstract in synthetic_texts(50):
+            line = u'DESCRIPTION:' + ical.TEXT(abstract).decode('utf-8')
+            self.assertEqual(ical.encode(line), naive_encode(line))
+
+    def test_invalid_utf8(self):
+        line = 'x' * 70 + '\xe9' * 20
+        self.assertEqual(ical.encode(line), naive_encode(line))
+        with self.assertRaises(ValueError):
+            ical.encode('\xe9' * 80)
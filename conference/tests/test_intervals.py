@@ -0,0 +1,105 @@
+import datetime
+import random
+
+from django.test import SimpleTestCase
+
+from conference.intervals import IntervalIndex, TrackIndex, overlap_counts
+from conference.management.commands.benchmark_schedule import (
+    naive_group_events_by_times, naive_intersections, synthetic_events,
+    synthetic_timetable)
+from conference.models import Event
+from conference.utils import TimeTable2
+
+
+class IntervalIndexTestCase(SimpleTestCase):
+    def test_overlapping(self):
+        rnd = random.Random(1)
+        intervals = []
+        for ix in range(300):
+            start = rnd.randrange(0, 100)
+            intervals.append((start, start + rnd.randrange(0, 20), ix))
+        index = IntervalIndex(intervals)
+        for start in range(-5, 125):
+            for end in (start, start + 1, start + 7, start + 30):
+                expected = [
+                    i[2] for i in intervals
+                    if max(start, i[0]) < min(end, i[1])
+                ]
+                self.assertEqual(index.overlapping(start, end), expected)
+
+    def test_empty(self):
+        self.assertEqual(IntervalIndex([]).overlapping(0, 10), [])
+        self.assertEqual(IntervalIndex([(1, 1, 'a')]).overlapping(0, 10), [])
+
+
+class OverlapCountsTestCase(SimpleTestCase):
+    def test_counts(self):
+        rnd = random.Random(3)
+        intervals = []
+        for ix in range(300):
+            start = rnd.randrange(0, 100)
+            intervals.append((start, start + rnd.randrange(0, 20)))
+        expected = [
+            sum(1 for jx, j in enumerate(intervals)
+                if jx != ix and max(i[0], j[0]) < min(i[1], j[1]))
+            for ix, i in enumerate(intervals)
+        ]
+        self.assertEqual(overlap_counts(intervals), expected)
+
+    def test_timetable_intersections(self):
+        events = synthetic_timetable(300, tracks=3, seed=4)
+        tracks = sorted(events)
+        expected = naive_intersections(events, tracks)
+        tt = TimeTable2(None, dict((t, list(v)) for t, v in events.items()), tracks=tracks)
+        tt._analyze()
+        for track in tracks:
+            for old, new in zip(events[track], tt.events[track]):
+                self.assertEqual(new.get('intersection'), expected.get(id(old)))
+
+
+class GroupEventsByTimesTestCase(SimpleTestCase):
+    def setUp(self):
+        self.events = synthetic_events(300, days=3, seed=2)
+
+    def test_groups(self):
+        self.assertEqual(
+            list(Event.objects.group_events_by_times(self.events)),
+            list(naive_group_events_by_times(self.events)))
+
+    def test_event_group(self):
+        for e in self.events:
+            self.assertEqual(
+                list(Event.objects.group_events_by_times(self.events, event=e)),
+                list(naive_group_events_by_times(self.events, event=e)))
+
+
+class TrackIndexTestCase(SimpleTestCase):
+    def reference(self, events, tracks, t0):
+        # the lookup done by p3.views.live.live_events before the index
+        tt = TimeTable2(None, dict((t, list(v)) for t, v in events.items()), tracks=tracks)
+        tt.removeEventsByTag('special')
+        output = {}
+        for track, tevts in tt.iterOnTracks(start=('current', t0)):
+            curr = next = None
+            try:
+                curr = tevts[0]
+                next = tevts[1]
+            except IndexError:
+                pass
+            if curr and (curr['time'] + datetime.timedelta(seconds=curr['duration']*60)).time() < t0:
+                curr = None
+            output[track] = (curr and curr['id'], next and next['id'])
+        return output
+
+    def test_current(self):
+        events = synthetic_timetable(60, tracks=3, seed=5)
+        tracks = sorted(events)
+        index = TrackIndex(TimeTable2(None, events, tracks=tracks))
+        for minute in range(8 * 60, 23 * 60, 5):
+            t0 = datetime.time(minute // 60, minute % 60)
+            expected = self.reference(events, tracks, t0)
+            for track in tracks:
+                curr, next = index.current(track, t0)
+                self.assertEqual((curr and curr['id'], next and next['id']), expected[track])
+            self.assertEqual(index.track_events(tracks[0]), events[tracks[0]])
+        self.assertEqual(index.current('missing', t0), (None, None))
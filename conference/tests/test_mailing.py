@@ -0,0 +1,120 @@
+from datetime import timedelta
+
+import mock
+from django.conf import settings
+from django.contrib import admin
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from django_factory_boy import auth as auth_factories
+
+from conference import mailing
+from conference import settings as csettings
+from conference.admin import AdminMailingAdmin
+from conference.forms import AdminSendMailForm
+from conference.models import AdminMailing, Conference
+
+
+@override_settings(CACHES=settings.ENABLE_LOCMEM_CACHE)
+class AdminMailingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Conference.objects.create(
+            code=settings.CONFERENCE_CONFERENCE, name=settings.CONFERENCE_CONFERENCE)
+        self.users = [ auth_factories.UserFactory() for _ in range(5) ]
+        self.uids = [ u.id for u in self.users ]
+        self.form = AdminSendMailForm(data={
+            'from_': 'info@example.com',
+            'subject': '{{ conf.code }}',
+            'body': 'Hi {{ user.email }}, {{ tickets|length }} tickets',
+            'send_email': True,
+        })
+        self.assertTrue(self.form.is_valid())
+
+    def test_preview(self):
+        u = self.users[0]
+        Conference.objects.current()
+        # the users and their tickets
+        with self.assertNumQueries(2):
+            subject, body, user = self.form.preview(u.id)[0]
+        self.assertEqual((subject, body, user), (
+            settings.CONFERENCE_CONFERENCE, 'Hi %s, 0 tickets' % u.email, u))
+
+    def test_send_in_chunks(self):
+        self.assertEqual(self.form.send_emails(self.uids + self.uids[:1], 'admin@example.com'), 5)
+        self.assertEqual(mail.outbox, [])
+        m = AdminMailing.objects.claim()
+        self.assertIsNone(AdminMailing.objects.claim())
+
+        connection = mail.get_connection()
+        with mock.patch.object(connection, 'send_messages', wraps=connection.send_messages) as send:
+            mailing.send_mailing(m, chunk_size=2, connection=connection)
+        self.assertEqual(send.call_count, 3)
+
+        m = AdminMailing.objects.get(id=m.id)
+        self.assertEqual((m.status, m.sent, m.total), ('sent', 5, 5))
+        self.assertEqual(
+            sorted(x.to[0] for x in mail.outbox[:-1]),
+            sorted(u.email for u in self.users))
+        self.assertEqual(mail.outbox[-1].to, ['admin@example.com'])
+        self.assertEqual(list(self.form.load_emails()), [m])
+
+    def test_resume_after_failure(self):
+        self.form.send_emails(self.uids, 'admin@example.com')
+        m = AdminMailing.objects.claim()
+        connection = mail.get_connection()
+        sent = connection.send_messages
+        def fail_second_chunk(messages, calls=[]):
+            calls.append(1)
+            if len(calls) == 2:
+                raise IOError('connection lost')
+            return sent(messages)
+        with mock.patch.object(connection, 'send_messages', side_effect=fail_second_chunk):
+            with self.assertRaises(IOError):
+                mailing.send_mailing(m, chunk_size=2, connection=connection)
+        m = AdminMailing.objects.get(id=m.id)
+        self.assertEqual((m.status, m.sent, m.error), ('failed', 2, 'connection lost'))
+
+        AdminMailing.objects.filter(id=m.id).update(status='queued')
+        mailing.send_mailing(AdminMailing.objects.claim(), chunk_size=2)
+        m = AdminMailing.objects.get(id=m.id)
+        self.assertEqual((m.status, m.sent), ('sent', 5))
+        self.assertEqual(
+            sorted(x.to[0] for x in mail.outbox[:-1]),
+            sorted(u.email for u in self.users))
+
+    def test_reclaim_stale_claim(self):
+        self.form.send_emails(self.uids, 'admin@example.com')
+        m = AdminMailing.objects.claim()
+        self.assertIsNone(AdminMailing.objects.claim())
+
+        # the worker has been killed
+        stale = timezone.now() - timedelta(seconds=csettings.ADMIN_TICKETS_STATS_EMAIL_CLAIM_TIMEOUT + 1)
+        AdminMailing.objects.filter(id=m.id).update(claimed=stale)
+        other = AdminMailing.objects.claim()
+        self.assertEqual(other.id, m.id)
+
+        # a stalled worker stops at its next progress
+        self.assertFalse(mailing.send_mailing(m, chunk_size=2))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertTrue(mailing.send_mailing(other, chunk_size=2))
+        m = AdminMailing.objects.get(id=m.id)
+        self.assertEqual((m.status, m.sent), ('sent', 5))
+        self.assertEqual(
+            sorted(x.to[0] for x in mail.outbox[:-1]),
+            sorted(u.email for u in self.users))
+
+    def test_requeue(self):
+        self.form.send_emails(self.uids, 'admin@example.com')
+        self.form.send_emails(self.uids, 'admin@example.com')
+        sending = AdminMailing.objects.claim()
+        failed = AdminMailing.objects.claim()
+        AdminMailing.objects.filter(id=failed.id).update(status='failed')
+
+        model_admin = AdminMailingAdmin(AdminMailing, admin.site)
+        with mock.patch.object(model_admin, 'message_user'):
+            model_admin.do_requeue(None, AdminMailing.objects.all())
+        self.assertEqual(AdminMailing.objects.get(id=sending.id).status, 'sending')
+        self.assertEqual(AdminMailing.objects.get(id=failed.id).status, 'queued')
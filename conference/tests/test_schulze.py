@@ -0,0 +1,160 @@
+import os.path
+import random
+import re
+import subprocess
+import sys
+from unittest import skipIf
+
+import mock
+from django.test import SimpleTestCase, TestCase
+from django_factory_boy import auth as auth_factories
+
+import conference
+from conference import schulze, utils
+from conference import settings as csettings
+from conference.models import TalkPreference, VotoTalk
+from conference.tests.factories.conference import ConferenceFactory
+from conference.tests.factories.talk import TalkFactory
+
+
+def voteengine(vinput):
+    vengine = os.path.join(os.path.dirname(conference.__file__), 'utils', 'voteengine-0.99', 'voteengine.py')
+    pipe = subprocess.Popen(
+        [sys.executable, vengine],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        close_fds=True
+    )
+    out, err = pipe.communicate(vinput)
+    assert pipe.returncode == 0, err
+    return [ int(x) for x in re.findall(r'\d+', out.split('\n')[-2]) ]
+
+
+def random_ballots(rnd, n, count):
+    ballots = []
+    for _ in range(count):
+        voted = rnd.sample(range(n), rnd.randrange(1, n))
+        ballots.append(dict((i, rnd.randrange(0, 4)) for i in voted))
+    return ballots
+
+
+def vinput(n, ballots, missing, tiebreaker):
+    lines = [
+        '-m schulze',
+        '-cands %s -tie %s' % (' '.join(map(str, range(n))), ' '.join(map(str, tiebreaker))),
+    ]
+    for ballot in ballots:
+        scores = dict((i, ballot.get(i, missing)) for i in range(n))
+        levels = sorted(set(scores.values()), reverse=True)
+        lines.append('>'.join(
+            '='.join(str(i) for i in range(n) if scores[i] == level)
+            for level in levels))
+    return '\n'.join(lines)
+
+
+class SchulzeTestCase(SimpleTestCase):
+    def rank(self, n, ballots, missing, tiebreaker):
+        d = schulze.pairwise_preferences(n, ballots, missing)
+        p = schulze.strongest_paths(d)
+        return d, p, schulze.ranking(p, tiebreaker)
+
+    @skipIf(schulze.numpy is None, 'numpy not installed')
+    def test_same_results_without_numpy(self):
+        for seed in range(10):
+            rnd = random.Random(seed)
+            n = rnd.randrange(2, 30)
+            ballots = random_ballots(rnd, n, rnd.randrange(1, 40))
+            tiebreaker = rnd.sample(range(n), n)
+            expected = self.rank(n, ballots, 2, tiebreaker)
+            with mock.patch.object(schulze, 'numpy', None):
+                self.assertEqual(self.rank(n, ballots, 2, tiebreaker), expected)
+
+    @skipIf(schulze.numpy is None, 'voteengine needs numpy')
+    def test_same_ranking_of_voteengine(self):
+        for seed in range(10):
+            rnd = random.Random(seed)
+            n = rnd.randrange(2, 15)
+            ballots = random_ballots(rnd, n, rnd.randrange(1, 20))
+            tiebreaker = rnd.sample(range(n), n)
+            expected = voteengine(vinput(n, ballots, 2, tiebreaker))
+            self.assertEqual(self.rank(n, ballots, 2, tiebreaker)[2], expected)
+            with mock.patch.object(schulze, 'numpy', None):
+                self.assertEqual(self.rank(n, ballots, 2, tiebreaker)[2], expected)
+
+    def test_candidate_terms(self):
+        rnd = random.Random(0)
+        for ballot in random_ballots(rnd, 10, 20):
+            for c in range(10):
+                before = dict(ballot)
+                before.pop(c, None)
+                after = dict(before)
+                after[c] = 0
+                expected = schulze.add_terms(
+                    schulze.ballot_terms(after, 2), schulze.ballot_terms(before, 2), -1)
+                self.assertEqual(schulze.ballot_terms(after, 2, candidate=c), expected)
+
+    def test_condorcet_winner(self):
+        ballots = [{0: 3, 1: 2}, {0: 3, 2: 1}, {1: 3, 2: 2}]
+        d, p, ranking = self.rank(3, ballots, 0, [2, 1, 0])
+        self.assertEqual(d[0][1], 2)
+        self.assertEqual(ranking, [0, 1, 2])
+
+
+class TalksRankingTestCase(TestCase):
+    def setUp(self):
+        self.conference = ConferenceFactory()
+        self.talks = [ TalkFactory(conference=self.conference.code) for _ in range(5) ]
+        self.users = [ auth_factories.UserFactory() for _ in range(8) ]
+        rnd = random.Random(0)
+        for user in self.users:
+            for t in rnd.sample(self.talks, 3):
+                VotoTalk.objects.create(user=user, talk=t, vote=rnd.randrange(0, 10))
+
+    def computed_preferences(self):
+        ballots = {}
+        for v in VotoTalk.objects.all():
+            ballots.setdefault(v.user_id, {})[self.talks.index(v.talk)] = v.vote
+        with mock.patch.object(schulze, 'numpy', None):
+            return schulze.pairwise_preferences(
+                len(self.talks), ballots.values(), csettings.VOTING_MISSING_VOTE)
+
+    @skipIf(schulze.numpy is None, 'voteengine needs numpy')
+    def test_ranking_of_talks(self):
+        for missing in (5, None):
+            ranked, strengths = utils.talks_ranking(self.talks, missing_vote=missing)
+            expected = voteengine(utils._input_for_ranking_of_talks(
+                self.talks, missing_vote=csettings.VOTING_MISSING_VOTE if missing is None else missing))
+            self.assertEqual([ t.id for t in ranked ], expected)
+            self.assertEqual(len(strengths), 5)
+            self.assertEqual(utils.ranking_of_talks(self.talks, missing_vote=missing), ranked)
+
+    def test_default_missing_vote(self):
+        # the ranking made with voteengine gave 5 to the talks not voted
+        self.assertEqual(csettings.VOTING_MISSING_VOTE, 5)
+        ballots = {}
+        for v in VotoTalk.objects.all():
+            ballots.setdefault(v.user_id, {})[self.talks.index(v.talk)] = v.vote
+        with mock.patch.object(schulze, 'numpy', None):
+            expected = schulze.pairwise_preferences(len(self.talks), ballots.values(), 5)
+        self.assertEqual(TalkPreference.objects.pairwise_preferences(self.talks), expected)
+
+    def test_preferences_updated_on_vote(self):
+        rnd = random.Random(1)
+        for _ in range(30):
+            user = rnd.choice(self.users)
+            talk = rnd.choice(self.talks)
+            vote = rnd.choice((None, 0, 3, 7))
+            try:
+                o = VotoTalk.objects.get(user=user, talk=talk)
+            except VotoTalk.DoesNotExist:
+                o = VotoTalk(user=user, talk=talk)
+            if vote is None:
+                if o.id:
+                    o.delete()
+            else:
+                o.vote = vote
+                o.save()
+        expected = self.computed_preferences()
+        self.assertEqual(TalkPreference.objects.pairwise_preferences(self.talks), expected)
+
+        TalkPreference.objects.rebuild(self.conference.code)
+        self.assertEqual(TalkPreference.objects.pairwise_preferences(self.talks), expected)
@@ -0,0 +1,148 @@
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+from django_factory_boy import auth as auth_factories
+
+from conference import dataaccess
+from conference.models import EventBooking, EventInterest, EventTrack
+from conference.tests.factories.conference import ConferenceFactory
+from conference.tests.factories.event import EventFactory
+from conference.utils import TimeTable2
+from p3.tests.factories.schedule import ScheduleFactory
+from p3.tests.factories.track import TrackFactory
+
+
+@override_settings(CACHES=settings.ENABLE_LOCMEM_CACHE)
+class ScheduleTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        conference = ConferenceFactory()
+        self.schedule = ScheduleFactory(conference=conference.code, date=datetime.date(2018, 7, 23))
+        self.t1 = TrackFactory(schedule=self.schedule, order=1)
+        self.t2 = TrackFactory(schedule=self.schedule, order=2)
+        self.e1 = self.event(datetime.time(10), 60, self.t1)
+        self.e2 = self.event(datetime.time(10, 30), 60, self.t1, tags='special')
+        self.e3 = self.event(datetime.time(12), 30, self.t1, self.t2)
+
+    def event(self, start, duration, *tracks, **kw):
+        e = EventFactory(schedule=self.schedule, start_time=start, duration=duration, **kw)
+        for t in tracks:
+            EventTrack.objects.create(event=e, track=t)
+        return e
+
+    def content(self, tt):
+        return [
+            (track, [ (e['id'], e.get('intersection')) for e in events ])
+            for track, events in tt.iterOnTracks()
+        ]
+
+    def fresh(self):
+        qs = EventTrack.objects\
+            .filter(event__schedule=self.schedule)\
+            .values('event')\
+            .distinct()
+        return TimeTable2.fromEvents(self.schedule.id, qs)
+
+
+class TimeTableSnapshotTestCase(ScheduleTestCase):
+    def test_same_content_of_fresh_timetable(self):
+        expected = [
+            (self.t1.track, [ (self.e1.id, 1), (self.e2.id, 1), (self.e3.id, None) ]),
+            (self.t2.track, [ (self.e3.id, None) ]),
+        ]
+        self.assertEqual(self.content(self.fresh()), expected)
+        self.assertEqual(self.content(TimeTable2.fromSchedule(self.schedule.id)), expected)
+        with self.assertNumQueries(0):
+            tt = TimeTable2.fromSchedule(self.schedule.id)
+            self.assertEqual(self.content(tt), expected)
+
+    def test_changes_do_not_alter_the_snapshot(self):
+        sid = self.schedule.id
+        snapshot = dataaccess.timetable_snapshot(sid)
+        expected = self.content(TimeTable2.fromSnapshot(sid, snapshot))
+        tt = TimeTable2.fromSnapshot(sid, snapshot)
+        tt.removeEventsByTag('special')
+        tt.slice(start=datetime.time(11))
+        tt.addEvents([ dict(tt.events[self.t1.track][-1], id=None) ])
+        tt.adjustTimes(start=datetime.time(8))
+        list(tt.iterOnTracks())
+        self.assertEqual(self.content(TimeTable2.fromSnapshot(sid, snapshot)), expected)
+
+    def test_invalidation(self):
+        TimeTable2.fromSchedule(self.schedule.id)
+        e4 = self.event(datetime.time(12, 15), 30, self.t2)
+        self.assertEqual(
+            self.content(TimeTable2.fromSchedule(self.schedule.id)),
+            self.content(self.fresh()))
+
+        e4.start_time = datetime.time(13)
+        e4.save()
+        self.assertEqual(
+            self.content(TimeTable2.fromSchedule(self.schedule.id)),
+            self.content(self.fresh()))
+
+        self.e1.talk.title = 'new title'
+        self.e1.talk.save()
+        tt = TimeTable2.fromSchedule(self.schedule.id)
+        self.assertEqual(tt.events[self.t1.track][0]['name'], 'new title')
+
+    def test_event_moved_to_another_schedule(self):
+        other = ScheduleFactory(conference=self.schedule.conference, date=datetime.date(2018, 7, 24))
+        TimeTable2.fromSchedule(self.schedule.id)
+        self.e1.schedule = other
+        self.e1.save()
+        content = self.content(TimeTable2.fromSchedule(self.schedule.id))
+        self.assertEqual(content, self.content(self.fresh()))
+        self.assertNotIn(self.e1.id, [ eid for _, events in content for eid, _ in events ])
+
+
+class UserScheduleTestCase(ScheduleTestCase):
+    def setUp(self):
+        super(UserScheduleTestCase, self).setUp()
+        self.user = auth_factories.UserFactory()
+        self.code = self.schedule.conference
+
+    def cached(self):
+        return dataaccess.user_schedule.get_from_cache([(self.user.id, self.code)])[0]
+
+    def events(self):
+        return dataaccess.user_schedule_events(self.user.id, self.code)
+
+    def test_invalidation(self):
+        self.assertEqual(self.events(), {})
+        EventInterest.objects.create(event=self.e1, user=self.user, interest=1)
+        EventBooking.objects.book_event(self.e3.id, self.user.id)
+        ei = EventInterest.objects.create(event=self.e3, user=self.user, interest=1)
+        self.assertEqual(self.events(), {self.schedule.id: [ self.e1.id, self.e3.id ]})
+
+        ei.interest = -1
+        ei.save()
+        EventInterest.objects.filter(event=self.e1).delete()
+        self.assertIs(self.cached(), dataaccess.cache_me.CACHE_MISS)
+        self.assertEqual(dataaccess.user_schedule(self.user.id, self.code), {
+            self.e3.id: {'schedule': self.schedule.id, 'interest': False, 'booked': True},
+        })
+
+        # the event is moved to another day
+        other = ScheduleFactory(conference=self.code, date=datetime.date(2018, 7, 24))
+        self.e3.schedule = other
+        self.e3.save()
+        self.assertEqual(self.events(), {other.id: [ self.e3.id ]})
+
+        # deleted from the admin
+        EventBooking.objects.filter(event=self.e3).delete()
+        self.assertEqual(self.events(), {})
+
+    def test_timetable(self):
+        EventInterest.objects.create(event=self.e1, user=self.user, interest=1)
+        EventInterest.objects.create(event=self.e3, user=self.user, interest=1)
+        fresh = TimeTable2.fromEvents(self.schedule.id, [ self.e1.id, self.e3.id ])
+        events = dataaccess.user_schedule_events(self.user.id, self.code)
+        TimeTable2.fromSchedule(self.schedule.id)
+        with self.assertNumQueries(0):
+            events = dataaccess.user_schedule_events(self.user.id, self.code)
+            tt = TimeTable2.fromSchedule(self.schedule.id, eids=events[self.schedule.id])
+            self.assertEqual(self.content(tt), self.content(fresh))
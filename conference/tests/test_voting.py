@@ -0,0 +1,102 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from django_factory_boy import auth as auth_factories
+
+from conference import dataaccess, schulze, views
+from conference.models import Conference, TalkPreference, VotoTalk
+from conference.tests.factories.talk import TalkFactory
+
+
+@override_settings(CACHES=settings.ENABLE_LOCMEM_CACHE)
+class SetVotesTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.conference = Conference.objects.create(
+            code=settings.CONFERENCE_CONFERENCE,
+            name=settings.CONFERENCE_CONFERENCE,
+            voting_start=timezone.now() - timedelta(days=2),
+            voting_end=timezone.now() + timedelta(days=2))
+        self.talks = [
+            TalkFactory(conference=self.conference.code, status='proposed')
+            for _ in range(6)
+        ]
+        self.user = auth_factories.UserFactory(is_superuser=True)
+
+    def test_set_votes(self):
+        code = self.conference.code
+        t = [ x.id for x in self.talks ]
+        VotoTalk.objects.create(user=self.user, talk=self.talks[0], vote=3)
+        VotoTalk.objects.create(user=self.user, talk=self.talks[1], vote=4)
+        self.assertEqual(dataaccess.user_votes(self.user.id, code), {t[0]: 3, t[1]: 4})
+
+        votes = {t[0]: None, t[1]: Decimal(5), t[2]: Decimal(5), t[3]: Decimal(7), t[4]: Decimal(0)}
+        with self.assertNumQueries(10):
+            ballot = VotoTalk.objects.set_votes(self.user.id, code, votes)
+        expected = {t[1]: 5, t[2]: 5, t[3]: 7}
+        self.assertEqual(ballot, expected)
+        self.assertEqual(dataaccess.user_votes(self.user.id, code), expected)
+
+        preferences = TalkPreference.objects.pairwise_preferences(self.talks)
+        TalkPreference.objects.rebuild(code)
+        self.assertEqual(TalkPreference.objects.pairwise_preferences(self.talks), preferences)
+
+    def stored_preferences(self):
+        return sorted(TalkPreference.objects\
+            .filter(conference=self.conference.code)\
+            .values_list('talk', 'other')\
+            .annotate(total=Sum('count'))\
+            .exclude(total=0))
+
+    def test_set_votes_only_changed_talks(self):
+        code = self.conference.code
+        t = [ x.id for x in self.talks ]
+        other = auth_factories.UserFactory()
+        VotoTalk.objects.set_votes(other.id, code, dict((x, Decimal(x % 4)) for x in t))
+        VotoTalk.objects.set_votes(self.user.id, code, dict((x, Decimal(x % 3 + 3)) for x in t))
+
+        with mock.patch('conference.schulze.ballot_terms', wraps=schulze.ballot_terms) as terms:
+            VotoTalk.objects.set_votes(self.user.id, code, {t[2]: Decimal(10)})
+        self.assertTrue(all(c[1].get('candidate') == t[2] for c in terms.call_args_list))
+        VotoTalk.objects.set_votes(
+            self.user.id, code, {t[0]: None, t[1]: Decimal(1), t[3]: Decimal(1), t[5]: Decimal(9)})
+
+        stored = self.stored_preferences()
+        TalkPreference.objects.rebuild(code)
+        self.assertEqual(stored, self.stored_preferences())
+
+    def test_view(self):
+        t = [ x.id for x in self.talks ]
+        factory = RequestFactory()
+        request = factory.post(
+            '/', json.dumps({'votes': {str(t[0]): 7.5, str(t[1]): None}}),
+            content_type='application/json')
+        request.user = self.user
+        response = views.voting_votes(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {str(t[0]): 7.5})
+        self.assertEqual(VotoTalk.objects.get(user=self.user).vote, Decimal('7.5'))
+
+        request = factory.post(
+            '/', json.dumps({'votes': {'-1': 7}}),
+            content_type='application/json')
+        request.user = self.user
+        self.assertEqual(views.voting_votes(request).status_code, 400)
+
+    def test_view_voting_closed(self):
+        self.conference.voting_end = timezone.now() - timedelta(days=1)
+        self.conference.save()
+        request = RequestFactory().post(
+            '/', json.dumps({'votes': {str(self.talks[0].id): 7}}),
+            content_type='application/json')
+        request.user = auth_factories.UserFactory()
+        self.assertEqual(views.voting_votes(request).status_code, 404)
+        self.assertFalse(VotoTalk.objects.exists())
@@ -70,6 +70,9 @@ urlpatterns = [
     url(r'^voting/$',
         conf_views.voting,
         name='conference-voting'),
+    url(r'^voting/votes/$',
+        conf_views.voting_votes,
+        name='conference-voting-votes'),
 ]
 
 urlpatterns += [
@@ -3,8 +3,9 @@ from django.conf import settings as dsettings
 from django.core.mail import send_mail as real_send_mail
 from django.core.urlresolvers import reverse
 
+from conference import schulze
 from conference import settings
-from conference.models import VotoTalk, EventTrack
+from conference.models import TalkPreference, VotoTalk, EventTrack
 
 import json
 import logging
@@ -88,23 +89,43 @@ def _input_for_ranking_of_talks(talks, missing_vote=5):
 
     return '\n'.join(vinput)
 
-def ranking_of_talks(talks, missing_vote=5):
-    import conference
-    vengine = os.path.join(os.path.dirname(conference.__file__), 'utils', 'voteengine-0.99', 'voteengine.py')
+def talks_ranking(talks, missing_vote=None):
+    """
+    Ranks the talks with the Schulze method using the votes of the users; the
+    talks not voted by a user get the `missing_vote` value
+    (settings.VOTING_MISSING_VOTE by default), the ties are broken by the
+    creation date of the talks.
 
-    talks_map = dict((t.id, t) for t in talks)
-    in_ = _input_for_ranking_of_talks(talks_map.values(), missing_vote=missing_vote)
+    Returns the ranked talks and the matrix of the strongest paths between
+    them (in the same order of the talks).
+    """
+    talks = list(talks)
+    if not talks:
+        return [], []
 
-    pipe = subprocess.Popen(
-        [vengine],
-        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-        close_fds=True
+    if missing_vote is None or missing_vote == settings.VOTING_MISSING_VOTE:
+        # the preferences are kept up to date at every vote
+        d = TalkPreference.objects.pairwise_preferences(talks)
+    else:
+        index = dict((t.id, ix) for ix, t in enumerate(talks))
+        ballots = defaultdict(dict)
+        votes = VotoTalk.objects\
+            .filter(talk__in=index.keys())\
+            .values_list('user', 'talk', 'vote')
+        for uid, tid, vote in votes:
+            ballots[uid][index[tid]] = float(vote)
+        d = schulze.pairwise_preferences(len(talks), ballots.values(), missing=float(missing_vote))
+
+    p = schulze.strongest_paths(d)
+    tiebreaker = sorted(range(len(talks)), key=lambda ix: talks[ix].created)
+    order = schulze.ranking(p, tiebreaker)
+    return (
+        [ talks[ix] for ix in order ],
+        [ [ p[i][j] for j in order ] for i in order ],
     )
-    out, err = pipe.communicate(in_)
-    if pipe.returncode != 0:
-        raise RuntimeError("voteengine.py exits with code: %s; %s" % (pipe.returncode, err))
 
-    return [ talks_map[int(tid)] for tid in re.findall(r'\d+', out.split('\n')[-2]) ]
+def ranking_of_talks(talks, missing_vote=None):
+    return talks_ranking(talks, missing_vote=missing_vote)[0]
 
 def voting_results():
     """
@@ -133,9 +154,10 @@ def voting_results():
 
 from datetime import datetime, date, timedelta, time
 from conference.models import Event, Track
+from conference.intervals import overlap_counts
 
 class TimeTable2(object):
-    def __init__(self, sid, events):
+    def __init__(self, sid, events, tracks=None):
         """
         events -> dict(track -> list(events))
         """
@@ -143,10 +165,12 @@ class TimeTable2(object):
         self._analyzed = False
         self.events = events
         # Track list in the right order
-        self._tracks = list(Track.objects\
-            .filter(schedule=sid)\
-            .order_by('order')\
-            .values_list('track', flat=True))
+        if tracks is None:
+            tracks = Track.objects\
+                .filter(schedule=sid)\
+                .order_by('order')\
+                .values_list('track', flat=True)
+        self._tracks = list(tracks)
 
     def __str__(self):
         return 'TimeTable2: %s - %s' % (self.sid, ', '.join(self._tracks))
@@ -213,39 +237,87 @@ class TimeTable2(object):
         return tt
 
     @classmethod
-    def fromSchedule(cls, sid):
-        qs = EventTrack.objects\
-            .filter(event__schedule=sid)\
-            .values('event')\
-            .distinct()
-        return cls.fromEvents(sid, qs)
+    def fromSchedule(cls, sid, eids=None):
+        """
+        Returns the TimeTable of the whole schedule built from the cached
+        snapshot (see `snapshot`); if `eids` is passed only the events listed
+        are kept.
+        """
+        from conference import dataaccess
+        tt = cls.fromSnapshot(sid, dataaccess.timetable_snapshot(sid))
+        if eids is not None:
+            eids = set(eids)
+            for t in tt.events.keys():
+                events = [ e for e in tt.events[t] if e['id'] in eids ]
+                if events:
+                    tt.events[t] = events
+                else:
+                    del tt.events[t]
+            # the intersections must be computed again between the
+            # remaining events
+            tt._analyzed = False
+        return tt
+
+    @classmethod
+    def fromSnapshot(cls, sid, snapshot):
+        """
+        Returns a TimeTable that shares the events of `snapshot`; the events
+        lists are copied and the events are never modified in place (see
+        `_analyze`) so the TimeTable can be changed without altering the
+        snapshot.
+        """
+        events = dict(
+            (t, list(evs)) for t, evs in snapshot['events'].items())
+        tt = cls(sid, events, tracks=snapshot['tracks'])
+        tt._analyzed = True
+        return tt
+
+    def snapshot(self):
+        """
+        Returns the analyzed content of the TimeTable as a plain (picklable)
+        dict, the inverse of `fromSnapshot`.
+        """
+        self._analyze()
+        return {
+            'tracks': tuple(self._tracks),
+            'events': dict(
+                (t, tuple(evs)) for t, evs in self.events.items()),
+        }
 
     def _analyze(self):
         if self._analyzed:
             return
         # step 1 - I try "stacked" events
+        intersections = defaultdict(int)
         for t in self._tracks:
-            events = {}
-            timeline = []
-            for e in self.events.get(t, []):
-                row = (e['time'], e['time'] + timedelta(seconds=e['duration'] * 60), e['id'])
-                events[e['id']] = e
-                timeline.append(row)
-            for ix, e1 in enumerate(timeline):
-                for e2 in timeline[ix+1:]:
-                    # http://stackoverflow.com/questions/9044084/efficient-data-range-overlap-calculation-in-python
-                    latest_start = max(e1[0], e2[0])
-                    earliest_end = min(e1[1], e2[1])
-                    overlap = (earliest_end - latest_start)
-                    if overlap.seconds > 0 and overlap.days >= 0:
-                        for eid in (e1[2], e2[2]):
-                            e = events[eid]
-                            try:
-                                e['intersection'] += 1
-                            except KeyError:
-                                e['intersection'] = 1
+            events = self.events.get(t, [])
+            counts = overlap_counts(
+                (e['time'], e['time'] + timedelta(seconds=e['duration'] * 60))
+                for e in events)
+            for e, n in zip(events, counts):
+                intersections[id(e)] += n
+        self._set_intersections(intersections)
         self._analyzed = True
 
+    def _set_intersections(self, intersections):
+        # the events can be shared with a snapshot (or with another
+        # TimeTable), an event is copied before changing it.
+        copies = {}
+        for events in self.events.values():
+            for ix, e in enumerate(events):
+                n = intersections.get(id(e), 0)
+                if e.get('intersection', 0) == n:
+                    continue
+                try:
+                    c = copies[id(e)]
+                except KeyError:
+                    c = copies[id(e)] = dict(e)
+                    if n:
+                        c['intersection'] = n
+                    else:
+                        del c['intersection']
+                events[ix] = c
+
     def iterOnTracks(self, start=None):
         """
         Iterates through the events of the timetable a track at a time, returns an iterator ((track, [events]))
@@ -337,16 +409,15 @@ class TimeTable2(object):
                     end = e1.time()
             else:
                 end = None
-        events = dict(self.events)
-        if start or end:
-            for track, evs in events.items():
-                for ix, e in reversed(list(enumerate(evs))):
-                    if start and e['time'].time() < start:
-                        del evs[ix]
-                    if end and e['time'].time() > end:
-                        del evs[ix]
+        events = {}
+        for track, evs in self.events.items():
+            events[track] = [
+                e for e in evs
+                if not (start and e['time'].time() < start)
+                    and not (end and e['time'].time() > end)
+            ]
 
-        return TimeTable2(self.sid, events)
+        return TimeTable2(self.sid, events, tracks=self._tracks)
 
     def adjustTimes(self, start=None, end=None):
         """
@@ -718,38 +789,48 @@ def timetables2ical(tts, altf=lambda d, comp: d):
     utc = pytz.utc
     tz = timezone(dsettings.TIME_ZONE)
 
+    # the tracks of all the schedules are fetched in a single batch and the
+    # url of the talks is reversed only once
+    locations = {}
+    for sdata in dataaccess.schedules_data(set(tt.sid for tt in tts)):
+        for name, track in sdata['tracks'].items():
+            locations[(sdata['id'], name)] = 'Track: %s' % strip_tags(track.title)
+    talk_url = dsettings.DEFAULT_URL_PREFIX + reverse('conference-talk', kwargs={'slug': '-slug-'})
+    talk_url = talk_url.split('-slug-')
+
+    def events():
+        for tt in tts:
+            for time, events in tt.iterOnTimes():
+                uniq = set()
+                for e in events:
+                    if e['id'] in uniq:
+                        continue
+                    uniq.add(e['id'])
+                    # iCal supports dates in a different timezone to UTC through TZID parameter:
+                    # DTSTART;TZID=Europe/Rome:20120702T093000
+                    #
+                    # So, decided to convert the time in UTC.
+                    start = utc.normalize(tz.localize(e['time']).astimezone(utc))
+                    end = utc.normalize(tz.localize(e['time'] + timedelta(seconds=e['duration']*60)).astimezone(utc))
+                    ce = {
+                        'uid': e['id'],
+                        'start': start,
+                        #'duration': timedelta(seconds=e['duration']*60),
+                        'end': end,
+                        'location': locations[(tt.sid, e['tracks'][0])],
+                    }
+                    if e['talk']:
+                        url = e['talk']['slug'].join(talk_url)
+                        ce['summary'] = (e['talk']['title'], {'ALTREP': url})
+                    else:
+                        ce['summary'] = e['name']
+                    yield ical.Event(**altf(ce, 'event'))
+
+    # the events are generated while the calendar is encoded
     cal = altf({
         'uid': '1',
-        'events': [],
+        'events': events(),
     }, 'calendar')
-    for tt in tts:
-        sdata = dataaccess.schedule_data(tt.sid)
-        for time, events in tt.iterOnTimes():
-            uniq = set()
-            for e in events:
-                if e['id'] in uniq:
-                    continue
-                uniq.add(e['id'])
-                track = strip_tags(sdata['tracks'][e['tracks'][0]].title)
-                # iCal supports dates in a different timezone to UTC through TZID parameter:
-                # DTSTART;TZID=Europe/Rome:20120702T093000
-                #
-                # So, decided to convert the time in UTC.
-                start = utc.normalize(tz.localize(e['time']).astimezone(utc))
-                end = utc.normalize(tz.localize(e['time'] + timedelta(seconds=e['duration']*60)).astimezone(utc))
-                ce = {
-                    'uid': e['id'],
-                    'start': start,
-                    #'duration': timedelta(seconds=e['duration']*60),
-                    'end': end,
-                    'location': 'Track: %s' % track,
-                }
-                if e['talk']:
-                    url = dsettings.DEFAULT_URL_PREFIX + reverse('conference-talk', kwargs={'slug': e['talk']['slug']})
-                    ce['summary'] = (e['talk']['title'], {'ALTREP': url})
-                else:
-                    ce['summary'] = e['name']
-                cal['events'].append(ical.Event(**altf(ce, 'event')))
     return ical.Calendar(**cal)
 
 def conference2ical(conf, altf=lambda d, comp: d):
@@ -2,7 +2,8 @@
 from __future__ import with_statement
 
 from datetime import date
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+import json
 import os.path
 import random
 
@@ -499,6 +500,30 @@ def get_data_for_context(request):
     return conf, talks, voting_allowed
 
 
+def parse_votes(talks, items):
+    """
+    Returns the votes in `items`, a list of (talk id, vote) pairs, as a dict
+    talk id -> vote; an empty vote is returned as None.
+    """
+    data = set(talks.values_list('id', flat=True))
+    votes = {}
+    for tid, v in items:
+        try:
+            tid = int(tid)
+        except ValueError:
+            raise ValueError('id malformed')
+        if tid not in data:
+            raise ValueError('invalid talk')
+        if v is None or v == '':
+            votes[tid] = None
+        else:
+            try:
+                votes[tid] = Decimal(unicode(v))
+            except InvalidOperation:
+                raise ValueError('vote malformed')
+    return votes
+
+
 def voting(request):
 
     conf, talks, voting_allowed = get_data_for_context(request)
@@ -513,31 +538,14 @@ def voting(request):
         if not voting_allowed:
             return http.HttpResponseBadRequest('anonymous user not allowed')
 
-        data = dict((x.id, x) for x in talks)
-        for k, v in filter(lambda x: x[0].startswith('vote-'), request.POST.items()):
-            try:
-                talk = data[int(k[5:])]
-            except KeyError:
-                return http.HttpResponseBadRequest('invalid talk')
-            except ValueError:
-                return http.HttpResponseBadRequest('id malformed')
-            if not v:
-                models.VotoTalk.objects.filter(user=request.user, talk=talk).delete()
-            else:
-                try:
-                    vote = Decimal(v)
-                except ValueError:
-                    return http.HttpResponseBadRequest('vote malformed')
-                try:
-                    o = models.VotoTalk.objects.get(user=request.user, talk=talk)
-                except models.VotoTalk.DoesNotExist:
-                    o = models.VotoTalk(user=request.user, talk=talk)
-                if not vote:
-                    if o.id:
-                        o.delete()
-                else:
-                    o.vote = vote
-                    o.save()
+        items = [
+            (k[5:], v) for k, v in request.POST.items() if k.startswith('vote-')
+        ]
+        try:
+            votes = parse_votes(talks, items)
+        except ValueError, e:
+            return http.HttpResponseBadRequest(str(e))
+        models.VotoTalk.objects.set_votes(request.user.id, conf.code, votes)
         if request.is_ajax():
             return http.HttpResponse('')
         else:
@@ -677,6 +685,35 @@ def voting(request):
             tpl = 'conference/voting.html'
         return render(request, tpl, ctx)
 
+@login_required
+@render_to_json
+def voting_votes(request):
+    """
+    Batched version of the POST of `voting`: the body is a JSON object
+    {"votes": {talk id: vote}} (a null or 0 vote removes the vote); returns
+    the votes of the user.
+    """
+    conf, talks, voting_allowed = get_data_for_context(request)
+    if not settings.VOTING_OPENED(conf, request.user):
+        # render_to_json turns the exceptions, Http404 included, into a 500
+        return http.HttpResponseNotFound()
+
+    if request.method == 'POST':
+        if not voting_allowed:
+            return http.HttpResponseBadRequest('user not allowed')
+        try:
+            items = json.loads(request.body)['votes'].items()
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return http.HttpResponseBadRequest('invalid body')
+        try:
+            votes = parse_votes(talks, items)
+        except ValueError, e:
+            return http.HttpResponseBadRequest(str(e))
+        ballot = models.VotoTalk.objects.set_votes(request.user.id, conf.code, votes)
+    else:
+        ballot = dataaccess.user_votes(request.user.id, conf.code)
+    return dict((str(k), v) for k, v in ballot.items())
+
 @render_to_template('conference/profile.html')
 @profile_access
 def user_profile(request, slug, profile=None, full_access=False):
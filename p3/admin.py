@@ -14,6 +14,7 @@ from assopy import models as amodels
 from assopy import stats as astats
 from assopy import utils as autils
 from conference import admin as cadmin
+from conference import dataaccess as cdata
 from conference import models as cmodels
 from conference import forms as cforms
 from p3 import models
@@ -281,8 +282,6 @@ class TicketConferenceAdmin(cadmin.TicketAdmin):
 
     def stats_data(self, request):
         from common.jsonify import json_dumps
-        from django.db.models import Q
-        from collections import defaultdict
         import datetime
 
         conferences = cmodels.Conference.objects\
@@ -290,25 +289,8 @@ class TicketConferenceAdmin(cadmin.TicketAdmin):
 
         output = {}
         for c in conferences:
-            tickets = cmodels.Ticket.objects\
-                .filter(fare__conference=c)\
-                .filter(Q(orderitem__order___complete=True) | Q(orderitem__order__method__in=('bank', 'admin')))\
-                .select_related('fare', 'orderitem__order')
-            data = {
-                'conference': defaultdict(lambda: 0),
-                'partner': defaultdict(lambda: 0),
-                'event': defaultdict(lambda: 0),
-                'other': defaultdict(lambda: 0),
-            }
-            for t in tickets:
-                tt = t.fare.ticket_type
-                date = t.orderitem.order.created.date()
-                offset = date - c.conference_start
-                data[tt][offset.days] += 1
-
-            for k, v in data.items():
-                data[k] = sorted(v.items())
-
+            data = cmodels.TicketSales.objects.curve(
+                c, sales=cdata.ticket_sales(c.code), frozen=True)
 
             dlimit = datetime.date(c.conference_start.year, 1, 1)
             deadlines = cmodels.DeadlineContent.objects\
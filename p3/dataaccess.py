@@ -2,6 +2,7 @@
 from conference import cachef
 from conference import dataaccess as cdata
 from conference import models as cmodels
+from conference import settings as csettings
 from assopy import models as amodels
 from assopy import utils as autils
 from p3 import models
@@ -9,7 +10,8 @@ from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 
 
-cache_me = cachef.CacheFunction(prefix='p3:')
+cache_me = cachef.CacheFunction(
+    prefix='p3:', local=csettings.CACHE_LOCAL, stats=csettings.CACHE_STATS)
 
 
 def profile_data(uid, preload=None):
@@ -89,22 +91,19 @@ talk_data = cache_me(
     models=(models.P3Talk,),
     key='talk:%(tid)s')(talk_data, _i_talk_data)
 
-def profiles_data(uids):
-    cached = zip(uids, profile_data.get_from_cache([ (x,) for x in uids ]))
-    missing = [ x[0] for x in cached if x[1] is cache_me.CACHE_MISS ]
-
+def _fetch_profiles(uids):
     preload = {}
     profiles = models.P3Profile.objects\
-        .filter(profile__in=missing)\
+        .filter(profile__in=uids)\
         .select_related('profile__user')
     tags = cmodels.ConferenceTaggedItem.objects\
         .filter(
             content_type=ContentType.objects.get_for_model(models.P3Profile),
-            object_id__in=missing
+            object_id__in=uids
         )\
         .values('object_id', 'tag__name')
     speakers = models.SpeakerConference.objects\
-        .filter(speaker__in=missing)
+        .filter(speaker__in=uids)
 
     for p in profiles:
         preload[p.profile_id] = {
@@ -116,16 +115,14 @@ def profiles_data(uids):
     for spk in speakers:
         preload[spk.speaker_id]['speaker'] = spk
 
-    cdata.profiles_data(missing)
+    cdata.profiles_data(uids)
+    return preload
 
-    output = []
-    for ix, e in enumerate(cached):
-        pid, val = e
-        if val is cache_me.CACHE_MISS:
-            val = profile_data(pid, preload=preload[pid])
-        output.append(val)
+profile_loader = cdata.DataLoader(profile_data, _fetch_profiles)
+cdata.profile_loader.link(profile_loader)
 
-    return output
+def profiles_data(uids):
+    return profile_loader.load_many(uids)
 
 def _user_ticket(user, conference):
     q1 = user.ticket_set.all()\
@@ -270,6 +267,74 @@ def conference_users(conference, speakers=True):
         q3 = User.objects.none()
     return q1 | q2 | q3
 
+def conference_attendees(conference):
+    """
+    Returns the attendees of the conference (see `conference_users`) with a
+    visible profile, sorted by name, as a list of dicts:
+        {'uid', 'visibility', 'country', 'speaker', 'tags'}
+
+    It's the index used by the "who's coming" page to count, filter and
+    paginate the attendees without further queries.
+    """
+    people = cmodels.AttendeeProfile.objects\
+        .filter(visibility__in=('m', 'p'))\
+        .filter(user__in=conference_users(conference))\
+        .values_list('user', 'visibility', 'p3_profile__country')\
+        .order_by('user__first_name', 'user__last_name')
+    speakers = set(cmodels.TalkSpeaker.objects\
+        .filter(talk__conference=conference, talk__status='accepted')\
+        .values_list('speaker', flat=True))
+    tags = {}
+    qs = cmodels.ConferenceTaggedItem.objects\
+        .filter(content_type=ContentType.objects.get_for_model(models.P3Profile))\
+        .values_list('object_id', 'tag__name')
+    for uid, tag in qs:
+        tags.setdefault(uid, set()).add(tag)
+
+    output = []
+    for uid, visibility, country in people:
+        output.append({
+            'uid': uid,
+            'visibility': visibility,
+            'country': country or '',
+            'speaker': uid in speakers,
+            'tags': tags.get(uid, set()),
+        })
+    return output
+
+def _i_conference_attendees(sender, **kw):
+    o = kw['instance']
+    if sender is User:
+        # saved at every login
+        if set(kw.get('update_fields') or ()) == set(['last_login']):
+            return []
+        conferences = None
+    elif sender is cmodels.Ticket:
+        conferences = [ o.fare.conference ]
+    elif sender is models.TicketConference:
+        conferences = [ o.ticket.fare.conference ]
+    elif sender is cmodels.Talk:
+        conferences = [ o.conference ]
+    elif sender is cmodels.TalkSpeaker:
+        conferences = [ o.talk.conference ]
+    elif sender is cmodels.ConferenceTaggedItem:
+        if o.content_type_id != ContentType.objects.get_for_model(models.P3Profile).id:
+            return []
+        conferences = None
+    else:
+        conferences = None
+    if conferences is None:
+        # a profile can be part of any conference
+        conferences = cmodels.Conference.objects.values_list('code', flat=True)
+    return [ 'conference_attendees:%s' % c for c in conferences ]
+
+conference_attendees = cache_me(
+    models=(
+        User, cmodels.AttendeeProfile, models.P3Profile, cmodels.ConferenceTaggedItem,
+        cmodels.Ticket, models.TicketConference, cmodels.Talk, cmodels.TalkSpeaker,),
+    key='conference_attendees:%(conference)s',
+    single_flight=True)(conference_attendees, _i_conference_attendees)
+
 def tags():
     """
     Same as `conference.dataaccess.tags` but removing data about
@@ -289,3 +354,62 @@ def tags():
 tags = cache_me(
     signals=(cdata.tags.invalidated,),
     models=(models.P3Profile, cmodels.AttendeeProfile))(tags)
+
+def _ticket_conferences(sender, o):
+    """
+    The conferences affected by a change of `o`, None if it cannot be
+    easily known.
+    """
+    if sender is cmodels.Ticket:
+        return [ o.fare.conference ]
+    elif sender is models.TicketConference:
+        return [ o.ticket.fare.conference ]
+    elif sender in (cmodels.Fare, cmodels.Talk):
+        return [ o.conference ]
+    elif sender is cmodels.TalkSpeaker:
+        return [ o.talk.conference ]
+    return None
+
+def attendee_stats(conf):
+    """
+    The summaries of the ticket based stats of the conference, see
+    `p3.stats.attendee_stats`.
+    """
+    from p3 import stats
+    return stats.attendee_stats(conf)
+
+def _i_attendee_stats(sender, **kw):
+    if sender is User:
+        # saved at every login
+        if set(kw.get('update_fields') or ()) == set(['last_login']):
+            return []
+    conferences = _ticket_conferences(sender, kw['instance'])
+    if conferences is None:
+        conferences = cmodels.Conference.objects.values_list('code', flat=True)
+    return [ 'attendee_stats:%s' % c for c in conferences ]
+
+attendee_stats = cache_me(
+    models=(
+        cmodels.Ticket, models.TicketConference, cmodels.Fare, amodels.Order, amodels.OrderItem,
+        User, cmodels.AttendeeProfile, models.P3Profile,
+        cmodels.Talk, cmodels.TalkSpeaker, cmodels.MultilingualContent,),
+    key='attendee_stats:%(conf)s')(attendee_stats, _i_attendee_stats)
+
+def presence_histogram(conference):
+    """
+    The counters of the presence of the attendees of the conference, see
+    `p3.stats.presence_histogram`.
+    """
+    from p3 import stats
+    return stats.presence_histogram(conference)
+
+def _i_presence_histogram(sender, **kw):
+    conferences = _ticket_conferences(sender, kw['instance'])
+    if conferences is None:
+        conferences = cmodels.Conference.objects.values_list('code', flat=True)
+    return [ 'presence_histogram:%s' % c for c in conferences ]
+
+presence_histogram = cache_me(
+    models=(cmodels.Ticket, models.TicketConference, cmodels.Fare, amodels.Order, amodels.OrderItem,),
+    key='presence_histogram:%(conference)s',
+    single_flight=True)(presence_histogram, _i_presence_histogram)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-renders the iCal files of the schedule of a conference (with and without
+the abstracts of the talks) to be served as static files.
+"""
+import os
+import os.path
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from conference import ical
+from p3.utils import conference2ical
+
+
+class Command(BaseCommand):
+    args = '<conference> <directory>'
+
+    def handle(self, *args, **options):
+        try:
+            conference, directory = args
+        except ValueError:
+            raise CommandError('conference and directory not specified')
+
+        for abstract in (False, True):
+            fname = conference + ('-abstract' if abstract else '') + '.ics'
+            cal = conference2ical(conference, abstract=abstract)
+            # the file is replaced atomically, the web server never serves
+            # a partial calendar
+            out = tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False)
+            try:
+                with out:
+                    for chunk in ical.iterencode(cal):
+                        out.write(chunk)
+                os.chmod(out.name, 0o644)
+                os.rename(out.name, os.path.join(directory, fname))
+            except:
+                os.unlink(out.name)
+                raise
+            self.stdout.write(os.path.join(directory, fname))
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Loads in the cache the data of all the schedules, talks, speakers, events,
+profiles and tags of a conference, in this way after a deploy (or a flush of
+the cache) the first visitors do not pay for the cold misses.
+"""
+import time
+from multiprocessing.pool import ThreadPool
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from conference import dataaccess as cdata
+from conference import models as cmodels
+from p3 import dataaccess
+from p3 import models
+
+
+def _talks(conference):
+    return cmodels.Talk.objects\
+        .filter(conference=conference)\
+        .values_list('id', flat=True)
+
+def _speakers(conference):
+    return cmodels.TalkSpeaker.objects\
+        .filter(talk__conference=conference)\
+        .values_list('speaker', flat=True)\
+        .distinct()
+
+def _profiles(conference):
+    return models.P3Profile.objects\
+        .filter(profile__user__in=dataaccess.conference_users(conference))\
+        .values_list('profile', flat=True)
+
+def _tags():
+    # p3 tags are computed from the conference ones
+    return len(dataaccess.tags())
+
+# (name, function that returns the ids, bulk accessor); the entities without
+# ids are loaded with a single call of the accessor, that returns the number
+# of items.
+ENTITIES = (
+    ('schedules',
+        lambda conf: cmodels.Schedule.objects.filter(conference=conf).values_list('id', flat=True),
+        cdata.schedules_data),
+    ('talks', _talks, cdata.talks_data),
+    ('speakers', _speakers, cdata.speakers_data),
+    ('events',
+        lambda conf: cmodels.Event.objects.filter(schedule__conference=conf).values_list('id', flat=True),
+        cdata.events),
+    ('profiles', _profiles, dataaccess.profiles_data),
+    ('tags', None, _tags),
+)
+
+
+def warm_cache(conference, concurrency=4, chunk_size=100, entities=None):
+    """
+    Loads in the cache the `entities` (all by default) of the conference,
+    every entity in chunks of `chunk_size` ids loaded by `concurrency`
+    threads. Yields (entity, count, chunks, seconds) for every entity.
+    """
+    if concurrency > 1:
+        pool = ThreadPool(concurrency)
+        def load(f, chunk):
+            try:
+                return f(chunk)
+            finally:
+                # every thread has its own connection
+                connection.close()
+        run = lambda f, chunks: pool.map(lambda c: load(f, c), chunks)
+    else:
+        pool = None
+        run = lambda f, chunks: [ f(c) for c in chunks ]
+
+    try:
+        for name, ids, accessor in ENTITIES:
+            if entities and name not in entities:
+                continue
+            start = time.time()
+            if ids is None:
+                count = accessor()
+                chunks = 1
+            else:
+                ids = list(ids(conference))
+                count = len(ids)
+                batches = [ ids[ix:ix+chunk_size] for ix in range(0, count, chunk_size) ]
+                run(accessor, batches)
+                chunks = len(batches)
+            yield name, count, chunks, time.time() - start
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+class Command(BaseCommand):
+    """
+    Warms the cache of the data of a conference, printing the time spent for
+    every entity.
+    """
+    args = '<conference>'
+    option_list = BaseCommand.option_list + (
+        make_option('--concurrency',
+            action='store',
+            dest='concurrency',
+            default=4,
+            type='int',
+            help='Number of threads that load the data',
+        ),
+        make_option('--chunk',
+            action='store',
+            dest='chunk',
+            default=100,
+            type='int',
+            help='Number of ids loaded by every call of the accessors',
+        ),
+        make_option('--only',
+            action='store',
+            dest='only',
+            default='',
+            help='Comma separated list of entities (%s)' % ', '.join(x[0] for x in ENTITIES),
+        ),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            conference = args[0]
+        except IndexError:
+            raise CommandError('conference not specified')
+        if options['concurrency'] < 1 or options['chunk'] < 1:
+            raise CommandError('concurrency and chunk must be positive')
+        entities = [ x.strip() for x in options['only'].split(',') if x.strip() ]
+        unknown = set(entities) - set(x[0] for x in ENTITIES)
+        if unknown:
+            raise CommandError('unknown entities: %s' % ', '.join(sorted(unknown)))
+
+        total = 0
+        for name, count, chunks, elapsed in warm_cache(
+                conference, options['concurrency'], options['chunk'], entities):
+            total += elapsed
+            self.stdout.write('%-10s %6d items %4d chunks %8.3fs' % (name, count, chunks, elapsed))
+        self.stdout.write('%-10s %31.3fs' % ('total', total))
@@ -5,6 +5,7 @@ from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.conf import settings
 from django.db.models import Q, Count
+from p3 import dataaccess
 from p3 import models
 from conference import models as cmodels
 
@@ -51,100 +52,248 @@ def _unassigned_tickets(conf, ticket_type='conference', only_complete=True):
         .filter(Q(p3_conference=None)|Q(name='')|Q(p3_conference__assigned_to=''))
 
 
-def shirt_sizes(conf):
-    sizes = dict(models.TICKET_CONFERENCE_SHIRT_SIZES)
-    qs = _assigned_tickets(conf)\
-        .values('p3_conference__shirt_size')\
-        .annotate(total=Count('id'))
+# columns of the ticket facts table and the fields they come from
+TICKET_FACTS = (
+    ('id', 'id'),
+    ('user', 'user'),
+    ('name', 'name'),
+    ('fare_code', 'fare__code'),
+    ('fare_type', 'fare__ticket_type'),
+    ('ticket_type', 'ticket_type'),
+    ('complete', 'orderitem__order___complete'),
+    ('p3', 'p3_conference__id'),
+    ('assigned_to', 'p3_conference__assigned_to'),
+    ('shirt_size', 'p3_conference__shirt_size'),
+    ('diet', 'p3_conference__diet'),
+    ('days', 'p3_conference__days'),
+)
+
+
+def ticket_facts(conf):
+    """
+    Loads with a single query the facts about the tickets of the conference
+    used by the statistics (the ones returned by `_tickets(conf,
+    only_complete=False)`) in a columnar table: a dict column -> tuple of
+    values, see `TICKET_FACTS`.
+    """
+    rows = _tickets(conf, only_complete=False)\
+        .order_by()\
+        .values_list(*[ x[1] for x in TICKET_FACTS ])
+    columns = zip(*rows) or [ () ] * len(TICKET_FACTS)
+    return dict((name, tuple(col)) for (name, _), col in zip(TICKET_FACTS, columns))
+
+
+def _choices_output(choices, counts):
+    # the rows follow the order of the choices, unknown values at the end
+    titles = dict(choices)
+    keys = [ k for k, _ in choices if k in counts ]
+    keys.extend(sorted(k for k in counts if k not in titles))
+    return [ {'title': titles.get(k), 'total': counts[k]} for k in keys ]
+
+
+def attendee_stats(conf):
+    """
+    Computes, in a single pass over the `ticket_facts` of the conference,
+    the summaries of the ticket based stats (`tickets_status`,
+    `shirt_sizes`, `diet_types`, `pp_tickets` and `speaker_status`);
+    returns a dict stat name -> summary.
+
+    Use the cached `p3.dataaccess.attendee_stats`.
+    """
+    facts = ticket_facts(conf)
+    emails = set(User.objects\
+        .filter(email__in=models.TicketConference.objects\
+            .filter(ticket__fare__conference=conf)\
+            .exclude(assigned_to='')\
+            .values('assigned_to'))\
+        .values_list('email', flat=True))
+    pp_codes = list(cmodels.Fare.objects\
+        .filter(conference=conf, ticket_type='partner')\
+        .order_by('code')\
+        .values_list('code', 'name', 'blob'))
+
+    counts = defaultdict(lambda: 0)
+    assignments = defaultdict(lambda: 0)
+    shirts = defaultdict(lambda: 0)
+    diets = defaultdict(lambda: 0)
+    pp_users = set()
+    ticket_users = set()
+    ticket_assignees = set()
+    for row in zip(*[ facts[x[0]] for x in TICKET_FACTS ]):
+        tid, uid, name, fare_code, fare_type, ticket_type, complete, p3, assigned_to, shirt, diet, days = row
+        if not complete:
+            continue
 
-    output = []
-    for x in qs:
-        output.append({
-            'title': sizes.get(x['p3_conference__shirt_size']),
-            'total': x['total'],
+        if fare_code == 'VOUPE03':
+            counts['voupe03_tickets'] += 1
+        if fare_type == 'partner':
+            counts[fare_code] += 1
+            pp_users.add(uid)
+        if fare_type != 'conference':
+            continue
+
+        counts['ticket_sold'] += 1
+        ticket_users.add(uid)
+        if p3 is not None and assigned_to != '':
+            ticket_assignees.add(assigned_to)
+            if assigned_to not in emails:
+                counts['orphan_tickets'] += 1
+        if not _is_assigned(p3, name, assigned_to):
+            counts['unassigned_tickets'] += 1
+            continue
+
+        counts['assigned_tickets'] += 1
+        assignments[assigned_to] += 1
+        shirts[shirt] += 1
+        diets[diet] += 1
+
+    from p3.utils import spam_recruiter_by_conf
+    counts['spam_recruiting'] = spam_recruiter_by_conf(conf).count()
+    counts['multiple_assignments'] = len([ x for x in assignments.values() if x > 1 ])
+
+    output = {
+        'shirt_sizes': _choices_output(models.TICKET_CONFERENCE_SHIRT_SIZES, shirts),
+        'diet_types': _choices_output(models.TICKET_CONFERENCE_DIETS, diets),
+    }
+
+    output['tickets_status'] = [
+        {'id': code, 'title': title, 'total': counts[code]}
+        for code, title in TICKETS_STATUS_OPTIONS
+    ]
+
+    from conference.templatetags.conference import fare_blob
+    output['pp_tickets'] = [ {'id': 'all', 'title': 'Tickets partner program', 'total': len(pp_users)} ]
+    for fcode, fname, blob in pp_codes:
+        output['pp_tickets'].append({
+            'id': fcode,
+            'total': counts[fcode],
+            'title': '%s - %s (%s)' % (fcode, fname, fare_blob({'blob': blob}, 'date')),
         })
 
+    spk_noticket = 0
+    for uid, email in Speaker.objects.byConference(conf).values_list('user', 'user__email'):
+        if uid not in ticket_users and email not in ticket_assignees:
+            spk_noticket += 1
+    output['speaker_status'] = {
+        'columns': SPEAKER_STATUS_COLUMNS,
+        'data': [
+            {'id': 'no_ticket', 'title': 'Without ticket', 'total': spk_noticket, 'note': ''},
+            _create_option('no_data', 'Without avatar or biography', _speakers_without_data(conf),
+                note='Account with gravatar are not included'),
+        ]
+    }
     return output
-shirt_sizes.short_description = "Tshirts size"
 
 
-def diet_types(conf):
-    diets = dict(models.TICKET_CONFERENCE_DIETS)
-    qs = _assigned_tickets(conf)\
-        .values('p3_conference__diet')\
-        .annotate(total=Count('id'))
+def _is_assigned(p3, name, assigned_to):
+    # same condition of `_assigned_tickets`
+    return p3 is not None and name != '' and assigned_to != ''
 
-    output = []
-    for x in qs:
-        output.append({
-            'title': diets.get(x['p3_conference__diet']),
-            'total': x['total'],
-        })
+
+def presence_groups(ticket_type):
+    """
+    The groups of `presence_histogram` a ticket contributes to.
+    """
+    return ('all',) if ticket_type == 'staff' else ('all', 'nostaff')
+
+
+def presence_ticket_days(days):
+    """
+    The keys of the histogram of the days of `presence_histogram` incremented
+    by an assigned ticket with the given `TicketConference.days`.
+    """
+    return filter(None, [ v.strip() for v in days.split(',') ]) or [ 'x' ]
+
+
+def presence_histogram(conf):
+    """
+    Computes the counters of the presence of the attendees, for the groups
+    'all' and 'nostaff':
+        {'c': assigned tickets, 'n': unassigned tickets, 'days': {day: count}}
+    The unassigned tickets include the incomplete bank orders; the assigned
+    tickets without days are counted under the day 'x'.
+
+    Use the cached `p3.dataaccess.presence_histogram`, updated in place when
+    the days of a ticket change.
+    """
+    facts = ticket_facts(conf)
+    output = dict((g, {'c': 0, 'n': 0, 'days': {}}) for g in ('all', 'nostaff'))
+    columns = [ facts[x] for x in ('name', 'fare_type', 'ticket_type', 'complete', 'p3', 'assigned_to', 'days') ]
+    for name, fare_type, ticket_type, complete, p3, assigned_to, days in zip(*columns):
+        if fare_type != 'conference':
+            continue
+        groups = presence_groups(ticket_type)
+        if not _is_assigned(p3, name, assigned_to):
+            for g in groups:
+                output[g]['n'] += 1
+        elif complete:
+            for g in groups:
+                output[g]['c'] += 1
+                for d in presence_ticket_days(days):
+                    output[g]['days'][d] = output[g]['days'].get(d, 0) + 1
+    return output
+
+
+def presence_by_day(conf, forecast=False):
+    """
+    Returns the number of attendees (staff excluded) for every day of the
+    conference, a dict 'YYYY-MM-DD' -> count; with `forecast` the count is
+    estimated including the unassigned tickets.
+    """
+    h = dataaccess.presence_histogram(conf)['nostaff']
+    output = {}
+    for day, count in h['days'].items():
+        if day != 'x':
+            output[day] = _presence_estimate(h, count) if forecast else count
     return output
+
+
+def _presence_estimate(h, count):
+    # the tickets without days are not used to estimate the distribution
+    dX = h['days'].get('x', 0)
+    return int(round(float(count) / (h['c'] - dX) * (h['c'] + h['n'])))
+
+
+def shirt_sizes(conf):
+    return dataaccess.attendee_stats(conf)['shirt_sizes']
+shirt_sizes.short_description = "Tshirts size"
+
+
+def diet_types(conf):
+    return dataaccess.attendee_stats(conf)['diet_types']
 diet_types.short_description = "Diet"
 
 
-def presence_days(conf, code=None):
-    qs = {
-        'all': {
-            'c': _assigned_tickets(conf),
-            'n': _unassigned_tickets(conf, only_complete=False),
-        },
-        'nostaff': {
-            'c': _assigned_tickets(conf).exclude(ticket_type='staff'),
-            'n': _unassigned_tickets(conf, only_complete=False).exclude(ticket_type='staff'),
-        }
-    }
-    totals = {}
-    for key in qs:
-        totals[key] = {
-            'c': qs[key]['c'].count(),
-            'n': qs[key]['n'].count(),
-        }
-    output = {
-        'columns': (
-            ('total', 'Total'),
-            ('total_nc', '<span title="Estimate with unassigned tickets and incomplete '
-                                      'bank orders">Estimate with NA/NC</span>'),
-        ),
-        'data': [],
-    }
+PRESENCE_DAYS_COLUMNS = (
+    ('total', 'Total'),
+    ('total_nc', '<span title="Estimate with unassigned tickets and incomplete '
+                              'bank orders">Estimate with NA/NC</span>'),
+)
 
-    days = {
-        'all': defaultdict(lambda: 0),
-        'nostaff': defaultdict(lambda: 0),
-    }
-    for key in qs:
-        for x in qs[key]['c'].values_list('p3_conference__days', flat=True):
-            val = filter(None, map(lambda v: v.strip(), x.split(',')))
-            if not val:
-                days[key]['x'] += 1
-            else:
-                for v in val:
-                    days[key][v] += 1
-
-    for key in days:
-        dX = days[key].get('x', 0)
-        tC = totals[key]['c']
-        tN = totals[key]['n']
-        for day, count in sorted(days[key].items()):
-            if day != 'x':
-                nc = float(count) / (tC - dX) * (tC + tN)
-            else:
-                nc = 0.0
+
+def presence_days(conf, code=None):
+    histogram = dataaccess.presence_histogram(conf)
+    data = []
+    for key, h in histogram.items():
+        for day, count in sorted(h['days'].items()):
             title = day
             if key == 'nostaff':
                 title += ' (no staff)'
-            output['data'].append({
+            data.append({
                 'title': title,
                 'total': count,
-                'total_nc': int(round(nc)),
+                'total_nc': _presence_estimate(h, count) if day != 'x' else 0,
             })
-    return output
+    return {
+        'columns': PRESENCE_DAYS_COLUMNS,
+        'data': data,
+    }
 presence_days.short_description = "Conference attendance"
 
 
 def tickets_status(conf, code=None):
+    if code is None:
+        return dataaccess.attendee_stats(conf)['tickets_status']
     orphan_tickets = _tickets(conf, 'conference')\
         .filter(p3_conference__isnull=False)\
         .exclude(p3_conference__assigned_to='')\
@@ -160,27 +309,22 @@ def tickets_status(conf, code=None):
     voupe03 = _tickets(conf, fare_code='VOUPE03')
     from p3.utils import spam_recruiter_by_conf
     spam_recruiting = spam_recruiter_by_conf(conf)
-    if code is None:
-        # FIXME: remove hotel and sim (sim_tickets has been removed from the parameters of ticket_status_no_code function
-        output = ticket_status_no_code(conf, multiple_assignments, orphan_tickets, spam_recruiting, voupe03)
-
-    else:
-        if code in ('ticket_sold', 'assigned_tickets', 'unassigned_tickets', 'multiple_assignments', ):
-            output = ticket_status_for_un_assigned_sold_tickets(code, conf, multiple_assignments)
+    if code in ('ticket_sold', 'assigned_tickets', 'unassigned_tickets', 'multiple_assignments', ):
+        output = ticket_status_for_un_assigned_sold_tickets(code, conf, multiple_assignments)
 
-        elif code in ('orphan_tickets',):
-            output = ticket_status_for_orphant_tickets(code, orphan_tickets)
+    elif code in ('orphan_tickets',):
+        output = ticket_status_for_orphant_tickets(code, orphan_tickets)
 
-        elif code in ('voupe03_tickets',):
-            output = ticket_status_for_voupe03_tickets(code, voupe03)
+    elif code in ('voupe03_tickets',):
+        output = ticket_status_for_voupe03_tickets(code, voupe03)
 
-        elif code == 'spam_recruiting':
-            output = ticket_status_for_spam_recruiting(spam_recruiting)
+    elif code == 'spam_recruiting':
+        output = ticket_status_for_spam_recruiting(spam_recruiting)
 
-        if 0:
-            # elif code in ('sim_tickets',):
-            #     output = ticket_status_for_sim_tickets(code, sim_tickets)
-            pass
+    if 0:
+        # elif code in ('sim_tickets',):
+        #     output = ticket_status_for_sim_tickets(code, sim_tickets)
+        pass
 
     return output
 
@@ -385,27 +529,28 @@ if 0: # FIXME: remove hotels and sim
         return output
 
 
-def ticket_status_no_code(conf, multiple_assignments, orphan_tickets, spam_recruiting, voupe03):
-    return [
-        _create_option('ticket_sold', 'Sold tickets', _tickets(conf, 'conference')),
-        _create_option('assigned_tickets', 'Assigned tickets', _assigned_tickets(conf)),
-        _create_option('unassigned_tickets', 'Unassigned tickets', _unassigned_tickets(conf)),
-        # _create_option('sim_tickets', 'Tickets with SIM card orders', sim_tickets),  # FIXME: remove hotels and sim
-        _create_option('voupe03_tickets', 'Social event tickets (VOUPE03)', voupe03),
-        _create_option('spam_recruiting', 'Recruiting emails (opt-in)', spam_recruiting),
-        _create_option('multiple_assignments', 'Tickets assigned to the same person', multiple_assignments),
-        _create_option('orphan_tickets', 'Assigned tickets without user record (orphaned)', orphan_tickets)
-    ]
+TICKETS_STATUS_OPTIONS = (
+    ('ticket_sold', 'Sold tickets'),
+    ('assigned_tickets', 'Assigned tickets'),
+    ('unassigned_tickets', 'Unassigned tickets'),
+    # ('sim_tickets', 'Tickets with SIM card orders'),  # FIXME: remove hotels and sim
+    ('voupe03_tickets', 'Social event tickets (VOUPE03)'),
+    ('spam_recruiting', 'Recruiting emails (opt-in)'),
+    ('multiple_assignments', 'Tickets assigned to the same person'),
+    ('orphan_tickets', 'Assigned tickets without user record (orphaned)'),
+)
 
 
 tickets_status.short_description = 'Tickets stats'
 
-def speaker_status(conf, code=None):
-    t = _tickets(conf, 'conference')
-    spk_noticket = Speaker.objects.byConference(conf)\
-        .exclude(user__in=t.values('user'))\
-        .exclude(user__email__in=t.extra(where=["assigned_to!=''"]).values('p3_conference__assigned_to'))
-    spk_nodata = Speaker.objects.byConference(conf)\
+SPEAKER_STATUS_COLUMNS = (
+    ('total', 'Total'),
+    ('note', 'Note'),
+)
+
+
+def _speakers_without_data(conf):
+    return Speaker.objects.byConference(conf)\
         .filter(Q(
                 user__attendeeprofile__image='',
                 user__attendeeprofile__p3_profile__image_gravatar=False,
@@ -416,17 +561,16 @@ def speaker_status(conf, code=None):
                 user__attendeeprofile__bios__content='bios',
                 user__attendeeprofile__bios__body='')
             )
+
+
+def speaker_status(conf, code=None):
+    t = _tickets(conf, 'conference')
+    spk_noticket = Speaker.objects.byConference(conf)\
+        .exclude(user__in=t.values('user'))\
+        .exclude(user__email__in=t.extra(where=["assigned_to!=''"]).values('p3_conference__assigned_to'))
+    spk_nodata = _speakers_without_data(conf)
     if code is None:
-        output = {
-            'columns': (
-                ('total', 'Total'),
-                ('note', 'Note'),
-            ),
-            'data': [
-                _create_option('no_ticket', 'Without ticket', spk_noticket, note=''),
-                _create_option('no_data', 'Without avatar or biography', spk_nodata, note='Account with gravatar are not included'),
-            ]
-        }
+        output = dataaccess.attendee_stats(conf)['speaker_status']
     else:
         if code == 'no_ticket':
             qs = spk_noticket
@@ -577,6 +721,8 @@ def conference_speakers_day(conf, code=None):
 conference_speakers_day.short_description = 'Speaker for day'
 
 def pp_tickets(conf, code=None):
+    if code is None:
+        return dataaccess.attendee_stats(conf)['pp_tickets']
     fcodes = cmodels.Fare.objects\
         .filter(conference=conf, ticket_type='partner')\
         .order_by('code')\
@@ -585,51 +731,36 @@ def pp_tickets(conf, code=None):
     for fcode in fcodes:
         qs[fcode] = _tickets(conf, fare_code=fcode)
     all_attendees = User.objects.filter(id__in=_tickets(conf, ticket_type='partner').values('user'))
-    if code is None:
-        output = [
-            _create_option('all', 'Tickets partner program', all_attendees)
-        ]
-        from conference.templatetags.conference import fare_blob
-        titles = {}
-        for f in cmodels.Fare.objects.filter(code__in=fcodes):
-            titles[f.code] = '%s (%s)' % (f.name, fare_blob(f, 'date'))
-        for fcode in fcodes:
-            output.append({
-                'id': fcode,
-                'total': qs[fcode].count(),
-                'title': fcode + ' - ' + titles[fcode],
+    output = {
+        'columns': (
+            ('name', 'Attendee name'),
+            ('buyer', 'Buyer'),
+            ('email', 'Email'),
+        ),
+        'data': [],
+    }
+    data = output['data']
+    if code == 'all':
+        for x in all_attendees:
+            data.append({
+                'name': '',
+                'buyer': '<a href="%s">%s %s</a>' % (
+                    reverse('admin:auth_user_change', args=(x.id,)),
+                    x.first_name,
+                    x.last_name),
+                'email': x.email,
+                'uid': x.id,
             })
     else:
-        output = {
-            'columns': (
-                ('name', 'Attendee name'),
-                ('buyer', 'Buyer'),
-                ('email', 'Email'),
-            ),
-            'data': [],
-        }
-        data = output['data']
-        if code == 'all':
-            for x in all_attendees:
-                data.append({
-                    'name': '',
-                    'buyer': '<a href="%s">%s %s</a>' % (
-                        reverse('admin:auth_user_change', args=(x.id,)),
-                        x.first_name,
-                        x.last_name),
-                    'email': x.email,
-                    'uid': x.id,
-                })
-        else:
-            for x in qs[code]:
-                data.append({
-                    'name': x.name or ('%s %s' % (x.user.first_name, x.user.last_name)),
-                    'buyer': '<a href="%s">%s %s</a>' % (
-                        reverse('admin:auth_user_change', args=(x.user_id,)),
-                        x.user.first_name,
-                        x.user.last_name),
-                    'email': x.user.email,
-                    'uid': x.user_id,
-                })
+        for x in qs[code]:
+            data.append({
+                'name': x.name or ('%s %s' % (x.user.first_name, x.user.last_name)),
+                'buyer': '<a href="%s">%s %s</a>' % (
+                    reverse('admin:auth_user_change', args=(x.user_id,)),
+                    x.user.first_name,
+                    x.user.last_name),
+                'email': x.user.email,
+                'uid': x.user_id,
+            })
     return output
 pp_tickets.short_description = 'Tickets Partner program'
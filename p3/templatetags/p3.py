@@ -473,7 +473,7 @@ def box_next_events(context):
 
 @register.assignment_tag()
 def p3_profile_data(uid):
-    return dataaccess.profile_data(uid)
+    return dataaccess.profile_loader.load(uid)
 
 @register.assignment_tag()
 def p3_profiles_data(uids):
@@ -605,7 +605,7 @@ def render_profile_box(context, profile, conference=None, user_message="auto"):
     if conference is None:
         conference = settings.CONFERENCE_CONFERENCE
     if isinstance(profile, int):
-        profile = dataaccess.profile_data(profile)
+        profile = dataaccess.profile_loader.load(profile)
     ctx = Context(context)
     ctx.update({
         'profile': profile,
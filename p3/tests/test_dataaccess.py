@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+from django_factory_boy import auth as auth_factories
+
+from conference.models import ConferenceTag
+from conference.tests.factories.attendee_profile import AttendeeProfileFactory
+from conference.tests.factories.conference import ConferenceFactory
+from conference.tests.factories.fare import FareFactory, TicketFactory
+from p3 import dataaccess
+from p3.models import P3Profile, TicketConference
+
+
+@override_settings(CACHES=settings.ENABLE_LOCMEM_CACHE)
+class ConferenceAttendeesTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.conference = ConferenceFactory()
+        self.fare = FareFactory(conference=self.conference.code, code='TRSP')
+        self.users = [
+            auth_factories.UserFactory(first_name=name, last_name='X')
+            for name in ('Bob', 'Alice', 'Carol', 'Dave')
+        ]
+        self.profiles = [
+            AttendeeProfileFactory(user=u, visibility=v)
+            for u, v in zip(self.users, ('p', 'm', 'p', 'x'))
+        ]
+        # Bob bought a ticket for Carol
+        t = TicketFactory(user=self.users[0], fare=self.fare)
+        TicketConference.objects.create(ticket=t, assigned_to=self.users[2].email)
+        t = TicketFactory(user=self.users[1], fare=self.fare)
+        TicketConference.objects.create(ticket=t, assigned_to='')
+
+    def attendees(self):
+        return [ (p['uid'], p['visibility']) for p in dataaccess.conference_attendees(self.conference.code) ]
+
+    def test_index(self):
+        u = self.users
+        self.assertEqual(self.attendees(), [ (u[1].id, 'm'), (u[2].id, 'p') ])
+
+        p3p = P3Profile.objects.get(profile=self.profiles[2])
+        p3p.country = 'IT'
+        p3p.save()
+        p3p.interests.add(ConferenceTag.objects.create(name='python', slug='python'))
+        data = dataaccess.conference_attendees(self.conference.code)[1]
+        self.assertEqual((data['country'], data['tags']), ('IT', set(['python'])))
+
+        self.profiles[1].visibility = 'x'
+        self.profiles[1].save()
+        self.assertEqual(self.attendees(), [ (u[2].id, 'p') ])
+
+        # the ticket is assigned to Dave
+        tc = TicketConference.objects.get(ticket__user=u[0])
+        tc.assigned_to = u[3].email
+        tc.save()
+        self.profiles[3].visibility = 'p'
+        self.profiles[3].save()
+        self.assertEqual(self.attendees(), [ (u[3].id, 'p') ])
+
+    def test_not_invalidated_by_login(self):
+        self.attendees()
+        self.users[1].save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            self.attendees()
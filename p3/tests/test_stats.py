@@ -1,5 +1,14 @@
+import datetime
+from collections import defaultdict
+from StringIO import StringIO
+
 import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import Q
 from django.test import TestCase
+from django.test.utils import override_settings
 from django_factory_boy import auth as auth_factories
 
 from assopy.stripe.tests.factories import (
@@ -8,10 +17,14 @@ from assopy.stripe.tests.factories import (
     VatFactory
 )
 from assopy.tests.factories.order import CreditCardOrderFactory
+from conference.models import Conference, Ticket, TicketSales
 from conference.tests.factories.conference import ConferenceFactory
 from conference.tests.factories.fare import TicketFactory, FareFactory
 from p3.tests.factories.ticket_conference import TicketConferenceFactory
+from conference import dataaccess as cdata
+from p3 import dataaccess
 from p3.models import TICKET_CONFERENCE_SHIRT_SIZES, TICKET_CONFERENCE_DIETS
+from p3.tests.factories.schedule import ScheduleFactory
 
 from p3.stats import shirt_sizes, diet_types
 
@@ -108,3 +121,193 @@ class StatsTestCase(TestCase):
     def test_pp_tickets(self):
         from p3.stats import pp_tickets
         repartition = pp_tickets(self.conference)
+
+
+@override_settings(CACHES=settings.ENABLE_LOCMEM_CACHE)
+class TicketsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.conference = ConferenceFactory()
+        self.assopy_user = AssopyUserFactory()
+        self.vat = VatFactory()
+        self.fare = FareFactory(conference=self.conference.code, ticket_type='conference', code='TRSP')
+        self.email = auth_factories.UserFactory().email
+        with mock.patch('email_template.utils.email'), mock.patch('django.core.mail.send_mail'):
+            self.a = self.ticket(assigned_to=self.email, name='A', days='2018-07-23, 2018-07-24')
+            self.ticket(assigned_to=self.email, name='B')
+            self.ticket(assigned_to='', name='C')
+            self.ticket(assigned_to='', complete=False)
+            self.ticket(assigned_to='ghost@example.com', name='D', days='2018-07-23', ticket_type='staff')
+            self.ticket(assigned_to=None)
+            self.ticket(assigned_to=self.email, name='E', frozen=True)
+            self.ticket(fare=FareFactory(
+                conference=self.conference.code, ticket_type='partner', code='PP01', blob='date = 2018-07-23'))
+            self.ticket(fare=FareFactory(conference=self.conference.code, ticket_type='event', code='VOUPE03'))
+
+    def ticket(self, fare=None, assigned_to='', complete=True, frozen=False, **kw):
+        t = TicketFactory(fare=fare or self.fare, user=self.assopy_user.user, frozen=frozen,
+            name=kw.pop('name', ''), ticket_type=kw.pop('ticket_type', 'standard'))
+        if assigned_to is not None:
+            TicketConferenceFactory(ticket=t, assigned_to=assigned_to, **kw)
+        order = CreditCardOrderFactory(user=self.assopy_user, payment='cc' if complete else 'bank')
+        order._complete = complete
+        order.save()
+        OrderItemFactory(order=order, ticket=t, price=1, vat=self.vat)
+        return t
+
+
+class AttendeeStatsTestCase(TicketsTestCase):
+    def test_same_totals_of_the_querysets(self):
+        from p3.stats import (
+            _assigned_tickets, _tickets, _unassigned_tickets, pp_tickets, presence_days, tickets_status)
+        conf = self.conference.code
+        expected = {
+            'ticket_sold': _tickets(conf, 'conference').count(),
+            'assigned_tickets': _assigned_tickets(conf).count(),
+            'unassigned_tickets': _unassigned_tickets(conf).count(),
+            'voupe03_tickets': 1,
+            'spam_recruiting': 0,
+            'multiple_assignments': 1,
+            'orphan_tickets': 1,
+        }
+        self.assertEqual((expected['ticket_sold'], expected['assigned_tickets']), (5, 3))
+        self.assertEqual(dict((x['id'], x['total']) for x in tickets_status(conf)), expected)
+        self.assertEqual(
+            [ (x['id'], x['total']) for x in pp_tickets(conf) ],
+            [ ('all', 1), ('PP01', 1) ])
+
+        # 3 assigned tickets (1 staff), 3 unassigned (1 incomplete bank
+        # order); the ticket without days counts as 'x'
+        self.assertEqual(sorted((x['title'], x['total'], x['total_nc']) for x in presence_days(conf)['data']), [
+            ('2018-07-23', 2, 6),
+            ('2018-07-23 (no staff)', 1, 5),
+            ('2018-07-24', 1, 3),
+            ('2018-07-24 (no staff)', 1, 5),
+            ('x', 1, 0),
+            ('x (no staff)', 1, 0),
+        ])
+
+        with self.assertNumQueries(0):
+            tickets_status(conf)
+            shirt_sizes(conf)
+            diet_types(conf)
+            presence_days(conf)
+
+    def test_invalidation(self):
+        from p3.stats import tickets_status
+        conf = self.conference.code
+        self.assertEqual(tickets_status(conf)[0]['total'], 5)
+        with mock.patch('email_template.utils.email'), mock.patch('django.core.mail.send_mail'):
+            self.ticket(assigned_to='')
+        self.assertEqual(tickets_status(conf)[0]['total'], 6)
+
+    def test_presence_days_invalidation(self):
+        from p3.stats import presence_by_day, presence_histogram
+        conf = self.conference.code
+        ScheduleFactory(conference=conf, date=datetime.date(2018, 7, 23))
+        s2 = ScheduleFactory(conference=conf, date=datetime.date(2018, 7, 24))
+        self.assertEqual(presence_by_day(conf), {'2018-07-23': 1, '2018-07-24': 1})
+
+        tc = self.a.p3_conference
+        tc.days = '2018-07-24'
+        tc.save()
+        self.assertEqual(presence_by_day(conf), {'2018-07-24': 1})
+        with self.assertNumQueries(0):
+            self.assertEqual(presence_by_day(conf), {'2018-07-24': 1})
+        self.assertEqual(dataaccess.presence_histogram(conf), presence_histogram(conf))
+        self.assertEqual(settings.CONFERENCE_SCHEDULE_ATTENDEES(s2, False), 1)
+        self.assertEqual(
+            sorted(settings.CONFERENCE_SCHEDULE_ATTENDEES(conf, True).values()), [0, 5])
+
+        tc.assigned_to = ''
+        tc.save()
+        self.assertEqual(dataaccess.presence_histogram(conf), presence_histogram(conf))
+        self.assertEqual(presence_by_day(conf), {})
+
+
+class TicketSalesTestCase(TicketsTestCase):
+    def setUp(self):
+        super(TicketSalesTestCase, self).setUp()
+        Conference.objects\
+            .filter(code=self.conference.code)\
+            .update(conference_start=datetime.date.today() + datetime.timedelta(days=30),
+                    conference_end=datetime.date.today() + datetime.timedelta(days=35))
+        self.conference = Conference.objects.get(code=self.conference.code)
+
+    def naive_curve(self, frozen):
+        data = defaultdict(lambda: defaultdict(lambda: 0))
+        tickets = Ticket.objects\
+            .filter(fare__conference=self.conference)\
+            .filter(Q(orderitem__order___complete=True) | Q(orderitem__order__method__in=('bank', 'admin')))
+        if not frozen:
+            tickets = tickets.filter(frozen=False)
+        for t in tickets:
+            offset = t.orderitem.order.created.date() - self.conference.conference_start
+            data[t.fare.ticket_type][offset.days] += 1
+        return dict((k, sorted(v.items())) for k, v in data.items())
+
+    def test_same_curve_of_the_tickets(self):
+        for frozen in (False, True):
+            curve = dict(
+                (k, v) for k, v in TicketSales.objects.curve(self.conference, frozen=frozen).items() if v)
+            self.assertEqual(curve, self.naive_curve(frozen))
+        self.assertEqual(TicketSales.objects.curve(self.conference)['conference'], [ (-30, 6) ])
+        # the current conference is not stored
+        self.assertFalse(TicketSales.objects.exists())
+
+    def test_past_conference_rollup(self):
+        code = self.conference.code
+        Conference.objects\
+            .filter(code=code)\
+            .update(conference_end=datetime.date.today() - datetime.timedelta(days=1))
+        sales = TicketSales.objects.sales(code)
+        self.assertEqual(
+            sorted(TicketSales.objects.values_list('ticket_type', 'date', 'tickets', 'frozen')),
+            sorted(sales))
+        with mock.patch('email_template.utils.email'), mock.patch('django.core.mail.send_mail'):
+            self.ticket(assigned_to='')
+        with self.assertNumQueries(1):
+            self.assertEqual(TicketSales.objects.sales(code), sales)
+
+        TicketSales.objects.rebuild(code)
+        self.assertEqual(dict((x[0], x[2]) for x in TicketSales.objects.sales(code))['conference'], 8)
+
+    def test_rebuild_command(self):
+        code = self.conference.code
+        Conference.objects\
+            .filter(code=code)\
+            .update(conference_end=datetime.date.today() - datetime.timedelta(days=1))
+        cdata.ticket_sales(code)
+        with mock.patch('email_template.utils.email'), mock.patch('django.core.mail.send_mail'):
+            self.ticket(assigned_to='')
+        # the rollup of a past conference is not updated
+        self.assertEqual(dict((x[0], x[2]) for x in cdata.ticket_sales(code))['conference'], 7)
+
+        call_command('rebuild_ticket_sales', code, stdout=StringIO())
+        self.assertEqual(dict((x[0], x[2]) for x in TicketSales.objects.sales(code))['conference'], 8)
+        with self.assertNumQueries(0):
+            self.assertEqual(dict((x[0], x[2]) for x in cdata.ticket_sales(code))['conference'], 8)
+
+    def test_past_conference_concurrent_rollup(self):
+        code = self.conference.code
+        Conference.objects\
+            .filter(code=code)\
+            .update(conference_end=datetime.date.today() - datetime.timedelta(days=1))
+        sales = TicketSales.objects.sales(code)
+        stored = TicketSales.objects.count()
+        # another request has stored the rows after they have been read
+        with mock.patch.object(TicketSales.objects, 'filter', return_value=TicketSales.objects.none()):
+            self.assertEqual(sorted(TicketSales.objects.sales(code)), sorted(sales))
+        self.assertEqual(TicketSales.objects.count(), stored)
+
+    def test_invalidation(self):
+        code = self.conference.code
+        self.assertEqual(cdata.ticket_sales(code), TicketSales.objects.daily_sales(code))
+        with self.assertNumQueries(0):
+            cdata.ticket_sales(code)
+        with mock.patch('email_template.utils.email'), mock.patch('django.core.mail.send_mail'):
+            t = self.ticket(assigned_to='')
+        self.assertEqual(dict((x[0], x[2]) for x in cdata.ticket_sales(code))['conference'], 8)
+        t.frozen = True
+        t.save()
+        self.assertEqual(dict((x[0], x[3]) for x in cdata.ticket_sales(code))['conference'], 2)
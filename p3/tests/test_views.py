@@ -1,12 +1,19 @@
+import datetime
 import unittest
 
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.test import RequestFactory, TestCase
 from django.test import override_settings
 from django_factory_boy import auth as auth_factories
 
+from conference import ical
 from conference.tests.factories.attendee_profile import AttendeeProfileFactory
 from conference.tests.factories.conference import ConferenceFactory
+from conference.tests.factories.event import EventFactory
+from conference.tests.factories.talk import TalkSpeakerFactory
 from p3.tests.factories.schedule import ScheduleFactory
 
 
@@ -202,3 +209,52 @@ class TestView(TestCase):
         })
         response = self.client.get(url, follow=True)
         self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=settings.ENABLE_LOCMEM_CACHE)
+class TestScheduleIcsConditionalGet(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.conference = ConferenceFactory(code='epbeta')
+        self.schedule = ScheduleFactory(conference=self.conference.code)
+        self.factory = RequestFactory()
+
+    def get(self, **headers):
+        from p3.views.schedule import schedule_ics
+        request = self.factory.get('/', **headers)
+        request.user = AnonymousUser()
+        return schedule_ics(request, self.conference.code)
+
+    def test_not_modified(self):
+        from p3.views.schedule import _schedule_ics_etag
+        request = self.factory.get('/')
+        etag = _schedule_ics_etag(request, self.conference.code)
+        response = self.get(HTTP_IF_NONE_MATCH='"%s"' % etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], '"%s"' % etag)
+        self.assertIn('Last-Modified', response)
+
+        EventFactory(schedule=self.schedule, start_time=datetime.time(10), duration=30)
+        self.assertNotEqual(_schedule_ics_etag(request, self.conference.code), etag)
+
+    def test_talk_changes(self):
+        from p3.views.schedule import _schedule_ics_etag
+        request = self.factory.get('/')
+        ts = TalkSpeakerFactory(talk__conference=self.conference.code)
+        EventFactory(schedule=self.schedule, talk=ts.talk, start_time=datetime.time(10), duration=30)
+        etag = _schedule_ics_etag(request, self.conference.code)
+
+        ts.talk.setAbstract('new abstract')
+        self.assertNotEqual(_schedule_ics_etag(request, self.conference.code), etag)
+
+        etag = _schedule_ics_etag(request, self.conference.code)
+        user = ts.speaker.user
+        user.first_name = 'New'
+        user.save()
+        self.assertNotEqual(_schedule_ics_etag(request, self.conference.code), etag)
+
+    def test_iterencode(self):
+        cal = ical.Calendar('1', [ ical.Event(uid=x, start=datetime.datetime(2018, 7, 23)) for x in range(50) ])
+        chunks = list(ical.iterencode(cal, size=100))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(''.join(chunks), ''.join(cal.encode()))
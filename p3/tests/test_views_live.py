@@ -1,10 +1,13 @@
 import datetime
+import json
 
 from django.core.urlresolvers import reverse
 from django.test import TestCase, override_settings
 
 from conference.tests.factories.attendee_profile import AttendeeProfileFactory
+from conference.models import EventTrack
 from conference.tests.factories.conference import ConferenceFactory
+from conference.tests.factories.event import EventFactory
 
 from django_factory_boy import auth as auth_factories
 
@@ -70,3 +73,27 @@ class TestLiveViews(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.get('content-type'), 'application/json')
         self.assertJSONEqual(response.content, {})
+
+    @override_settings(CONFERENCE_CONFERENCE='epbeta', DEBUG=False)
+    def test_p3_live_events_current_and_next(self):
+        conference = ConferenceFactory(code='epbeta', conference_start=datetime.date.today())
+        schedule = ScheduleFactory(conference=conference, date=conference.conference_start)
+        track = TrackFactory(schedule=schedule, track='track1')
+        now = datetime.datetime.now()
+        if not datetime.time(0, 10) <= now.time() < datetime.time(23, 30):
+            # too close to midnight
+            return
+        start = (now - datetime.timedelta(minutes=10)).time()
+        e1 = EventFactory(schedule=schedule, start_time=start, duration=60)
+        e2 = EventFactory(schedule=schedule, start_time=datetime.time(23, 59), duration=1)
+        for e in (e1, e2):
+            EventTrack.objects.create(event=e, track=track)
+
+        response = self.client.get(reverse('p3-live-events'))
+        self.assertEqual(response.status_code, 200)
+        output = json.loads(response.content)
+        self.assertEqual(output['track1']['id'], e1.id)
+        self.assertEqual(output['track1']['next']['name'], e2.talk.title)
+
+        response = self.client.get(reverse('p3-live-track-events', kwargs={'track': 'track1'}))
+        self.assertEqual([ x['name'] for x in json.loads(response.content) ], [ e1.talk.title, e2.talk.title ])
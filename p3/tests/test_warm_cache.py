@@ -0,0 +1,44 @@
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from conference import dataaccess as cdata
+from conference.models import TalkSpeaker
+from conference.tests.factories.conference import ConferenceFactory
+from conference.tests.factories.event import EventFactory
+from p3.management.commands.warm_conference_cache import warm_cache
+from p3.tests.factories.schedule import ScheduleFactory
+
+
+@override_settings(CACHES=settings.ENABLE_LOCMEM_CACHE)
+class WarmCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.conference = ConferenceFactory()
+        self.schedule = ScheduleFactory(conference=self.conference.code, date=datetime.date(2018, 7, 23))
+        self.events = [
+            EventFactory(schedule=self.schedule, start_time=datetime.time(10 + x))
+            for x in range(3)
+        ]
+        for e in self.events:
+            e.talk.conference = self.conference.code
+            e.talk.save()
+
+    def test_warm_cache(self):
+        report = list(warm_cache(self.conference.code, concurrency=1, chunk_size=2))
+        self.assertEqual(
+            [ x[:3] for x in report if x[0] in ('schedules', 'talks', 'events') ],
+            [ ('schedules', 1, 1), ('talks', 3, 2), ('events', 3, 2) ])
+
+        talks = [ e.talk_id for e in self.events ]
+        speakers = TalkSpeaker.objects.filter(talk__in=talks).values_list('speaker', flat=True)
+        speakers = list(speakers)
+        with self.assertNumQueries(0):
+            cdata.schedules_data([ self.schedule.id ])
+            cdata.talks_data(talks)
+            cdata.speakers_data(speakers)
+            cdata.events(eids=[ e.id for e in self.events ])
+            cdata.tags()
@@ -183,18 +183,23 @@ def invalidate_template_cache(fragment_name, *variables):
     return
 
 def conference2ical(conf, user=None, abstract=False):
-    from conference import dataaccess
     from conference import models as cmodels
+    from conference.templatetags.conference import name_abbrv
     from datetime import timedelta
+    import re
 
     curr = cmodels.Conference.objects.current()
     try:
         hotel = cmodels.SpecialPlace.objects.get(type='conf-hq')
     except cmodels.SpecialPlace.DoesNotExist:
-        hotel = None
+        coordinates = None
     else:
         if not hotel.lat or not hotel.lng:
-            hotel = None
+            coordinates = None
+        else:
+            coordinates = [hotel.lat, hotel.lng]
+    event_url = settings.DEFAULT_URL_PREFIX + '/p3/event/'
+    anchor = re.compile(r'<a href="(.*)">(.*)</a>')
 
     def altf(data, component):
         if component == 'calendar':
@@ -209,50 +214,49 @@ def conference2ical(conf, user=None, abstract=False):
                 data['ttl'] = timedelta(days=365)
         elif component == 'event':
             eid = data['uid']
-            data['uid'] = settings.DEFAULT_URL_PREFIX + '/p3/event/' + str(data['uid'])
+            data['uid'] = event_url + str(data['uid'])
             data['organizer'] = ('mailto:info@europython.eu', {'CN': 'EuroPython'})
-            if hotel:
-                data['coordinates'] = [hotel.lat, hotel.lng]
+            if coordinates:
+                data['coordinates'] = coordinates
             if not isinstance(data['summary'], tuple):
                 # this is a custom event, if it starts with an anchor I can
                 # extract the reference
-                import re
-                m = re.match(r'<a href="(.*)">(.*)</a>', data['summary'])
+                m = anchor.match(data['summary'])
                 if m:
                     url = m.group(1)
                     if url.startswith('/'):
                         url = settings.DEFAULT_URL_PREFIX + url
                     data['summary'] = (m.group(2), {'ALTREP': url})
             if abstract:
-                e = dataaccess.event_data(eid)
+                e = events_data[eid]
                 if e['talk']:
-                    from conference.templatetags.conference import name_abbrv
                     speakers = [ name_abbrv(s['name']) for s in e['talk']['speakers'] ]
                     speakers = ", ".join(speakers)
                     data['summary'] = (data['summary'][0] + ' by ' + speakers, data['summary'][1])
                 ab = e['talk']['abstract'] if e['talk'] else e['abstract']
                 data['description'] = ab
         return data
+    from conference.utils import TimeTable2
+    from conference.utils import timetables2ical as f
     if user is None:
-        from conference.utils import conference2ical as f
-        cal = f(conf, altf=altf)
+        sids = cmodels.Schedule.objects\
+            .filter(conference=conf)\
+            .values_list('id', flat=True)
+        timetables = map(TimeTable2.fromSchedule, sids)
     else:
-        from conference.utils import TimeTable2
-        from conference.utils import timetables2ical as f
-
-        qs = cmodels.Event.objects\
-            .filter(eventinterest__user=user, eventinterest__interest__gt=0)\
-            .filter(schedule__conference=conf)\
-            .values('id', 'schedule')
-
-        events = defaultdict(list)
-        for x in qs:
-            events[x['schedule']].append(x['id'])
+        from conference.dataaccess import user_schedule_events
+        events = user_schedule_events(user, conf)
+        timetables = [ TimeTable2.fromSchedule(x, eids=events[x]) for x in sorted(events) ]
 
-        sids = sorted(events.keys())
-        timetables = [ TimeTable2.fromEvents(x, events[x]) for x in sids ]
-        cal = f(timetables, altf=altf)
-    return cal
+    # the events of the timetables, with their talks, come from the schedule
+    # snapshots (built with a single dataaccess.events call), there is no
+    # need to fetch them again.
+    events_data = {}
+    for tt in timetables:
+        for evts in tt.events.values():
+            for e in evts:
+                events_data[e['id']] = e
+    return f(timetables, altf=altf)
 
 
 # Database access helpers
@@ -393,6 +397,22 @@ def get_tickets_assigned_to(user):
     return p3models.TicketConference.objects.filter(assigned_to=user.email)
 
 
+def get_tickets_assigned_to_users(users):
+    """ Return a dict user id -> list of the tickets assigned to the user,
+    with a single query for all the users."""
+    emails = defaultdict(list)
+    for u in users:
+        emails[u.email].append(u.id)
+    tickets = p3models.TicketConference.objects\
+        .filter(assigned_to__in=emails.keys())\
+        .select_related('ticket__fare')
+    output = dict((u.id, []) for u in users)
+    for t in tickets:
+        for uid in emails[t.assigned_to]:
+            output[uid].append(t)
+    return output
+
+
 def is_ticket_assigned_to_someone_else(ticket, user):
     """ Return False if the ticket is assigned to the user, True otherwise."""
     tickets = p3models.TicketConference.objects.filter(ticket_id=ticket.id)
@@ -7,7 +7,6 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse
 from django.db import transaction
-from django.db.models import Count
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template import RequestContext, Template
 
@@ -366,12 +365,16 @@ def whos_coming(request, conference=None):
         if any(tid for tid, _, _, complete in t if complete):
             access = ('m', 'p')
 
+    # the filters work in memory on the cached index of the attendees
+    attendees = dataaccess.conference_attendees(conference)
+    people = [ p for p in attendees if p['visibility'] in access ]
+    profiles = {
+        'all': len(attendees),
+        'visible': len(people),
+    }
+
     countries = [('', 'All')] + list(amodels.Country.objects\
-        .filter(iso__in=models.P3Profile.objects\
-            .filter(profile__visibility__in=access)\
-            .exclude(country='')\
-            .values('country')
-        )\
+        .filter(iso__in=set(p['country'] for p in people if p['country']))\
         .values_list('iso', 'name')\
         .distinct()
     )
@@ -384,48 +387,22 @@ def whos_coming(request, conference=None):
             widget=cforms.ReadonlyTagWidget(),
         )
 
-    qs = cmodels.AttendeeProfile.objects\
-        .filter(visibility__in=('m', 'p'))\
-        .filter(user__in=dataaccess.conference_users(conference))\
-        .values('visibility')\
-        .annotate(total=Count('visibility'))
-    profiles = {
-        'all': sum([ row['total'] for row in qs ]),
-        'visible': 0,
-    }
-    for row in qs:
-        if row['visibility'] in access:
-            profiles['visible'] += row['total']
-
-    people = cmodels.AttendeeProfile.objects\
-        .filter(visibility__in=access)\
-        .filter(user__in=dataaccess.conference_users(conference))\
-        .values_list('user', flat=True)\
-        .order_by('user__first_name', 'user__last_name')
-
     form = FormWhosFilter(data=request.GET)
     if form.is_valid():
         data = form.cleaned_data
         if data.get('country'):
-            people = people.filter(p3_profile__country=data['country'])
+            people = [ p for p in people if p['country'] == data['country'] ]
         if data.get('tags'):
-            qs = cmodels.ConferenceTaggedItem.objects\
-                .filter(
-                    content_type__app_label='p3', content_type__model='p3profile',
-                    tag__name__in=data['tags'])\
-                .values('object_id')
-            people = people.filter(user__in=qs)
+            tags = set(data['tags'])
+            people = [ p for p in people if p['tags'] & tags ]
         if data.get('speaker'):
-            speakers = cmodels.TalkSpeaker.objects\
-                .filter(talk__conference=conference, talk__status='accepted')\
-                .values('speaker')
-            people = people.filter(user__speaker__in=speakers)
+            people = [ p for p in people if p['speaker'] ]
 
     try:
         ix = max(int(request.GET.get('counter', 0)), 0)
     except:
         ix = 0
-    pids = people[ix:ix+10]
+    pids = [ p['uid'] for p in people[ix:ix+10] ]
     ctx = {
         'profiles': profiles,
         'pids': pids,
@@ -7,8 +7,8 @@ from django.core.urlresolvers import reverse
 from django.shortcuts import render
 
 from common.decorators import render_to_json
+from conference import dataaccess as cdataaccess
 from conference import models as cmodels
-from conference.utils import TimeTable2
 from p3 import dataaccess
 
 
@@ -57,51 +57,44 @@ def live_track_events(request, track):
     # FIXME: We don't handle the case where the track does not exist
     conf, date = _live_conference()
 
-    tid = cmodels.Track.objects\
-        .get(track=track, schedule__date=date).id
-    tt = TimeTable2.fromTracks([tid])
+    index = cdataaccess.live_index(conf.code, date)
     output = []
-    for _, events in tt.iterOnTracks():
-        for e in events:
-            if e.get('talk'):
-                speakers = ', '.join([ x['name'] for x in e['talk']['speakers']])
-            else:
-                speakers = None
-            output.append({
-                'name': e['name'],
-                'time': e['time'],
-                'duration': e['duration'],
-                'tags': e['tags'],
-                'speakers': speakers,
-            })
+    if index is None:
+        return output
+    for e in index.track_events(track):
+        if e.get('talk'):
+            speakers = ', '.join([ x['name'] for x in e['talk']['speakers']])
+        else:
+            speakers = None
+        output.append({
+            'name': e['name'],
+            'time': e['time'],
+            'duration': e['duration'],
+            'tags': e['tags'],
+            'speakers': speakers,
+        })
     return output
 
 @render_to_json
 def live_events(request):
     conf, date = _live_conference()
-    sid = cmodels.Schedule.objects\
-        .values('id')\
-        .get(conference=conf.code, date=date)
-
-    tt = TimeTable2.fromSchedule(sid['id'])
-    tt.removeEventsByTag('special')
+    index = cdataaccess.live_index(conf.code, date)
+    if index is None:
+        return {}
     t0 = datetime.datetime.now().time()
 
     tracks = settings.P3_LIVE_TRACKS.keys()
     events = {}
-    for track, tevts in tt.iterOnTracks(start=('current', t0)):
-        curr = None
-        try:
-            curr = dict(tevts[0])
-            curr['next'] = dict(tevts[1])
-        except IndexError:
-            pass
-        # I've deleted all special events, t0 could be on one of them
-        if curr and (curr['time'] + datetime.timedelta(seconds=curr['duration']*60)).time() < t0:
-            curr = None
-
+    for track in index.events:
         if track not in tracks:
             continue
+        # the special events are not in the index, t0 could be on one of
+        # them and the current event could be already finished
+        curr, next = index.current(track, t0)
+        if curr is not None:
+            curr = dict(curr)
+            if next is not None:
+                curr['next'] = dict(next)
         events[track] = curr
 
     def event_url(event):
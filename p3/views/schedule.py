@@ -1,5 +1,6 @@
 # -*- coding: UTF-8 -*-
 import datetime
+import hashlib
 from collections import defaultdict
 
 from django import http
@@ -7,6 +8,7 @@ from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect
 from django.shortcuts import render
+from django.views.decorators.http import condition
 
 from conference import models as cmodels
 from conference.utils import TimeTable2
@@ -66,7 +68,7 @@ def _build_timetables(schedules, events=None, partner=None):
             tts.append((row['id'], tt))
     else:
         for row in schedules:
-            tt = TimeTable2.fromEvents(row['id'], events[row['id']])
+            tt = TimeTable2.fromSchedule(row['id'], eids=events[row['id']])
             tts.append((row['id'], tt))
 
     if partner:
@@ -81,7 +83,7 @@ def _build_timetables(schedules, events=None, partner=None):
                 except cmodels.Schedule.DoesNotExist:
                     # it would be better to be able to show it anyway
                     continue
-                tt = TimeTable2.fromEvents(sid, [])
+                tt = TimeTable2.fromSchedule(sid, eids=[])
                 tts.append((sid, tt))
             for e in evts:
                 e['schedule_id'] = sid
@@ -134,6 +136,24 @@ def schedule(request, conference):
     return render(request, 'p3/schedule.html', ctx)
 
 
+def _schedule_ics_etag(request, conference, mode='conference'):
+    from conference import dataaccess
+    parts = [ conference, mode, repr(dataaccess.schedule_version(conference)), 'abstract' in request.GET ]
+    if mode == 'my-schedule':
+        if not request.user.is_authenticated():
+            return None
+        parts.append(dataaccess.user_schedule_events(request.user.id, conference))
+    return hashlib.md5(repr(parts)).hexdigest()
+
+def _schedule_ics_last_modified(request, conference, mode='conference'):
+    # the personal schedule changes with the events chosen by the user too,
+    # only its ETag can tell if it is changed.
+    if mode == 'my-schedule':
+        return None
+    from conference import dataaccess
+    return datetime.datetime.utcfromtimestamp(dataaccess.schedule_version(conference))
+
+@condition(etag_func=_schedule_ics_etag, last_modified_func=_schedule_ics_last_modified)
 def schedule_ics(request, conference, mode='conference'):
     if mode == 'my-schedule':
         if not request.user.is_authenticated():
@@ -141,9 +161,10 @@ def schedule_ics(request, conference, mode='conference'):
         uid = request.user.id
     else:
         uid = None
+    from conference import ical
     from p3.utils import conference2ical
     cal = conference2ical(conference, user=uid, abstract='abstract' in request.GET)
-    return http.HttpResponse(list(cal.encode()), content_type='text/calendar')
+    return http.StreamingHttpResponse(ical.iterencode(cal), content_type='text/calendar')
 
 
 def schedule_list(request, conference):
@@ -165,27 +186,14 @@ def jump_to_my_schedule(request):
 
 @login_required
 def my_schedule(request, conference):
-    qs = cmodels.Event.objects\
-        .filter(eventinterest__user=request.user, eventinterest__interest__gt=0)\
-        .filter(schedule__conference=conference)\
-        .values('id', 'schedule')
-
-    events = defaultdict(list)
-    for x in qs:
-        events[x['schedule']].append(x['id'])
-
-    qs = cmodels.EventBooking.objects\
-        .filter(user=request.user, event__schedule__conference=conference)\
-        .values('event', 'event__schedule')
-    for x in qs:
-        events[x['event__schedule']].append(x['event'])
+    from conference.dataaccess import fares, schedules_data, user_schedule_events
+    events = user_schedule_events(request.user.id, conference)
 
     qs = cmodels.Ticket.objects\
         .filter(user=request.user)\
         .filter(fare__conference=conference, fare__ticket_type='partner')\
        .values_list('fare', flat=True)
 
-    from conference.dataaccess import fares, schedules_data
     pfares = [ f for f in fares(conference) if f['id'] in qs ]
     partner = _partner_as_event(pfares)
 
@@ -22,6 +22,13 @@ ENABLE_LOCMEM_CACHE = {
 
 CACHES = DISABLE_CACHING
 
+# The per-process cache of conference.dataaccess would keep caching even with
+# the dummy backend
+CONFERENCE_CACHE_LOCAL = None
+
+# hit/miss counters and queries of the cached functions in the debug panel
+CONFERENCE_CACHE_STATS = True
+
 PAYPAL_TEST = True
 
 TEMPLATES[0]['OPTIONS']['debug'] = True
@@ -55,6 +62,11 @@ DATABASES = {
    'default': {
        'ENGINE': 'django.db.backends.sqlite3',
        'NAME': '/tmp/p3.db',
+       # the tests with concurrent threads need a database shared by all the
+       # connections, an in-memory one is private (pytest-django adds the
+       # xdist worker to the name)
+       'TEST': {'NAME': '/tmp/p3_test.db'},
+       'OPTIONS': {'timeout': 30},
    }
 }
 
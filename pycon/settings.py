@@ -257,6 +257,8 @@ MIDDLEWARE_CLASSES = (
 
     'assopy.middleware.DebugInfo',
     'pycon.middleware.RisingResponse',
+    'conference.middleware.BatchScope',
+    'conference.middleware.CacheStats',
     'cms.middleware.user.CurrentUserMiddleware',
     'cms.middleware.page.CurrentPageMiddleware',
     'cms.middleware.toolbar.ToolbarMiddleware',
@@ -556,7 +558,14 @@ CONFERENCE_FORMS = {
     'EventBooking': 'p3.forms.P3EventBookingForm',
 }
 
+CONFERENCE_CACHE_LOCAL = {
+    'size': 5000,
+    'timeout': 60,
+    'sync': 1,
+}
+
 CONFERENCE_TALKS_RANKING_FILE = SITE_DATA_ROOT + '/rankings.txt'
+# the old log of the admin mailings, imported by the conference migration 0008
 CONFERENCE_ADMIN_TICKETS_STATS_EMAIL_LOG = SITE_DATA_ROOT + '/admin_ticket_emails.txt'
 CONFERENCE_ADMIN_TICKETS_STATS_EMAIL_LOAD_LIBRARY = ['p3', 'conference']
 
@@ -726,23 +735,17 @@ def CONFERENCE_VOTING_ALLOWED(user):
 
 
 def CONFERENCE_SCHEDULE_ATTENDEES(schedule, forecast):
-    from p3.stats import presence_days
+    from p3.stats import presence_by_day
     from conference.models import Schedule
 
     if not isinstance(schedule, Schedule):
+        days = presence_by_day(schedule, forecast)
         output = {}
-        for s in Schedule.objects.filter(conference=schedule):
-            output[s.id] = CONFERENCE_SCHEDULE_ATTENDEES(s, forecast)
+        for sid, date in Schedule.objects.filter(conference=schedule).values_list('id', 'date'):
+            output[sid] = days.get(date.strftime('%Y-%m-%d'), 0)
         return output
-    d = schedule.date.strftime('%Y-%m-%d')
-    s = presence_days(schedule.conference)
-    for row in s['data']:
-        if row['title'] == '%s (no staff)' % d:
-            if forecast:
-                return row['total_nc']
-            else:
-                return row['total']
-    return 0
+    days = presence_by_day(schedule.conference, forecast)
+    return days.get(schedule.date.strftime('%Y-%m-%d'), 0)
 
 
 CONFERENCE_ADMIN_ATTENDEE_STATS = (
@@ -1178,10 +1181,16 @@ def cron_cleanup():
     cmd = cleanup.Command()
     cmd.handle()
 
+def cron_send_admin_mailings():
+    from django.core.management import call_command
+
+    call_command('send_admin_mailings')
+
 
 CRONTAB_COMMAND_PREFIX = 'DATA_DIR=%s OTHER_STUFF=%s' % (DATA_DIR, OTHER_STUFF)
 CRONJOBS = [
-    ('@weekly', 'pycon.settings.cron_cleanup')
+    ('@weekly', 'pycon.settings.cron_cleanup'),
+    ('* * * * *', 'pycon.settings.cron_send_admin_mailings'),
 ]
 
 
@@ -11,6 +11,7 @@ from filebrowser.sites import site as fsite
 import p3.forms as pforms
 from conference.debug_panel import (
     debug_panel_index,
+    debug_panel_cache_stats,
     debug_panel_invoice_placeholders,
     debug_panel_invoice_force_preview,
     debug_panel_invoice_export_for_tax_report_2018,
@@ -46,6 +47,9 @@ urlpatterns = [
 
     # production debug panel, doesn't even have a name=
     url(r'^nothing-to-see-here/$', debug_panel_index),
+    url(r'^nothing-to-see-here/cache/$',
+        debug_panel_cache_stats,
+        name='debug_panel_cache_stats'),
     url(r'^nothing-to-see-here/invoices/$',
         debug_panel_invoice_placeholders,
         name='debug_panel_invoice_placeholders'),
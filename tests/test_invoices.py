@@ -7,9 +7,11 @@ from datetime import date, timedelta
 from decimal import Decimal
 import random
 import json
+from multiprocessing.pool import ThreadPool
 
+from django.db import connection, transaction
 from django.http import QueryDict
-from pytest import mark
+from pytest import mark, skip
 
 from django.core.urlresolvers import reverse
 from django.core.management import call_command
@@ -21,7 +23,7 @@ import responses
 
 from assopy.models import Country, Invoice, Order, Vat
 from assopy.tests.factories.user import UserFactory as AssopyUserFactory
-from assopy.stripe.tests.factories import FareFactory, OrderFactory
+from assopy.stripe.tests.factories import CountryFactory, FareFactory, OrderFactory
 # from common.http import PdfResponse
 from conference.models import AttendeeProfile, Ticket, Fare
 from conference import settings as conference_settings
@@ -768,3 +770,57 @@ def test_export_invoice_accounting_json(client):
     assert decimal.Decimal(data[0]['gross']) == invoice1.price
     assert data[0]['order'] == invoice1.order.code
     assert data[0]['stripe'] == invoice1.order.stripe_charge_id
+
+
+@mark.django_db
+def test_invoice_codes_continue_from_existing_invoices():
+    _prepare_invoice_for_basic_test('O2017', 'I/17.0041')
+    Invoice.objects.filter(code='I/17.0041').update(emit_date=date(2017, 6, 1))
+
+    with transaction.atomic():
+        assert invoicing.next_invoice_code_for_year('I/', 2017) == 'I/17.0042'
+        assert invoicing.next_invoice_code_for_year('F/', 2017) == 'F/17.0001'
+
+    # a rolled back allocation gives the number back
+    try:
+        with transaction.atomic():
+            assert invoicing.next_invoice_code_for_year('I/', 2017) == 'I/17.0043'
+            raise ValueError
+    except ValueError:
+        pass
+    with transaction.atomic():
+        assert invoicing.next_invoice_code_for_year('I/', 2017) == 'I/17.0043'
+
+
+@mark.django_db(transaction=True)
+def test_invoice_codes_of_concurrent_orders_are_unique_and_gap_free():
+    name = connection.settings_dict['NAME']
+    if connection.vendor == 'sqlite' and (name == ':memory:' or 'mode=memory' in name):
+        skip('the threads do not share an in-memory sqlite database')
+
+    Email.objects.create(code='purchase-complete')
+    user = make_user()
+    fare = FareFactory()
+    country = CountryFactory()
+    orders = [
+        OrderFactory(user=user.assopy_user, country=country, items=[(fare, {'qty': 1})]).id
+        for _ in range(20)
+    ]
+
+    def confirm(order_id):
+        try:
+            # 2017 invoices are in EUR, no exchange rates are needed
+            Order.objects.get(id=order_id).confirm_order(date(2017, 5, 5))
+        finally:
+            connection.close()
+
+    pool = ThreadPool(8)
+    try:
+        pool.map(confirm, orders)
+    finally:
+        pool.close()
+        pool.join()
+
+    codes = Invoice.objects.order_by('code').values_list('code', flat=True)
+    assert list(codes) == ['I/17.%04d' % x for x in range(1, 21)]
+    assert Invoice.objects.values('order').distinct().count() == 20